@@ -0,0 +1,126 @@
+""" Memory benchmark: resident bytes per tracked game.
+
+    Builds the same synthetic stats twice, once with a replica of the
+    original __dict__ based GameStats and once with the current compact
+    classes, and reports the bytes allocated per game with tracemalloc.
+    The current classes are measured as restored stats packs too, before
+    and after their launch rank index is built.
+
+    usage: python -m StatBotPackage.Benchmarks.MemoryBenchmark
+               [--members 1000] [--games 200]
+"""
+
+# Standard Library Imports
+import argparse
+import gc
+import random
+import tracemalloc
+from datetime import datetime, timedelta
+
+# Local Module imports
+from StatBotPackage.GuildMemberStats import (GameStats, MemberStatsPack,
+                                             _decode_date_cached)
+
+class DictGameStats():
+    """ The original GameStats layout: a full __dict__ per game, datetime
+        objects for the dates and a tag attribute for the JSON encoder.
+    """
+
+    def __init__(self, given_name, date_first_played, date_last_played,
+                 marked_game, times_launched, days_launched):
+        self.__GameStats__ = True
+        self.name = given_name
+        self.date_first_played = date_first_played
+        self.date_last_played = date_last_played
+        self.marked_game = marked_game
+        self.times_launched = times_launched
+        self.days_launched = days_launched
+
+
+def generate_rows(members: int, games: int, seed: int = 0):
+    """ Yield (member, name, first played, last played, times, days) rows
+        as they come out of the JSON file: fresh strings for every game.
+    """
+    rng = random.Random(seed)
+    epoch = datetime(2020, 1, 1)
+    for member in range(members):
+        for index in rng.sample(range(games * 4), games):
+            first = epoch + timedelta(seconds=rng.randrange(0, 86400 * 365))
+            last = first + timedelta(seconds=rng.randrange(0, 86400 * 365))
+            yield (member, "Game number %d" % index, str(first), str(last),
+                   rng.randrange(1, 500), rng.randrange(1, 200))
+
+
+def measure(build, members: int, games: int) -> int:
+    """ Returns the bytes still allocated once build has returned. The
+        rows are generated inside the traced region so that any strings
+        the model keeps are counted, and everything else is freed.
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = build(generate_rows(members, games))
+    # The date cache is bounded and shared, not a per game cost.
+    _decode_date_cached.cache_clear()
+    gc.collect()
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return allocated
+
+
+def build_legacy(rows):
+    decode_date = GameStats.decode_date_legacy
+    users = {}
+    for member, name, first, last, times, days in rows:
+        users.setdefault(member, {})[name] = DictGameStats(
+            name, decode_date(first), decode_date(last), False, times, days)
+    return users
+
+
+def build_compact(rows):
+    decode_date = GameStats.decode_date
+    dicts = {}
+    for member, name, first, last, times, days in rows:
+        game = GameStats(given_name=name,
+                         date_first_played=decode_date(first),
+                         date_last_played=decode_date(last),
+                         times_launched=times, days_launched=days)
+        dicts.setdefault(member, {})[game.name] = game
+    return dicts
+
+
+def build_stats_packs(rows):
+    return {member: MemberStatsPack(restored_game_list=game_dict)
+            for member, game_dict in build_compact(rows).items()}
+
+
+def build_ranked(rows):
+    users = build_stats_packs(rows)
+    # What a member costs once they launch a game: the rank index is built.
+    for user in users.values():
+        user.update_most_launched()
+    return users
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=1000)
+    parser.add_argument("--games", type=int, default=200)
+    args = parser.parse_args()
+
+    total_games = args.members * args.games
+    before = measure(build_legacy, args.members, args.games)
+    after = measure(build_compact, args.members, args.games)
+    restored = measure(build_stats_packs, args.members, args.games)
+    ranked = measure(build_ranked, args.members, args.games)
+
+    print(f"{args.members} members x {args.games} games")
+    print(f"before, __dict__ GameStats:  {before / total_games:.0f} bytes per game")
+    print(f"after, __slots__ GameStats:  {after / total_games:.0f} bytes per game")
+    print(f"after, restored stats packs: {restored / total_games:.0f} bytes per game")
+    print(f"after, rank index built:     {ranked / total_games:.0f} bytes per game")
+
+
+if __name__ == "__main__":
+    main()
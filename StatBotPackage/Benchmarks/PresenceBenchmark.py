@@ -0,0 +1,265 @@
+""" Throughput benchmark: presence events through the CoreFunctions cog.
+
+    Replays a trace of presence changes through on_member_update, the
+    presence pipeline and the guild's storage, using stand-ins for the
+    discord members and games so no gateway connection is needed. The
+    trace is generated, or read from a file written with --record.
+
+    Reports events per second, on_member_update and enqueue-to-applied
+    latencies, bytes written per event (journal and snapshots) and the
+    peak resident set size.
+
+    Trace files hold one JSON object per line:
+        {"t": <seconds from start>, "member": <id>,
+         "before": <game name or null>, "after": <game name or null>}
+
+    usage: python -m StatBotPackage.Benchmarks.PresenceBenchmark
+               [--members 1000] [--games 50] [--events 100000]
+               [--rate 0] [--trace FILE] [--record FILE]
+               [--storage json] [--coalesce-window 5]
+"""
+
+# Standard Library Imports
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows.
+    resource = None
+
+# Third party Imports
+import discord
+
+# Events submitted between two yields to the event loop, so the
+# pipeline's workers get to drain the queue.
+SUBMIT_BATCH = 100
+
+class FakeGame():
+    """ Stands in for a discord.Game. """
+    __slots__ = ("name", "type", "start")
+
+    def __init__(self, name: str, start: datetime) -> None:
+        self.name = name
+        self.type = discord.ActivityType.playing
+        self.start = start
+
+
+class FakeGuild():
+    """ Stands in for a discord.Guild, with no channels to alert in. """
+
+    def __init__(self, guild_id: int, name: str) -> None:
+        self.id = guild_id
+        self.name = name
+        self.text_channels = []
+        self.members = {}
+
+    def get_member(self, member_id: int):
+        return self.members.get(member_id)
+
+
+class FakeMember():
+    """ Stands in for a discord.Member. """
+    __slots__ = ("id", "guild", "activity", "name", "display_name",
+                 "avatar_url")
+
+    def __init__(self, member_id: int, guild: FakeGuild, activity) -> None:
+        self.id = member_id
+        self.guild = guild
+        self.activity = activity
+        self.name = self.display_name = f"Member {member_id}"
+        self.avatar_url = ""
+
+
+class FakeBot():
+    """ Stands in for the bot, as much as CoreFunctions needs. """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, guild: FakeGuild) -> None:
+        self.loop = loop
+        self.guilds = [guild]
+        self.user = None
+
+    def add_listener(self, func, name: str = None):
+        pass
+
+
+def generate_trace(members: int, games: int, events: int, rate: float,
+                   seed: int = 0):
+    """ Yields trace entries where each member starts, switches and
+        stops games from a library of their own.
+    """
+    rng = random.Random(seed)
+    game_pool = [f"Game {index}" for index in range(games * 4)]
+    libraries = [rng.sample(game_pool, games) for _ in range(members)]
+    playing = [None] * members
+    interval = 1.0 / rate if rate > 0 else 0.0
+
+    for index in range(events):
+        member = rng.randrange(members)
+        before = playing[member]
+        roll = rng.random()
+        if before is not None and roll < 0.5:
+            after = None
+        else:
+            after = rng.choice(libraries[member])
+        playing[member] = after
+        yield {"t": index * interval, "member": member,
+               "before": before, "after": after}
+
+
+def read_trace(path: str):
+    with open(path, "r", encoding="utf-8") as trace_file:
+        for line in trace_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def percentile(samples, fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def peak_rss() -> int:
+    """ Returns the peak resident set size in bytes, or 0 if unknown. """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if peak > 1 << 32 else peak * 1024
+
+
+async def replay(cog, guild: FakeGuild, trace: list, speed: float) -> dict:
+    """ Submit every event of the trace through on_member_update and wait
+        for the pipeline to apply them.
+
+        Parameters:
+            speed: How much faster than the trace's own timing to replay.
+                   0 replays as fast as possible.
+    """
+    epoch = datetime.utcnow() - timedelta(days=1)
+    # Discord reports when a game started; each trace entry gets its own.
+    submit_latencies = []
+    start = time.perf_counter()
+
+    for index, entry in enumerate(trace):
+        if speed > 0:
+            delay = entry["t"] / speed - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elif index % SUBMIT_BATCH == 0:
+            await asyncio.sleep(0)
+
+        started = epoch + timedelta(seconds=entry["t"])
+        before_game = entry["before"]
+        after_game = entry["after"]
+        member_id = entry["member"]
+        before = FakeMember(member_id, guild, None if before_game is None
+                            else FakeGame(before_game, started))
+        after = FakeMember(member_id, guild, None if after_game is None
+                           else FakeGame(after_game, started))
+        guild.members[member_id] = after
+
+        submitted = time.perf_counter()
+        await cog.on_member_update(before, after)
+        submit_latencies.append(time.perf_counter() - submitted)
+
+    while cog.pipeline.depth > 0:
+        await asyncio.sleep(0)
+    # Let the last batch finish applying.
+    await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+
+    # Write what is left, after any flush that is already running.
+    flush_start = time.perf_counter()
+    state = cog.guild_states[guild.id]
+    await state.recorder.flush_async()
+    flush_elapsed = time.perf_counter() - flush_start
+    written = state.journal.bytes_written + state.recorder.metrics.bytes_written
+
+    cog.cog_unload()
+    # Let the cancelled background tasks finish.
+    tasks = asyncio.all_tasks() - {asyncio.current_task()}
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return {"elapsed": elapsed, "flush_elapsed": flush_elapsed,
+            "written": written, "submit_latencies": submit_latencies}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=1000)
+    parser.add_argument("--games", type=int, default=50,
+                        help="games in each member's library")
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--rate", type=float, default=0,
+                        help="events per second to replay at, 0 for as "
+                             "fast as possible")
+    parser.add_argument("--trace", help="replay a recorded trace file")
+    parser.add_argument("--record", help="write the generated trace to a file")
+    parser.add_argument("--storage", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--coalesce-window", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # CoreFunctions reads its configuration when it is imported.
+        os.environ["STORAGE_BACKEND"] = args.storage
+        os.environ["JSON_FILE"] = os.path.join(directory, "stats.json")
+        os.environ["SQLITE_FILE"] = os.path.join(directory, "stats.sqlite3")
+        os.environ["PRESENCE_COALESCE_WINDOW"] = str(args.coalesce_window)
+        os.environ.setdefault("LOG_FILE", os.path.join(directory, "bot.log"))
+        from StatBotPackage.Cogs.CoreFunctions import CoreFunctions
+
+        if args.trace:
+            trace = list(read_trace(args.trace))
+        else:
+            trace = list(generate_trace(args.members, args.games,
+                                        args.events, args.rate))
+        if args.record:
+            with open(args.record, "w", encoding="utf-8") as record_file:
+                for entry in trace:
+                    record_file.write(json.dumps(entry) + "\n")
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        guild = FakeGuild(1, "Benchmark Guild")
+        cog = CoreFunctions(FakeBot(loop, guild))
+        # Keep every latency rather than the most recent ones.
+        cog.pipeline.metrics.latencies = deque()
+
+        state = cog.guild_states[guild.id]
+        for member_id in {entry["member"] for entry in trace}:
+            state.add_user(member_id)
+
+        result = loop.run_until_complete(replay(cog, guild, trace,
+                                                1.0 if args.rate > 0 else 0))
+        metrics = cog.pipeline.metrics
+        loop.close()
+
+    events = len(trace)
+    submit = result["submit_latencies"]
+    print(f"{events} events, {len({entry['member'] for entry in trace})} members, "
+          f"{args.storage} storage")
+    print(f"applied {metrics.applied}, coalesced away "
+          f"{events - metrics.enqueued - metrics.dropped}, dropped {metrics.dropped}")
+    print(f"throughput: {events / result['elapsed']:.0f} events/s "
+          f"({result['elapsed']:.2f}s, final flush {result['flush_elapsed']:.2f}s)")
+    print(f"on_member_update: p50 {percentile(submit, 0.50) * 1e6:.1f}us "
+          f"p99 {percentile(submit, 0.99) * 1e6:.1f}us")
+    print(f"enqueue to applied: p50 {percentile(metrics.latencies, 0.50) * 1e3:.2f}ms "
+          f"p99 {percentile(metrics.latencies, 0.99) * 1e3:.2f}ms")
+    print(f"bytes written: {result['written'] / max(events, 1):.1f} per event")
+    print(f"peak RSS: {peak_rss() / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+""" Startup benchmark: how long it takes to restore the stats file.
+
+    A synthetic JSON file is generated and restored twice, once with the
+    original hand rolled date parser and once with the current decoder.
+
+    usage: python -m StatBotPackage.Benchmarks.RestoreBenchmark
+               [--members 10000] [--games 200]
+"""
+
+# Standard Library Imports
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Local Module imports
+from StatBotPackage.GuildMemberStats import (GameStats, MemberStatsPack,
+                                             _decode_date_cached)
+from StatBotPackage.Storage.JsonStorage import JsonStorage
+
+def build_users(members: int, games: int, seed: int = 0) -> dict:
+    """ Returns a dictionary of user id to a filled in MemberStatsPack. """
+    rng = random.Random(seed)
+    epoch = datetime(2020, 1, 1)
+    # A pool of game names shared between members, like a real guild.
+    game_pool = [f"Game {index}" for index in range(games * 4)]
+    registered_users = {}
+
+    for user_id in range(members):
+        game_dict = {}
+        for name in rng.sample(game_pool, games):
+            first = epoch + timedelta(seconds=rng.randrange(0, 86400 * 365))
+            last = first + timedelta(seconds=rng.randrange(0, 86400 * 365))
+            game_dict[name] = GameStats(given_name=name,
+                                        date_first_played=first,
+                                        date_last_played=last,
+                                        marked_game=rng.random() < 0.05,
+                                        times_launched=rng.randrange(1, 500),
+                                        days_launched=rng.randrange(1, 200))
+        user = MemberStatsPack(restored_game_list=game_dict)
+        user.update_most_launched()
+        user.update_least_launched(givenMin=0)
+        user.last_launched_game = next(iter(game_dict.values()), None)
+        registered_users[user_id] = user
+
+    return registered_users
+
+
+def time_restore(storage: JsonStorage) -> float:
+    _decode_date_cached.cache_clear()
+    start = time.perf_counter()
+    # Decode every member, not only index them.
+    storage.load().load_all()
+    storage.close()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=10000)
+    parser.add_argument("--games", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "stats.json")
+        storage = JsonStorage(path, generations=0)
+
+        registered_users = build_users(args.members, args.games)
+        written = storage.prepare_write(registered_users,
+                                        dict.fromkeys(registered_users))()
+        del registered_users
+        print(f"{args.members} members x {args.games} games, "
+              f"{written / 1e6:.1f} MB on disk")
+
+        # Before: the original parser for every date string.
+        decode_date = GameStats.decode_date
+        GameStats.decode_date = staticmethod(GameStats.decode_date_legacy)
+        try:
+            before = time_restore(storage)
+        finally:
+            GameStats.decode_date = decode_date
+
+        after = time_restore(storage)
+
+    print(f"restore (legacy date parser): {before:.2f}s")
+    print(f"restore (fromisoformat+cache): {after:.2f}s")
+    print(f"speedup: {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
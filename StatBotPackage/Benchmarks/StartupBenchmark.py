@@ -0,0 +1,106 @@
+""" Startup benchmark: time until a guild is ready, whole document against
+    the line format.
+
+    The same synthetic members are written once as a single JSON document,
+    as files were before the line format, and once in the line format.
+    Reports the time until load() returns, the latency of the first member
+    lookup, the time to decode everyone, and the peak memory allocated
+    while decoding everyone against what the decoded members hold.
+
+    usage: python -m StatBotPackage.Benchmarks.StartupBenchmark
+               [--members 10000] [--games 200]
+"""
+
+# Standard Library Imports
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+# Local Module imports
+from StatBotPackage.Benchmarks.RestoreBenchmark import build_users
+from StatBotPackage.GuildMemberStats import MemberStatsPack, _decode_date_cached
+from StatBotPackage.Storage.JsonStorage import JOURNAL_SEQ_KEY, JsonStorage
+from StatBotPackage.Storage.SnapshotFile import write_snapshot
+
+def time_startup(storage: JsonStorage, user_id: int) -> dict:
+    """ Returns the seconds until load() returns, until one member is
+        decoded after that, and until every member is decoded.
+    """
+    _decode_date_cached.cache_clear()
+    start = time.perf_counter()
+    registered_users = storage.load()
+    ready = time.perf_counter()
+    registered_users[user_id]
+    first = time.perf_counter()
+    registered_users.load_all()
+    hydrated = time.perf_counter()
+    storage.close()
+    return {"ready": ready - start, "first": first - ready,
+            "hydrated": hydrated - start}
+
+
+def trace_memory(storage: JsonStorage) -> dict:
+    """ Returns the bytes allocated at the peak of decoding every member,
+        and the bytes still held by the decoded members afterwards.
+    """
+    _decode_date_cached.cache_clear()
+    tracemalloc.start()
+    try:
+        registered_users = storage.load()
+        registered_users.load_all()
+        storage.close()
+        final, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del registered_users
+    return {"peak": peak, "final": final}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=10000)
+    parser.add_argument("--games", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        registered_users = build_users(args.members, args.games)
+        user_id = args.members // 2
+
+        document_path = os.path.join(directory, "document.json")
+        document = dict(registered_users)
+        document[JOURNAL_SEQ_KEY] = 0
+        write_snapshot(document_path,
+                       json.dumps(document, indent=2,
+                                  default=MemberStatsPack.json_encoder).encode("utf-8"),
+                       generations=0)
+        del document
+
+        lines = JsonStorage(os.path.join(directory, "lines.json"), generations=0)
+        lines.prepare_write(registered_users, dict.fromkeys(registered_users))()
+        del registered_users
+
+        print(f"{args.members} members x {args.games} games, document "
+              f"{os.path.getsize(document_path) / 1e6:.1f} MB, lines "
+              f"{os.path.getsize(lines.path) / 1e6:.1f} MB on disk")
+
+        document = JsonStorage(document_path, generations=0)
+        before = time_startup(document, user_id)
+        before.update(trace_memory(document))
+        after = time_startup(lines, user_id)
+        after.update(trace_memory(lines))
+
+    for name, result in (("document", before), ("lines", after)):
+        print(f"{name:>8}: ready {result['ready'] * 1e3:.1f}ms, "
+              f"first member {result['first'] * 1e3:.2f}ms, "
+              f"everyone {result['hydrated']:.2f}s, "
+              f"peak {result['peak'] / 1e6:.1f} MB for "
+              f"{result['final'] / 1e6:.1f} MB decoded")
+    print(f"time to ready: {before['ready'] / after['ready']:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
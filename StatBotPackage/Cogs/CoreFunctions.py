@@ -1,8 +1,8 @@
 #Standard Library Imports 
 from datetime import datetime
+from functools import partial
 import os
 import logging
-import json
 import sys
 import time
 
@@ -13,62 +13,418 @@ from dotenv import load_dotenv
 
 # Local Module imports
 sys.path.append('../')
+from StatBotPackage.GameListing import GameListing, LISTING_ORDERS
 from StatBotPackage.GuildMemberStats import GameStats, MemberStatsPack
-from StatBotPackage.UserErrorTimer import UserTimer
+from StatBotPackage.GuildState import GuildState, adopt_legacy_files, shard_path
+from StatBotPackage.Metrics import MetricsServer, metrics_for
+from StatBotPackage.PresencePipeline import AlertSender, PresenceEvent, PresencePipeline
+from StatBotPackage.Playtime import format_duration
+from StatBotPackage.ReactionPaginator import paginator_for
+from StatBotPackage.RenderCache import RenderCache
+from StatBotPackage.RateLimiter import RatePolicy, RateLimiter, parse_policies
+from StatBotPackage.Storage.JsonStorage import JsonStorage
+from StatBotPackage.Storage.SqliteStorage import SqliteStorage, migrate_json_to_sqlite
 
 # Loading environment...
+# DISCORD_GUILD names the guild that owns stats files written before
+# the bot kept a separate shard per guild.
 load_dotenv()
 TOKEN     = os.getenv("DISCORD_TOKEN")
 GUILD     = os.getenv("DISCORD_GUILD")
 JSON_FILE = os.getenv("JSON_FILE")
 ERR_FILE  = os.getenv("LOG_FILE")
 
+# Write-behind tuning: seconds between flushes, and the number of dirty
+# members that forces an early flush.
+FLUSH_INTERVAL  = float(os.getenv("FLUSH_INTERVAL", "30"))
+FLUSH_THRESHOLD = int(os.getenv("FLUSH_THRESHOLD", "50"))
+# How many older copies of the JSON file to keep to recover from a bad write.
+SNAPSHOT_GENERATIONS = int(os.getenv("SNAPSHOT_GENERATIONS", "3"))
+# Either "json" (the default) or "sqlite".
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").lower()
+SQLITE_FILE     = os.getenv("SQLITE_FILE")
+# Append-only log of stat changes. Defaults to a file next to the storage.
+JOURNAL_FILE    = os.getenv("JOURNAL_FILE")
+# Directory for the per guild launch history. Defaults to next to the storage.
+HISTORY_DIR     = os.getenv("HISTORY_DIR")
+# Rate limits as name=count/seconds: "default" covers every command
+# without its own entry, and "invalid" covers unknown commands.
+COMMAND_RATE_LIMITS = os.getenv("COMMAND_RATE_LIMITS", "default=5/10,invalid=3/10")
+# The most rate limit buckets kept, one per user and command.
+RATE_LIMIT_ENTRIES = int(os.getenv("RATE_LIMIT_ENTRIES", "10000"))
+# Timezone guilds count days in until an admin sets one, e.g. Europe/Berlin.
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE")
+# Fold the journal into a new snapshot once it grows past this many bytes.
+JOURNAL_COMPACT_BYTES = int(os.getenv("JOURNAL_COMPACT_BYTES", "1048576"))
+# Presence events waiting to be applied before new ones are dropped.
+PRESENCE_QUEUE_SIZE = int(os.getenv("PRESENCE_QUEUE_SIZE", "10000"))
+# The most marked game alerts sent per second.
+ALERT_RATE = float(os.getenv("ALERT_RATE", "1"))
+# Seconds within which repeated or flapping presence events are coalesced.
+PRESENCE_COALESCE_WINDOW = float(os.getenv("PRESENCE_COALESCE_WINDOW", "5"))
+# The most rendered !stats results kept.
+STATS_CACHE_ENTRIES = int(os.getenv("STATS_CACHE_ENTRIES", "1024"))
+# Port of the local HTTP endpoint serving metrics at /metrics, 0 for none.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
 # Setting up logging...
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
-# For the file handler below, we can use append('a') to keep over many sessions. 
-file_handler = logging.FileHandler(filename=ERR_FILE, encoding='utf-8', mode='w')
+# Append so the log, and the diagnostics in it, is kept over many sessions.
+file_handler = logging.FileHandler(filename=ERR_FILE, encoding='utf-8', mode='a')
 formatter = logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s')
 file_handler.setFormatter(formatter)
 logger.addHandler(file_handler)
 
+# The rate limit policy for unknown commands.
+INVALID_COMMAND_POLICY = "invalid"
+
+# Games listed per page by !getlist and !markedgames, and the seconds
+# the list can be paged through after the last button press.
+GAMES_PER_PAGE = 20
+LIST_TIMEOUT = 60.0
+# Game names longer than this are cut short in lists.
+LIST_NAME_LENGTH = 45
+
+# The presence pipeline's counters exported as presence event outcomes.
+PRESENCE_OUTCOMES = ("enqueued", "applied", "dropped", "failed",
+                     "unchanged", "deduplicated", "collapsed")
+# Upper bounds of the flush size histogram, in bytes.
+FLUSH_BYTES_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+def shorten(name: str) -> str:
+    if len(name) <= LIST_NAME_LENGTH:
+        return name
+    return name[:LIST_NAME_LENGTH - 1] + "…"
+
+class CommandThrottled(commands.CheckFailure):
+    """ Raised by the global check when a user is over a command's
+        rate limit.
+
+        Attributes:
+            name:        The command's name.
+            retry_after: Seconds until the command may be used again.
+    """
+    def __init__(self, name: str, retry_after: float) -> None:
+        super().__init__(f"{name} is rate limited for {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
 class CoreFunctions(commands.Cog):
 
     def __init__(self, bot, hex_color_code=0x65B460):
         self.bot = bot
         self.hex_color_code=hex_color_code
-        self.registered_users = {}
-        self.error_dictionary = {}
+
+        # Every command, and invalid commands, are rate limited per user.
+        policies = parse_policies(COMMAND_RATE_LIMITS)
+        self.rate_limiter = RateLimiter(policies.pop("default", RatePolicy(5, 10)),
+                                        policies,
+                                        max_entries=RATE_LIMIT_ENTRIES)
+
+        # Rendered !stats fields, by stats pack version.
+        self.stats_cache = RenderCache(STATS_CACHE_ENTRIES)
+
+        # Long game lists are paged through with reaction buttons.
+        self.paginator = paginator_for(bot)
 
         # NOTE: Each cog is shared by one bot in Discord.py
         # Therfore, this variable is in a sense "global."
-        # Load data structures with json file data, if the data is available
+        # Each guild gets its own state and persistence shard.
+        # Key: Guild id; Value: GuildState
+        self.guild_states = {}
+
+        # Presence updates are queued and applied in batches, and alerts
+        # go out through their own rate limited sender. With profiling on,
+        # applying an event is timed like the handlers are.
+        apply_presence = self.apply_presence
+        profiler = getattr(bot, "profiler", None)
+        if profiler is not None:
+            apply_presence = profiler.wrap(apply_presence,
+                                           "CoreFunctions.apply_presence")
+        self.pipeline = PresencePipeline(apply_presence,
+                                         maxsize=PRESENCE_QUEUE_SIZE,
+                                         coalesce_window=PRESENCE_COALESCE_WINDOW)
+        self.alert_sender = AlertSender(rate=ALERT_RATE)
+
+        # Counters and histograms, served on METRICS_PORT and by !botstats.
+        self.metrics = metrics_for(bot)
+        self.register_metrics()
+        self.metrics_server = None
+        if METRICS_PORT:
+            self.metrics_server = MetricsServer(self.metrics, METRICS_HOST,
+                                                METRICS_PORT)
+
+        # Extensions are loaded once the bot is ready, so the guilds are known.
+        for guild in self.bot.guilds:
+            self.open_guild_state(guild)
+
+        self.pipeline.start(self.bot.loop)
+        self.alert_sender.start(self.bot.loop)
+        if self.metrics_server is not None:
+            self.bot.loop.create_task(self.start_metrics_server())
+
+    async def start_metrics_server(self):
         try:
-            if (os.stat(JSON_FILE).st_size == 0) is not True:
-                self.restore_from_json()
-        except OSError: 
-            logger.error("Failed to find the JSON file that was requested.")
-
-    def record_to_json(self):
-        logger.debug("Attempting to record to JSON")
-        with open(JSON_FILE, "w") as json_file:
-            json.dump(self.registered_users, json_file, indent=2,
-                      default=MemberStatsPack.json_encoder)
-
-    def restore_from_json(self):
-        """ Function used to restore the internal data structures used
-            by the stats bot.
+            await self.metrics_server.start()
+        except OSError as error:
+            logger.error(f"Could not serve metrics on port {METRICS_PORT}: {error}")
+
+    def register_metrics(self):
+        """ Helper function adding the cog's metrics to the bot's registry.
+            The histograms are fed as things happen. Everything else is
+            read from the components' own counters when it is scraped, so
+            it costs the hot paths nothing.
         """
-        logger.debug("Attempting to restore from JSON")
-        registered_users_temp = {}
+        metrics = self.metrics
+        self.submit_seconds = metrics.histogram(
+            "statsbot_presence_submit_seconds",
+            "Seconds on_member_update takes to capture a presence change.")
+        self.apply_seconds = metrics.histogram(
+            "statsbot_presence_apply_seconds",
+            "Seconds taken to apply a presence change, by branch.",
+            labels=("branch",))
+        self.command_seconds = metrics.histogram(
+            "statsbot_command_seconds",
+            "Seconds from a command's checks until it is done, by outcome.",
+            labels=("command", "outcome"))
+        self.flush_seconds = metrics.histogram(
+            "statsbot_flush_seconds",
+            "Seconds taken to write a guild's changed stats to storage.",
+            labels=("guild",))
+        self.flush_bytes = metrics.histogram(
+            "statsbot_flush_bytes", "Bytes written to storage per flush.",
+            labels=("guild",), buckets=FLUSH_BYTES_BUCKETS)
 
-        with open(JSON_FILE, "r") as json_file:
-            registered_users_temp = json.load(json_file)
-        
-        for entry in registered_users_temp:
-            self.registered_users[int(entry)] = None 
-            current_entry = registered_users_temp[entry]
-            self.registered_users[int(entry)] = MemberStatsPack.json_decoder(current_entry)
+        pipeline = self.pipeline
+        metrics.collect("statsbot_presence_events_total",
+                        "Presence events, by what became of them.", "counter",
+                        lambda: {(outcome,): getattr(pipeline.metrics, outcome)
+                                 for outcome in PRESENCE_OUTCOMES},
+                        labels=("outcome",))
+        metrics.collect("statsbot_presence_queue_depth",
+                        "Presence events waiting to be applied.", "gauge",
+                        lambda: pipeline.depth)
+
+        alert_sender = self.alert_sender
+        metrics.collect("statsbot_alerts_total",
+                        "Marked game alerts, by what became of them.", "counter",
+                        lambda: {("sent",): alert_sender.sent,
+                                 ("dropped",): alert_sender.dropped,
+                                 ("failed",): alert_sender.failed},
+                        labels=("outcome",))
+
+        rate_limiter = self.rate_limiter
+        metrics.collect("statsbot_rate_limit_checks_total",
+                        "Commands checked against the rate limits, by outcome.",
+                        "counter",
+                        lambda: {("allowed",): rate_limiter.allowed,
+                                 ("throttled",): rate_limiter.throttled},
+                        labels=("outcome",))
+        metrics.collect("statsbot_rate_limited_total",
+                        "Commands refused by the rate limits, by policy.",
+                        "counter",
+                        lambda: {(name,): count for name, count
+                                 in rate_limiter.throttled_by_name.items()},
+                        labels=("policy",))
+
+        stats_cache = self.stats_cache
+        metrics.collect("statsbot_stats_cache_lookups_total",
+                        "Lookups of rendered !stats fields, by outcome.",
+                        "counter",
+                        lambda: {("hit",): stats_cache.hits,
+                                 ("miss",): stats_cache.misses},
+                        labels=("outcome",))
+        metrics.collect("statsbot_stats_cache_entries",
+                        "Rendered !stats fields kept.", "gauge",
+                        lambda: len(stats_cache))
+
+        paginator = self.paginator
+        metrics.collect("statsbot_paginator_sessions",
+                        "Paginated messages that can be paged through.", "gauge",
+                        lambda: paginator.as_dict()["sessions"])
+        metrics.collect("statsbot_paginator_sessions_total",
+                        "Paginated messages, by opened or expired.", "counter",
+                        lambda: {("opened",): paginator.opened,
+                                 ("expired",): paginator.expired},
+                        labels=("event",))
+
+        metrics.collect("statsbot_registered_members",
+                        "Members registered, by guild.", "gauge",
+                        lambda: self.per_guild(lambda state:
+                                               len(state.registered_users)),
+                        labels=("guild",))
+        metrics.collect("statsbot_dirty_members",
+                        "Members waiting to be written, by guild.", "gauge",
+                        lambda: self.per_guild(lambda state:
+                                               state.recorder.dirty_count),
+                        labels=("guild",))
+        metrics.collect("statsbot_flush_failures_total",
+                        "Flushes that raised, by guild.", "counter",
+                        lambda: self.per_guild(lambda state:
+                                               state.recorder.metrics.failed_flushes),
+                        labels=("guild",))
+        metrics.collect("statsbot_journal_bytes_total",
+                        "Bytes appended to the event journal, by guild.",
+                        "counter",
+                        lambda: self.per_guild(lambda state:
+                                               state.journal.bytes_written
+                                               if state.journal else None),
+                        labels=("guild",))
+
+    def per_guild(self, read) -> dict:
+        """ Helper function returning read(state) for every guild's state,
+            keyed by the guild id as a metric label.
+        """
+        return {(str(guild_id),): read(state)
+                for guild_id, state in self.guild_states.items()}
+
+    def observe_flush(self, guild_label: str, written: int, elapsed: float):
+        self.flush_seconds.observe(elapsed, (guild_label,))
+        self.flush_bytes.observe(written, (guild_label,))
+
+    def observe_command(self, ctx, outcome: str):
+        started = getattr(ctx, "command_started", None)
+        if started is not None and ctx.command is not None:
+            self.command_seconds.observe(time.perf_counter() - started,
+                                         (ctx.command.qualified_name, outcome))
+
+    def cog_unload(self):
+        # Apply what is still queued, then do a final flush so nothing
+        # marked dirty is lost on shutdown.
+        self.pipeline.stop()
+        self.alert_sender.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        for state in self.guild_states.values():
+            state.close()
+        self.guild_states = {}
+        logger.info(f"Stats cache: {self.stats_cache.as_dict()}")
+
+    @staticmethod
+    def open_storage(guild: discord.Guild):
+        """ Helper function to build the guild's shard of the storage
+            backend named by the STORAGE_BACKEND environment variable.
+
+            Files written before the bot kept a shard per guild belong
+            to the DISCORD_GUILD guild, and are moved to its shard.
+            The first time the SQLite backend is used, the existing JSON
+            file is migrated into it.
+        """
+        json_path = shard_path(JSON_FILE, guild.id) if JSON_FILE else None
+        if guild.name == GUILD and JSON_FILE is not None:
+            generations = [f".{index}" for index in range(1, SNAPSHOT_GENERATIONS + 1)]
+            adopt_legacy_files(JSON_FILE, json_path, ["", ".journal"] + generations)
+
+        if STORAGE_BACKEND == "sqlite":
+            sqlite_path = shard_path(SQLITE_FILE, guild.id)
+            if guild.name == GUILD:
+                adopt_legacy_files(SQLITE_FILE, sqlite_path,
+                                   ["", "-wal", "-shm", ".journal"])
+            storage = SqliteStorage(sqlite_path)
+            if json_path is not None and not storage.json_migrated():
+                # With JOURNAL_FILE set both storages share the journal.
+                json_journal = None if JOURNAL_FILE else json_path + ".journal"
+                migrate_json_to_sqlite(json_path, storage,
+                                       generations=SNAPSHOT_GENERATIONS,
+                                       json_journal=json_journal,
+                                       sqlite_journal=sqlite_path + ".journal")
+            return storage
+        return JsonStorage(json_path, generations=SNAPSHOT_GENERATIONS)
+
+    @staticmethod
+    def journal_path(guild: discord.Guild) -> str:
+        if JOURNAL_FILE is not None:
+            path = shard_path(JOURNAL_FILE, guild.id)
+            if guild.name == GUILD:
+                adopt_legacy_files(JOURNAL_FILE, path, [""])
+            return path
+        if STORAGE_BACKEND == "sqlite":
+            return shard_path(SQLITE_FILE, guild.id) + ".journal"
+        return shard_path(JSON_FILE, guild.id) + ".journal"
+
+    @staticmethod
+    def history_path(guild: discord.Guild) -> str:
+        if HISTORY_DIR is not None:
+            return os.path.join(HISTORY_DIR, str(guild.id))
+        if STORAGE_BACKEND == "sqlite":
+            return shard_path(SQLITE_FILE, guild.id) + ".history"
+        return shard_path(JSON_FILE, guild.id) + ".history"
+
+    @staticmethod
+    def settings_path(guild: discord.Guild) -> str:
+        if STORAGE_BACKEND == "sqlite":
+            return shard_path(SQLITE_FILE, guild.id) + ".settings"
+        return shard_path(JSON_FILE, guild.id) + ".settings"
+
+    def open_guild_state(self, guild: discord.Guild) -> GuildState:
+        """ Helper function to load a guild's state from its shard and
+            start its background writer.
+        """
+        state = self.guild_states.get(guild.id)
+        if state is not None:
+            return state
+
+        state = GuildState(guild.id, self.open_storage(guild),
+                           self.journal_path(guild),
+                           self.history_path(guild),
+                           self.settings_path(guild),
+                           flush_interval=FLUSH_INTERVAL,
+                           flush_threshold=FLUSH_THRESHOLD,
+                           journal_compact_bytes=JOURNAL_COMPACT_BYTES,
+                           default_timezone=DEFAULT_TIMEZONE)
+        state.load(self.deterministic_gameupdate)
+        state.resume_sessions(guild)
+        state.refresh_alert_channel(guild)
+        state.recorder.on_flush = partial(self.observe_flush, str(guild.id))
+        state.start(self.bot.loop)
+        self.guild_states[guild.id] = state
+        return state
+
+    def guild_state(self, guild: discord.Guild) -> GuildState:
+        """ Helper function returning the state of a guild, or None
+            outside of a guild e.g. in direct messages.
+        """
+        if guild is None:
+            return None
+        state = self.guild_states.get(guild.id)
+        if state is None:
+            state = self.open_guild_state(guild)
+        return state
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # on_ready fires again after a reconnect; the guilds may have changed.
+        for guild in self.bot.guilds:
+            self.guild_state(guild).refresh_alert_channel(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: discord.Guild):
+        self.open_guild_state(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        state = self.guild_states.pop(guild.id, None)
+        if state is not None:
+            state.close()
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel):
+        self.refresh_channels(channel.guild)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        self.refresh_channels(channel.guild)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before, after):
+        self.refresh_channels(after.guild)
+
+    def refresh_channels(self, guild: discord.Guild):
+        state = self.guild_states.get(guild.id)
+        if state is not None:
+            state.refresh_alert_channel(guild)
 
     def is_user_registered(self, member=None) -> bool:
         """ Helper function:
@@ -77,67 +433,121 @@ class CoreFunctions(commands.Cog):
             The function works with just a discord member passed in
         """
         if member is not None:
-            if member.id in self.registered_users:
+            # Users outside of a guild, e.g. in direct messages, have no state.
+            state = self.guild_states.get(getattr(getattr(member, "guild", None), "id", None))
+            if state is not None and member.id in state.registered_users:
                 return True
             else: 
                 return False
 
     @commands.Cog.listener()
     async def on_member_update(self, before: discord.Member, after: discord.Member):
-        guild = discord.utils.get(self.bot.guilds, name=GUILD)
+        # Only capture the change here. The pipeline applies it in the
+        # background so that the gateway is never held up.
+        started = time.perf_counter()
         if self.is_user_registered(member=before):
-            logger.debug("The user has updated their status")
-            current_user = self.registered_users[before.id]
-            if (before.activity == None and (after.activity is not None 
-                and after.activity.type == discord.ActivityType.playing)):
-                    # Case 1: The user has started playing a game.
-                    self.deterministic_gameupdate(current_user, after.activity,
-                                                  start_date=after.activity.start)
-                    if(current_user.is_game_marked(after.activity.name)):
-                        # The 0th index is the first text channel found,
-                        # but this can be sent to general chat etc. 
-                        embed_msg = self.playing_marked_game(after.activity, before)
-                        await guild.text_channels[0].send(embed=embed_msg)
-                    self.record_to_json()
-            else: # Case 2: The user stopped playing a game and is doing something else.
-                  # The next activity could be a game!
-                if((before.activity is not None and 
-                    before.activity.type == discord.ActivityType.playing) and 
-                    (after.activity is None 
-                    or after.activity.type == discord.ActivityType.playing)):
-                    # Regardless of what the user is doing now, they were playing
-                    # a game before, and so this should be updated. 
-                    # NOTE: Due to limitations in discord py, the end time for 
-                    # activities is inconsistient, so we merely take the utc now time
-                    # which is equivalent.
-                    self.deterministic_gameupdate(current_user, before.activity, 
-                                            end_date=datetime.utcnow())
-                    self.record_to_json()
-                    if(after.activity is not None and after.activity.type
-                        == discord.ActivityType.playing):
-                        # Determine if user is playing a new game or an old one.
-                        self.deterministic_gameupdate(current_user, after.activity,
-                                                      start_date=after.activity.start)
-
-                        if(current_user.is_game_marked(after.activity.name)):
-                            embed_msg = self.playing_marked_game(after.activity, before)
-                            await guild.text_channels[0].send(embed=embed_msg)
-
-                        self.record_to_json()
-                    else:
-                        # Since we know the user is not playing a game, the activity
-                        # they have transtioned to is of no interest to us. 
-                        pass
+            self.pipeline.submit(before, after)
+        self.submit_seconds.observe(time.perf_counter() - started)
+
+    def apply_presence(self, event: PresenceEvent):
+        """ Apply a presence change queued by on_member_update to the
+            user's stats. Called by the presence pipeline's workers.
+        """
+        state = self.guild_states.get(event.member.guild.id)
+        current_user = state.registered_users.get(event.user_id) if state else None
+        if current_user is None:
+            # The user deregistered (or the bot left the guild)
+            # while the event was queued.
+            return
+
+        started = time.perf_counter()
+        branch = "other"
+        logger.debug("The user has updated their status")
+        before_activity = event.before_activity
+        after_activity = event.after_activity
+        if (before_activity == None and (after_activity is not None 
+            and after_activity.type == discord.ActivityType.playing)):
+                # Case 1: The user has started playing a game.
+                branch = "start"
+                self.start_game(state, current_user, after_activity, event)
+        else: # Case 2: The user stopped playing a game and is doing something else.
+              # The next activity could be a game!
+            if((before_activity is not None and 
+                before_activity.type == discord.ActivityType.playing) and 
+                (after_activity is None 
+                or after_activity.type == discord.ActivityType.playing)):
+                # Regardless of what the user is doing now, they were playing
+                # a game before, and so this should be updated. 
+                # NOTE: Due to limitations in discord py, the end time for 
+                # activities is inconsistient, so we merely take the utc time
+                # the event arrived at, which is equivalent.
+                end_date = event.received_at
+                self.deterministic_gameupdate(current_user, before_activity, 
+                                        end_date=end_date)
+                state.record_event("end", event.user_id, before_activity,
+                                  timestamp=end_date)
+                state.update_session("end", event.user_id, before_activity.name,
+                                     end_date)
+                if(after_activity is not None and after_activity.type
+                    == discord.ActivityType.playing):
+                    # Determine if user is playing a new game or an old one.
+                    branch = "switch"
+                    self.start_game(state, current_user, after_activity, event)
+                else:
+                    # Since we know the user is not playing a game, the activity
+                    # they have transtioned to is of no interest to us. 
+                    branch = "stop"
+        self.apply_seconds.observe(time.perf_counter() - started, (branch,))
+
+    def start_game(self, state: GuildState, current_user: MemberStatsPack,
+                   game: discord.Game, event: PresenceEvent):
+        """ Helper function for apply_presence to record a game being
+            started and open its session.
+
+            A game restarted moments after it stopped (see
+            PresenceCoalescer) continues the session that stopped,
+            and is neither a new launch nor alerted again.
+        """
+        if event.resumed:
+            state.record_event("resume", event.user_id, game,
+                               timestamp=event.received_at)
+            state.update_session("resume", event.user_id, game.name,
+                                 event.received_at)
+            return
+
+        self.deterministic_gameupdate(current_user, game, start_date=game.start)
+        state.record_event("start", event.user_id, game)
+        state.update_session("start", event.user_id, game.name,
+                             game.start or event.received_at)
+
+        if(current_user.is_game_marked(game.name)):
+            self.send_marked_alert(state, game, event.member)
+
+    def send_marked_alert(self, state: GuildState, game_obj: discord.Game,
+                          member_ref: discord.Member):
+        """ Helper function to queue the marked game alert in the
+            member's guild. The alert sender delivers it at a limited rate.
+        """
+        # The alert channel is cached on the guild's state and refreshed
+        # when the guild's channels change.
+        if state.alert_channel is None:
+            return
+        embed_msg = self.playing_marked_game(game_obj, member_ref)
+        self.alert_sender.send(state.alert_channel, embed_msg)
 
     def deterministic_gameupdate(self,
                                  user: MemberStatsPack, 
                                  discord_game_obj: discord.Game,
                                  start_date: datetime = None,
-                                 end_date: datetime = None):
+                                 end_date: datetime = None,
+                                 game_start: datetime = None):
         """ Helper function to update the game stats of discord game 
             object that was passed in from on_member_update.
             Updates the game depending if the user has previously
             played it or not.
+
+            A brand new game is dated with game_start, which defaults to
+            the start time discord reported for the game.
         """
         if user.previously_played(discord_game_obj.name):
             if start_date is not None:
@@ -150,7 +560,9 @@ class CoreFunctions(commands.Cog):
                 pass
         else:
             logger.debug("brand new game was hit")
-            user.init_game_stats(discord_game_obj, discord_game_obj.start)
+            if game_start is None:
+                game_start = discord_game_obj.start
+            user.init_game_stats(discord_game_obj, game_start)
 
 
     def playing_marked_game(self,game_obj: discord.Game, 
@@ -170,69 +582,92 @@ class CoreFunctions(commands.Cog):
         
         return embed_msg
 
-    @commands.command(name="getlist",
-                      description= "Returns a list of games "
-                                   "that have been launched.",
-                      help="use !getlist to display a list of "
-                           "previously played games.")
-    async def get_list(self,ctx):
-        if ctx.author.id in self.registered_users:
-            user_data = self.registered_users[ctx.author.id]
-            game_str = ""
-            newline_hit = 0
-
-            if len(user_data.game_dict) == 0:
-                game_str = "No games recorded just yet!"
-
-            for game in user_data.game_dict:
-                game_entry = user_data.game_dict[game]
-                if newline_hit == 4:
-                    game_str += '\n'
-                    newline_hit = 0
-                game_str += "✳️ " + (str(game_entry.name)) + " "
-                newline_hit += 1
+    def game_listing(self, member: discord.Member, title: str,
+                     descript: str, games: dict, order: str,
+                     empty_text: str, ranked=None) -> GameListing:
+        """ Returns the pages listing games, GAMES_PER_PAGE per page,
+            rendered as they are turned to.
+        """
+        def render_page(page_games: list, page_number: int,
+                        total_pages: int) -> discord.Embed:
+            # Four games to a line, with long names cut short so that a
+            # full page fits in one field.
+            lines = [" ".join("✳️ " + shorten(game.name)
+                              for game in page_games[line:line + 4])
+                     for line in range(0, len(page_games), 4)]
+            game_str = "\n".join(lines) or empty_text
 
             # Getting embed ready.
-            embed_msg = discord.Embed(title=ctx.author.name + "'s" + " Games List", 
-                                    description=("The names of the games "
-                                    "you've played are below."),
-                                    color=self.hex_color_code)
-            embed_msg.set_thumbnail(url = ctx.author.avatar_url)
+            embed_msg = discord.Embed(title=title, description=descript,
+                                      color=self.hex_color_code)
+            embed_msg.set_thumbnail(url = member.avatar_url)
             embed_msg.add_field(name="Listing", value=game_str)
-            await ctx.send(embed=embed_msg)
+            if total_pages > 1:
+                embed_msg.set_footer(text="Page No. " + str(page_number) + "/"
+                                     + str(total_pages) + " - by " + order)
+            return embed_msg
+
+        return GameListing(games, order, render_page,
+                           per_page=GAMES_PER_PAGE, ranked=ranked)
+
+    async def send_listing_order_error(self, ctx, order: str):
+        embed_msg = discord.Embed(title="Error!",
+                                description=("Can not sort games by " + order
+                                             + ". Sort by one of: "
+                                             + ", ".join(LISTING_ORDERS)),
+                                color=self.hex_color_code)
+        embed_msg.set_thumbnail(url = self.bot.user.avatar_url)
+        await ctx.send(embed=embed_msg)
+
+    @commands.command(name="getlist",
+                      description= "Returns a list of games "
+                                   "that have been launched.",
+                      help="use !getlist [name|most|recent] to display a "
+                           "list of previously played games, sorted by name "
+                           "unless told otherwise.")
+    @commands.guild_only()
+    async def get_list(self,ctx, order: str = "name"):
+        state = self.guild_state(ctx.guild)
+        if ctx.author.id in state.registered_users:
+            if order not in LISTING_ORDERS:
+                await self.send_listing_order_error(ctx, order)
+                return
+            user_data = state.registered_users[ctx.author.id]
+            pages = self.game_listing(ctx.author,
+                                      ctx.author.name + "'s" + " Games List",
+                                      ("The names of the games "
+                                       "you've played are below."),
+                                      user_data.game_dict, order,
+                                      "No games recorded just yet!",
+                                      ranked=user_data.top_launched)
+            await self.paginator.paginate(ctx, ctx.author.id, pages,
+                                          timeout=LIST_TIMEOUT)
 
     @commands.command(name="markedgames", 
                       description= "Returns a list of games you "
                                    "have marked for yourself.",
-                      help="Call with @ or !markedgames to retrieve your list.")
-    async def get_marked_list(self,ctx):
-        if ctx.author.id in self.registered_users:
-            user_data = self.registered_users[ctx.author.id]
-            game_str = ""
-
+                      help="Call with @ or !markedgames [name|most|recent] "
+                           "to retrieve your list.")
+    @commands.guild_only()
+    async def get_marked_list(self,ctx, order: str = "name"):
+        state = self.guild_state(ctx.guild)
+        if ctx.author.id in state.registered_users:
+            if order not in LISTING_ORDERS:
+                await self.send_listing_order_error(ctx, order)
+                return
+            user_data = state.registered_users[ctx.author.id]
             if len(user_data.game_dict) == 0:
-                game_str = "No games recorded just yet!"
-
-            newline_hit = 0
-
-            for game in user_data.game_dict:
-                game_entry = user_data.game_dict[game]
-                if newline_hit == 4:
-                    game_str += '\n'
-                    newline_hit = 0
-                if game_entry.marked_game:
-                    game_str += "✳️ " + (str(game_entry.name)) + " "
-                    newline_hit += 1
+                empty_text = "No games recorded just yet!"
+            else:
+                empty_text = "No games marked just yet!"
 
-            # Getting embed ready.
             msg_title = ctx.author.name + "'s" + " Marked Games List"
             descript = "The names of the games you've marked are below."
-            embed_msg = discord.Embed(title=msg_title, 
-                                    description=descript,
-                                    color=self.hex_color_code)
-            embed_msg.set_thumbnail(url = ctx.author.avatar_url)
-            embed_msg.add_field(name="Listing", value=game_str)
-            await ctx.send(embed=embed_msg)
+            pages = self.game_listing(ctx.author, msg_title, descript,
+                                      user_data.marked_games, order,
+                                      empty_text)
+            await self.paginator.paginate(ctx, ctx.author.id, pages,
+                                          timeout=LIST_TIMEOUT)
 
     @commands.command(name="mark",
                       description = "Allows you to \"mark\" a game. So, that "
@@ -243,18 +678,20 @@ class CoreFunctions(commands.Cog):
                            "usage: !mark <\"name of game\">\n"
                            "Enter the name exaclty as it appears in your "
                            "game list, but with quotes.")
+    @commands.guild_only()
     async def mark(self, ctx, arg:str):
         logger.info("The game name passed in: " + arg)
-        if ctx.author.id in self.registered_users:
-            user = self.registered_users[ctx.author.id]
+        state = self.guild_state(ctx.guild)
+        if ctx.author.id in state.registered_users:
+            user = state.registered_users[ctx.author.id]
             logger.info("user was registered")
             logger.info("the users game_dict length is " + str(len(user.game_dict)))
             if len(user.game_dict) > 0:
                 logger.info("user's game list is not empty")
                 logger.info("The cond result " + str(arg in user.game_dict))
                 if arg in user.game_dict:
-                    user.game_dict[arg].mark_game(True)
-                    self.record_to_json()
+                    user.set_marked(arg, True)
+                    state.record_event("mark", ctx.author.id, user.game_dict[arg])
                 else:
                     descript_msg = ("The game you attempted to mark is not in "
                                 "your games list If you just started playing, "
@@ -271,13 +708,15 @@ class CoreFunctions(commands.Cog):
                                     "previously marked",
                       help="unmark a previously marked game. If a game "
                            "was already unmarked will do nothing.")
+    @commands.guild_only()
     async def unmark(self,ctx, arg):
-        if ctx.author.id in self.registered_users:
-            user = self.registered_users[ctx.author.id]
+        state = self.guild_state(ctx.guild)
+        if ctx.author.id in state.registered_users:
+            user = state.registered_users[ctx.author.id]
             if len(user.game_dict) > 0: 
                 if arg in user.game_dict and user.game_dict[arg].marked_game:
-                    user.game_dict[arg].mark_game(False)
-                    self.record_to_json()
+                    user.set_marked(arg, False)
+                    state.record_event("unmark", ctx.author.id, user.game_dict[arg])
                 else:
                     embed_descript = ("The game you attempted to mark is not in "
                                     "your games list! If you just started playing, "
@@ -293,6 +732,7 @@ class CoreFunctions(commands.Cog):
                       description="Regsiter your self with the launched bot.",
                       help="Call to have the Launched bot to begin recording "
                             "statistics")
+    @commands.guild_only()
     async def register_user(self, ctx):
         """Function that allows a user to register themsevles with the 
         games launched bot. To use the bot, the user must first register
@@ -302,8 +742,9 @@ class CoreFunctions(commands.Cog):
         Example usage: !register OR @<botname> register 
         """
         user_name_str = ctx.author.name
+        state = self.guild_state(ctx.guild)
 
-        if ctx.author.id in self.registered_users:
+        if ctx.author.id in state.registered_users:
             # Prepare embed for previous registration message
             embed_msg = discord.Embed(title="Aready Registered!", 
                                     description="Hi " + user_name_str + "!", 
@@ -314,8 +755,8 @@ class CoreFunctions(commands.Cog):
                             .format(ctx.author.name, ctx.guild), inline=True)
             await ctx.author.send(embed=embed_msg)
         else:
-            self.registered_users[ctx.author.id] = MemberStatsPack()
-            self.record_to_json()
+            state.add_user(ctx.author.id)
+            state.record_event("register", ctx.author.id)
 
             # Prepare embed for first time registration
             embed_msg = discord.Embed(title="Registered!", description="Hi " 
@@ -331,10 +772,12 @@ class CoreFunctions(commands.Cog):
                       description="Deregister yourself from the stats bot.", 
                       help="Call this command to stop the bot from keeping "
                            "track of your stats.")
+    @commands.guild_only()
     async def deregister_user(self,ctx):
         user_id = ctx.author.id
-        if user_id in self.registered_users:
-            del self.registered_users[user_id]
+        state = self.guild_state(ctx.guild)
+        if user_id in state.registered_users:
+            state.remove_user(user_id)
             
             #Create embed
             embed_msg = discord.Embed(title="Deregistered!", description="",
@@ -343,11 +786,191 @@ class CoreFunctions(commands.Cog):
             embed_msg.add_field(name="Goodbye " + ctx.author.name, 
                             value='You have been deregistered in ' 
                             + str(ctx.guild), inline=True)
-            self.record_to_json() # Ensure user is not re-added after.
+            state.record_event("deregister", user_id) # Ensure user is not re-added after.
             await ctx.send(embed=embed_msg)
 
+    @commands.command(name="whoplays",
+                      description="Lists the registered users who have "
+                                  "launched a game.",
+                      help="usage: !whoplays <\"name of game\">\n"
+                           "Enter the name exactly as discord shows it, "
+                           "but with quotes.")
+    @commands.guild_only()
+    async def who_plays(self, ctx, arg: str):
+        player_ids = self.guild_state(ctx.guild).players_of(arg)
+        players = []
+        for player_id in player_ids:
+            member = ctx.guild.get_member(player_id)
+            players.append(member.display_name if member else str(player_id))
+
+        if len(players) == 0:
+            player_str = "No registered users have launched this game yet!"
+        else:
+            player_str = "\n".join("✳️ " + name for name in sorted(players))
+
+        embed_msg = discord.Embed(title="Who plays " + arg,
+                                description=str(len(players)) + " registered "
+                                "user(s) have launched this game.",
+                                color=self.hex_color_code)
+        embed_msg.set_thumbnail(url = self.bot.user.avatar_url)
+        embed_msg.add_field(name="Players", value=player_str[:1024])
+        await ctx.send(embed=embed_msg)
+
+    @commands.guild_only()
+    @commands.command(name="trend",
+                      description="Shows how often you launched a game "
+                                  "each week, and how long you played it.",
+                      help="usage: !trend <\"name of game\"> [weeks]\n"
+                           "Shows the last 12 weeks unless told otherwise, "
+                           "up to 52.")
+    async def trend(self, ctx, arg: str, weeks: int = 12):
+        state = self.guild_state(ctx.guild)
+        if ctx.author.id not in state.registered_users:
+            return
+
+        weeks = max(1, min(weeks, 52))
+        now_ts = int(time.time())
+        history = state.history
+        embed_msg = discord.Embed(title=ctx.author.name + "'s " + arg + " Trend",
+                                description="",
+                                color=self.hex_color_code)
+        embed_msg.set_thumbnail(url = ctx.author.avatar_url)
+
+        if history.game_id(arg) is None:
+            embed_msg.description = "No launches of this game recorded yet!"
+            await ctx.send(embed=embed_msg)
+            return
+
+        if state.history_built is not None:
+            # Wait for the history of earlier runs rather than read it here.
+            await state.history_built
+        weekly = history.weekly_trend(ctx.author.id, arg, weeks, now_ts)
+        embed_msg.description = ("Launches per week, starting on the date shown.\n"
+                                 + self.trend_lines(weekly))
+        daily = history.daily_trend(ctx.author.id, arg, 7, now_ts)
+        embed_msg.add_field(name="Last 7 Days", value=self.trend_lines(daily))
+        await ctx.send(embed=embed_msg)
+
+    def trend_lines(self, trend: list) -> str:
+        """ Helper function to draw a trend as one bar per day or week.
+
+            Parameters:
+                trend: [day, launches, seconds] entries, oldest first.
+        """
+        most = max(launches for _, launches, _ in trend) or 1
+        lines = []
+        for day, launches, seconds in trend:
+            date = datetime.utcfromtimestamp(day * 86400).date()
+            bar = "▇" * round(10 * launches / most)
+            lines.append(f"`{date}` {bar} {launches} ({format_duration(seconds)})")
+        return "\n".join(lines)
+
+    @commands.guild_only()
+    @commands.command(name="timezone",
+                      description="Shows the timezone the bot counts "
+                                  "days in for this server.",
+                      help="use !timezone to see the server's timezone.")
+    async def show_timezone(self, ctx):
+        state = self.guild_state(ctx.guild)
+        name = str(state.timezone) if state.timezone is not None else "UTC"
+        embed_msg = discord.Embed(title="Timezone",
+                                description="Days are counted in " + name + ".",
+                                color=self.hex_color_code)
+        embed_msg.set_thumbnail(url = self.bot.user.avatar_url)
+        await ctx.send(embed=embed_msg)
+
+    @commands.guild_only()
+    @commands.has_permissions(administrator=True)
+    @commands.command(name="settimezone",
+                      description="Sets the timezone the bot counts "
+                                  "days in for this server. Admins only.",
+                      help="usage: !settimezone <timezone>\n"
+                           "e.g. !settimezone Europe/Berlin or "
+                           "!settimezone UTC")
+    async def set_timezone(self, ctx, name: str):
+        state = self.guild_state(ctx.guild)
+        try:
+            state.set_timezone(name)
+            descript = "Days are now counted in " + name + "."
+        except (ValueError, OSError) as error:
+            descript = "Could not set the timezone: " + str(error)
+
+        embed_msg = discord.Embed(title="Timezone",
+                                description=descript,
+                                color=self.hex_color_code)
+        embed_msg.set_thumbnail(url = self.bot.user.avatar_url)
+        await ctx.send(embed=embed_msg)
+
+    @commands.guild_only()
+    @commands.has_permissions(administrator=True)
+    @commands.command(name="botstats",
+                      description="Shows how the bot itself is doing: "
+                                  "presence events, commands, storage "
+                                  "and caches. Admins only.",
+                      help="use !botstats to see the bot's own metrics.")
+    async def show_bot_stats(self, ctx):
+        embed_msg = discord.Embed(title="Bot Stats",
+                                color=self.hex_color_code)
+        embed_msg.set_thumbnail(url = self.bot.user.avatar_url)
+        for name, value in self.botstats_fields(ctx.guild):
+            embed_msg.add_field(name=name, value=value, inline=False)
+        if self.metrics_server is not None:
+            embed_msg.set_footer(text=f"Metrics are served on port "
+                                      f"{self.metrics_server.port}.")
+        await ctx.send(embed=embed_msg)
+
+    def botstats_fields(self, guild: discord.Guild) -> list:
+        """ Helper function for !botstats returning the (name, value) of
+            each field to show for a guild.
+        """
+        pipeline = self.pipeline.metrics
+        apply = self.apply_seconds
+        branches = ", ".join(f"{branch} {apply.summary((branch,))['mean'] * 1e6:.0f}µs"
+                             for (branch,) in apply.label_values())
+        presence = (f"{pipeline.applied} applied, {pipeline.dropped} dropped, "
+                    f"{pipeline.deduplicated + pipeline.collapsed + pipeline.unchanged}"
+                    f" coalesced, {self.pipeline.depth} queued\n"
+                    f"Capture p99 under {self.submit_seconds.quantile(0.99) * 1e6:.0f}µs"
+                    + (f"\nMean apply: {branches}" if branches else ""))
+
+        command_seconds = self.command_seconds
+        calls = {}
+        for labels in command_seconds.label_values():
+            summary = command_seconds.summary(labels)
+            count, total = calls.get(labels[0], (0, 0.0))
+            calls[labels[0]] = (count + summary["count"], total + summary["sum"])
+        busiest = sorted(calls.items(), key=lambda item: -item[1][0])[:5]
+        lines = [f"!{name}: {count} calls, mean {total / count * 1e3:.1f}ms"
+                 for name, (count, total) in busiest]
+        limiter = self.rate_limiter
+        lines.append(f"{limiter.throttled} of "
+                     f"{limiter.allowed + limiter.throttled} throttled")
+        commands_used = "\n".join(lines)
+
+        state = self.guild_state(guild)
+        flushes = state.recorder.metrics
+        journal_bytes = state.journal.bytes_written if state.journal else 0
+        storage = (f"{flushes.flush_count} flushes, mean "
+                   f"{flushes.mean_flush_latency * 1e3:.1f}ms, "
+                   f"{flushes.bytes_written / 1e6:.1f} MB written, "
+                   f"{flushes.failed_flushes} failed\n"
+                   f"{state.recorder.dirty_count} members waiting, "
+                   f"journal {journal_bytes / 1e3:.1f} kB")
+
+        cache = self.stats_cache
+        paginator = self.paginator
+        caches = (f"!stats cache: {cache.hit_rate:.0%} hits, "
+                  f"{len(cache)} entries\n"
+                  f"Paged messages: {paginator.as_dict()['sessions']} open, "
+                  f"{paginator.opened} opened\n"
+                  f"Alerts: {self.alert_sender.sent} sent, "
+                  f"{self.alert_sender.dropped} dropped")
+
+        return [("Presence Events", presence), ("Commands", commands_used),
+                ("Storage", storage), ("Caches", caches)]
+
     def embed_helper(self, *, field_name: str, game_obj: GameStats,embed: 
-                    discord.embeds.Embed) -> discord.embeds.Embed:
+                    discord.embeds.Embed, today: int = None) -> discord.embeds.Embed:
         """Helper function to add fields to game stats.
             Parameters:
                 field_name: A string that will be used as the name of a new 
@@ -356,6 +979,8 @@ class CoreFunctions(commands.Cog):
                             retrieve game data.
                 embed:      An instance of a discord embed that will be 
                             modified to add a field.
+                today:      Today's day ordinal in the guild's timezone,
+                            for the current daily streak.
         """
         embed.add_field(name=field_name,
                         value=game_obj.name
@@ -366,7 +991,14 @@ class CoreFunctions(commands.Cog):
                         + "\nTimes Launched: "
                         + str(game_obj.times_launched)
                         + "\nDays Launched: "
-                        + str(game_obj.days_launched),
+                        + str(game_obj.days_launched)
+                        + "\nDaily Streak: "
+                        + str(game_obj.streak_on(today) if today else 0)
+                        + " (best " + str(game_obj.longest_streak) + ")"
+                        + "\nPlaytime: "
+                        + format_duration(game_obj.total_playtime)
+                        + "\nLongest Session: "
+                        + format_duration(game_obj.longest_session),
                         inline=True)
 
     def report_stats(self, selected_member: discord.Member, 
@@ -374,11 +1006,36 @@ class CoreFunctions(commands.Cog):
         """ Helper function for the display_stats displays the 
             main stats for games.
 
+            The fields are rendered once per version of the member's
+            stats pack and day, and served from the stats cache after.
+
             Parameters:
                 selected_member: The member to process stats for.
                 embed: An embed that will be modified. 
         """
-        user_stats = self.registered_users[selected_member.id]
+        state = self.guild_states[selected_member.guild.id]
+        user_stats = state.registered_users[selected_member.id]
+        today = state.today()
+        # The streaks depend on the guild's day and the recent playtime
+        # on the UTC day, so both are part of the key.
+        key = (selected_member.guild.id, selected_member.id,
+               user_stats.version, today, int(time.time()) // 86400)
+        fields = self.stats_cache.get(
+            key, lambda: self.render_stats_fields(user_stats, today))
+        for field in fields:
+            embed.add_field(**field)
+        return embed
+
+    def render_stats_fields(self, user_stats: MemberStatsPack,
+                            today: int) -> tuple:
+        """ Returns the fields of a member's stats, as the name, value
+            and inline keyword arguments of Embed.add_field.
+
+            Parameters:
+                user_stats: The member's stats pack.
+                today:      Today's day ordinal in the guild's timezone.
+        """
+        embed = discord.Embed()
         most_launched = user_stats.most_launched_game
         least_launched = user_stats.least_launched_game
         last_launched =  user_stats.last_launched_game
@@ -386,21 +1043,31 @@ class CoreFunctions(commands.Cog):
         if (most_launched is None and least_launched is None
                 and last_launched is None):
             embed.add_field(name="Error: " , value="No Games Recorded Yet!")
-            return embed
+            return tuple(embed.to_dict()["fields"])
 
         if most_launched is not None:
             self.embed_helper(field_name="Most Launched Game",
-                        game_obj=most_launched, embed=embed)
+                        game_obj=most_launched, embed=embed, today=today)
 
         if least_launched is not None:
             self.embed_helper(field_name="Least Launched Game", 
-                        game_obj=least_launched, embed=embed)
+                        game_obj=least_launched, embed=embed, today=today)
 
         if last_launched is not None:
             self.embed_helper(field_name="Last Launched Game", 
-                        game_obj=last_launched, embed=embed)
+                        game_obj=last_launched, embed=embed, today=today)
 
-        return embed
+        last_7_days, last_30_days = user_stats.recent_playtime()
+        embed.add_field(name="Playtime",
+                        value="Total: "
+                        + format_duration(user_stats.total_playtime)
+                        + "\nLast 7 Days: " + format_duration(last_7_days)
+                        + "\nLast 30 Days: " + format_duration(last_30_days)
+                        + "\nLongest Session: "
+                        + format_duration(user_stats.longest_session),
+                        inline=True)
+
+        return tuple(embed.to_dict()["fields"])
 
     @commands.command(name="stats", 
                       description="Display your (or another registered users) "
@@ -479,23 +1146,59 @@ class CoreFunctions(commands.Cog):
 
         await ctx.send(embed=embed_msg)
 
+    def bot_check(self, ctx) -> bool:
+        """ Global check run before every command of every cog: each
+            user gets a token bucket per command.
+        """
+        if ctx.command is None:
+            return True
+        ctx.command_started = time.perf_counter()
+        name = ctx.command.qualified_name
+        retry_after = self.rate_limiter.acquire(name, ctx.author.id)
+        if retry_after > 0:
+            raise CommandThrottled(name, retry_after)
+        return True
+
+    def throttled_embed(self, descript: str) -> discord.Embed:
+        embed_msg = discord.Embed(title = "Slow down!",
+                                description = descript,
+                                color = self.hex_color_code)
+        embed_msg.set_thumbnail(url = self.bot.user.avatar_url)
+        return embed_msg
+
+    @commands.Cog.listener()
+    async def on_command_completion(self, ctx):
+        self.observe_command(ctx, "ok")
+
     @commands.Cog.listener()
     async def on_command_error(self, ctx, error):
-        if isinstance(error, commands.errors.CheckFailure):
+        self.observe_command(ctx, "throttled" if isinstance(error, CommandThrottled)
+                             else "error")
+        if isinstance(error, CommandThrottled):
+            # Only tell the user once per cool down, then ignore them.
+            if self.rate_limiter.warn_once(error.name, ctx.author.id):
+                descript = ("Too many uses of !{}. Try again in {:.0f} "
+                            "seconds.".format(error.name, error.retry_after + 0.5))
+                await ctx.send(embed=self.throttled_embed(descript))
+        elif isinstance(error, commands.NoPrivateMessage):
+            await ctx.send('This command can only be used in a server.')
+        elif isinstance(error, commands.MissingPermissions):
+            missing = ", ".join(perm.replace("_", " ") for perm in error.missing_perms)
+            await ctx.send('You need the ' + missing + ' permission for this command.')
+            logger.info("User:" + str(ctx.author) +
+                        " attempted to use cmd without " + missing + ".")
+        elif isinstance(error, commands.errors.CheckFailure):
             await ctx.send('You do not have the correct role for this command.')
-            logger.info("User:" + ctx.author + 
+            logger.info("User:" + str(ctx.author) + 
                         " attempted to use cmd with improper role.")
         elif isinstance(error, commands.CommandNotFound):
             # If the user is not registered with the bot, then do nothing. 
-            if ctx.author.id not in self.registered_users:
+            if not self.is_user_registered(member=ctx.author):
                 return
-            # User in not yet in the dictionary
-            elif ctx.author.id not in self.error_dictionary:
-                self.error_dictionary[ctx.author.id] = UserTimer()
-                user = self.error_dictionary[ctx.author.id]
-                user.error_count = 1
 
-                # Get embed ready
+            retry_after = self.rate_limiter.acquire(INVALID_COMMAND_POLICY,
+                                                    ctx.author.id)
+            if retry_after == 0:
                 error_descript = ("Invalid command was used. "
                                 "Please see the help read out via !help.")
                 embed_msg = discord.Embed(title = "Error!", 
@@ -503,40 +1206,10 @@ class CoreFunctions(commands.Cog):
                                         color = self.hex_color_code)
                 embed_msg.set_thumbnail(url = self.bot.user.avatar_url)
                 await ctx.send(embed=embed_msg)
-            elif ctx.author.id in self.error_dictionary:
-                user = self.error_dictionary[ctx.author.id]
-                user.error_count += 1
-
-                # Get embed ready
-                error_descript = ("Invalid command was used. "
-                                "Please see the help read out via !help.")
-                embed_msg = discord.Embed(title = "Error!", 
-                                        description = error_descript,
-                                        color = self.hex_color_code)
-                embed_msg.set_thumbnail(url = self.bot.user.avatar_url)
-
-                # If the user hasn't spammed a message in a while, 
-                # then restart their error count.
-                if (user.time_created + 10 < time.time()) and not user.on_cooldown:
-                    user.error_count = 1
-                    user.time_created = time.time()
-                    await ctx.send(embed=embed_msg)
-                # Start the timer when the user has entered more than three
-                # Incorrect commands, but check to see that they are not on cooldown.
-                elif (user.error_count > 3) and not user.on_cooldown:
-                    user.start_timer(10) # Hard coded at ten seconds.
-                    embed_msg.description = ("Too many invalid commands sent. "
-                                            "Activating 10 second cool down.")
-                    await ctx.send(embed=embed_msg)
-                # Timer is done. Resume normal behavior.
-                elif user.timer_done():
-                    user.error_count = 1
-                    await ctx.send(embed=embed_msg)
-                # First time entry, and already in the error dictionary.
-                elif not user.on_cooldown:
-                    await ctx.send(embed=embed_msg)
-                else:
-                    pass
+            elif self.rate_limiter.warn_once(INVALID_COMMAND_POLICY, ctx.author.id):
+                descript = ("Too many invalid commands sent. Activating "
+                            "{:.0f} second cool down.".format(retry_after + 0.5))
+                await ctx.send(embed=self.throttled_embed(descript))
         else: # Catch any errors in any of the other cogs.
             logger.debug(f"Error: {error} Raised By: {ctx.command}")
 
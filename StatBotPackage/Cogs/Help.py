@@ -1,15 +1,27 @@
 # Discord Cog to create custom help commmand for the stats bot.
 
 # Standard Library Imports
-import asyncio
+import sys
 
 # Third party imports
 import discord
 from discord.ext import commands
 
+# Local Module imports
+sys.path.append('../')
+from StatBotPackage.ReactionPaginator import paginator_for
+
+# Seconds a help message stays active after the last button press.
+HELP_TIMEOUT = 30.0
+
 class Help(commands.Cog):
     """ A Cog that implements a custom help command for the stats bot
         discord bot.
+
+        Command metadata does not change once an extension is loaded, so
+        the help pages are built once and kept until an extension is
+        loaded or unloaded. The pages are turned through the bot's
+        shared ReactionPaginator.
     """
     # Global hex color code for embeds.
     hex_color_code = 0x65B460
@@ -19,16 +31,34 @@ class Help(commands.Cog):
         self.bot = bot
         self.bot.remove_command("help")
 
+        self.paginator = paginator_for(bot)
+        self._pages = None
+        self._timeout_embed = None
+
     @commands.Cog.listener()
     async def on_ready(self):
         print("Help Cog now Active.")
 
-    @commands.command(name='help', aliases=["h"], 
-                      description="The Help Command", help="Call this command "
-                      "to receive help on how to use the bot.")
-    async def help_command(self, ctx):
+    @commands.Cog.listener()
+    async def on_extension_load(self, name: str):
+        self._pages = None
 
-        cog_list = sorted([cogs for cogs in self.bot.cogs.keys()])
+    @commands.Cog.listener()
+    async def on_extension_unload(self, name: str):
+        self._pages = None
+
+    @property
+    def pages(self) -> list:
+        """ The help pages, built the first time they are needed after
+            an extension was loaded or unloaded.
+        """
+        if self._pages is None:
+            self._pages = self.build_pages()
+        return self._pages
+
+    def build_pages(self) -> list:
+        """ Returns the general help page followed by a page per cog. """
+        cog_list = sorted(self.bot.cogs.keys())
         page_list = []
 
         primary_embed = discord.Embed(title="Help Command",
@@ -39,79 +69,40 @@ class Help(commands.Cog):
         timeout_embed = discord.Embed(title="Timed out",
                               description="The help message has timed out.",
                               color=self.hex_color_code)
-        timeout_embed.set_thumbnail(url=self.bot.user.avatar_url) 
+        timeout_embed.set_thumbnail(url=self.bot.user.avatar_url)
+        self._timeout_embed = timeout_embed
 
         # The first page is the general help page.
         page_list.append(primary_embed)
 
         # Process each cog:
-        page_number = 0
         total_pages = len(cog_list)
-
-        for cog in cog_list:
-            command_text = ""
-            for command in self.bot.get_cog(cog).walk_commands():
-                if command.parent is None and command.hidden == False:
-                    command_text += (f"❗{command.name}  - {command.description}\n"
-                                     "Help Description: " + f"{command.help}\n"
-                                     "=====\n")
+        for page_number, cog in enumerate(cog_list, start=1):
+            command_text = "".join(
+                f"❗{command.name}  - {command.description}\n"
+                f"Help Description: {command.help}\n"
+                "=====\n"
+                for command in self.bot.get_cog(cog).walk_commands()
+                if command.parent is None and command.hidden == False)
             # The Cog's commands have been processed, now to add it to the page list.
-            title ="Category: " + str(cog)
-            description = command_text
-            page_number += 1
-            embed_msg = discord.Embed(title=title,description=description,inline=False)
+            embed_msg = discord.Embed(title="Category: " + str(cog),
+                                      description=command_text)
             embed_msg.set_footer(text="Page No. " + str(page_number) + "/" + str(total_pages))
-
             page_list.append(embed_msg)
 
-        # Logic to create the pagination inteface below: 
-
-        # Call upon a 'future' object
-        # This will send off the message given the context, but also return
-        # the message itself. This allows for future modification.
-        message = await ctx.send(embed=primary_embed)
-        # Setup the buttons we will be using for our message.
-        await message.add_reaction('⏮')
-        await message.add_reaction('⬅️')
-        await message.add_reaction('➡️')
-        await message.add_reaction('⏭')
-
-        curr_reaction = None
-        total_pages = len(page_list)
-        page_idx = 0
-
-        # Declaration of local function with the same arguements as 
-        # the reaction_add event. This is necessary in order to use the wait_for call.
-        def check(curr_reaction, user):
-            return user == ctx.author
-
-        while True:
-            if str(curr_reaction) == '⏮':
-                page_idx = 0
-                await message.edit(embed=page_list[page_idx])
-            elif str(curr_reaction) == '⬅️':
-                if page_idx > 0:
-                    page_idx -= 1
-                    await message.edit(embed=page_list[page_idx])
-            elif str(curr_reaction) == '➡️':
-                if page_idx < total_pages - 1:
-                    page_idx += 1
-                    await message.edit(embed=page_list[page_idx])
-            elif str(curr_reaction) == '⏭':
-                page_idx = total_pages - 1
-                await message.edit(embed=page_list[page_idx])
-            try:
-                curr_reaction, user = await self.bot.wait_for('reaction_add', timeout = 30.0, check = check)
-                await message.remove_reaction(curr_reaction, user)
-            except asyncio.TimeoutError:
-                await message.edit(embed=timeout_embed)
-                break
-
-        # Once the message has expired, we clear all reactions on the message.
-        await message.clear_reactions()
+        return page_list
+
+    @commands.command(name='help', aliases=["h"], 
+                      description="The Help Command", help="Call this command "
+                      "to receive help on how to use the bot.")
+    async def help_command(self, ctx):
+        pages = self.pages
+        await self.paginator.paginate(ctx, ctx.author.id, pages,
+                                      timeout=HELP_TIMEOUT,
+                                      timeout_embed=self._timeout_embed)
 
 def setup(bot: commands.Bot):
     """ Setup for extension loading.
         Adds the help cog to our Bot.
     """
-    bot.add_cog(Help(bot))
\ No newline at end of file
+    bot.add_cog(Help(bot))
@@ -0,0 +1,81 @@
+# Discord Cog to read the handler profiler from discord.
+
+# Standard Library Imports
+import io
+
+# Third party imports
+import discord
+from discord.ext import commands
+
+# Handlers listed by !profile.
+TOP_HANDLERS = 10
+
+class Profiling(commands.Cog):
+    """ A Cog with the admin command reading the bot's HandlerProfiler,
+        which is only there when the bot was started with
+        PROFILE_HANDLERS=1.
+    """
+    # Global hex color code for embeds.
+    hex_color_code = 0x65B460
+
+    def __init__(self, bot: commands.Bot) -> None:
+        self.bot = bot
+
+    @commands.guild_only()
+    @commands.has_permissions(administrator=True)
+    @commands.command(name="profile",
+                      description="Shows where the bot spends its time "
+                                  "when profiling is on. Admins only.",
+                      help="usage: !profile [wall|cpu|dump|reset]\n"
+                           "!profile lists the handlers that took the most "
+                           "wall (or cpu) time, !profile dump attaches the "
+                           "sampled stacks for a flame graph and "
+                           "!profile reset starts over.")
+    async def profile(self, ctx, action: str = "wall"):
+        profiler = getattr(self.bot, "profiler", None)
+        embed_msg = discord.Embed(title="Profile", color=self.hex_color_code)
+        embed_msg.set_thumbnail(url = self.bot.user.avatar_url)
+
+        if profiler is None:
+            embed_msg.description = ("Profiling is off. Start the bot with "
+                                     "PROFILE_HANDLERS=1 to turn it on.")
+        elif action == "dump":
+            stacks = profiler.collapsed().encode("utf-8")
+            await ctx.send(f"{profiler.samples} samples, in the collapsed "
+                           "format of flamegraph.pl and speedscope.",
+                           file=discord.File(io.BytesIO(stacks),
+                                             filename="profile.collapsed"))
+            return
+        elif action == "reset":
+            profiler.reset()
+            embed_msg.description = "The profile was reset."
+        elif action in ("wall", "cpu"):
+            embed_msg.description = self.top_handlers(profiler, action)
+            embed_msg.set_footer(text=f"{profiler.samples} stack samples, "
+                                      "see !profile dump")
+        else:
+            embed_msg.description = ("Unknown action " + action + ", "
+                                     "expected wall, cpu, dump or reset.")
+        await ctx.send(embed=embed_msg)
+
+    def top_handlers(self, profiler, key: str) -> str:
+        """ Helper function for !profile listing the handlers that took
+            the most time.
+        """
+        lines = []
+        for name, stats in profiler.top(TOP_HANDLERS, key):
+            times = stats.as_dict()
+            lines.append(f"**{name}**: {stats.calls} calls, "
+                         f"{times[key]:.2f}s total, "
+                         f"{times['mean_wall'] * 1e3:.2f}ms wall and "
+                         f"{times['mean_cpu'] * 1e3:.2f}ms cpu per call, "
+                         f"slowest {stats.max_wall * 1e3:.1f}ms")
+        if not lines:
+            return "Nothing has been profiled yet."
+        return "\n".join(lines)
+
+def setup(bot: commands.Bot):
+    """ Setup for extension loading.
+        Adds the profiling cog to our Bot.
+    """
+    bot.add_cog(Profiling(bot))
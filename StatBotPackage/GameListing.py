@@ -0,0 +1,78 @@
+# Standard Library imports
+import heapq
+
+# The orders a game listing can be sorted in, and the key that puts the
+# first game in the listing first when taking the smallest keys.
+LISTING_ORDERS = {"name":   lambda game: game.name.casefold(),
+                  "most":   lambda game: -game.times_launched,
+                  "recent": lambda game: -(game.last_played_ts or 0)}
+
+class GameListing():
+    """ The pages of a member's game list, made as they are turned to.
+
+        Only as much of the list is put in order as the pages asked for
+        need: the first page takes the first few games off a heap rather
+        than sorting the whole library, and a page is rendered once and
+        kept. Behaves as a sequence of embeds, so it can be handed to the
+        ReactionPaginator as is.
+
+        Attributes:
+            order:      One of LISTING_ORDERS.
+            per_page:   Games listed per page.
+    """
+
+    def __init__(self, games: dict, order: str, render_page, *,
+                 per_page: int = 20, ranked=None) -> None:
+        """ Parameters:
+                games:       Name of the game to GameStats.
+                order:       One of LISTING_ORDERS.
+                render_page: Called with the games of a page, the page
+                             number and the number of pages, and returns
+                             the page's embed.
+                per_page:    Games listed per page.
+                ranked:      Optionally, a function returning the k most
+                             launched games, used for the "most" order
+                             instead of a heap e.g. MemberStatsPack.top_launched.
+        """
+        if order not in LISTING_ORDERS:
+            raise ValueError(f"Unknown order {order}, expected one of "
+                             + ", ".join(LISTING_ORDERS))
+        self.order = order
+        self.per_page = per_page
+        self._games = games
+        self._count = len(games)
+        self._render_page = render_page
+        self._ranked = ranked if order == "most" else None
+        self._ordered = []
+        self._pages = {}  # Key: Page index; Value: The rendered embed
+
+    def __len__(self) -> int:
+        return max(1, -(-self._count // self.per_page))
+
+    def _first(self, k: int) -> list:
+        """ Returns the first k games of the listing. """
+        if k > len(self._ordered):
+            if self._ranked is not None:
+                self._ordered = self._ranked(k)
+            elif k >= self._count:
+                self._ordered = sorted(self._games.values(),
+                                       key=LISTING_ORDERS[self.order])
+            else:
+                self._ordered = heapq.nsmallest(k, self._games.values(),
+                                                key=LISTING_ORDERS[self.order])
+        return self._ordered[:k]
+
+    def __getitem__(self, index: int):
+        total_pages = len(self)
+        if index < 0:
+            index += total_pages
+        if not 0 <= index < total_pages:
+            raise IndexError("page index out of range")
+
+        page = self._pages.get(index)
+        if page is None:
+            start = index * self.per_page
+            games = self._first(start + self.per_page)[start:]
+            page = self._pages[index] = self._render_page(games, index + 1,
+                                                          total_pages)
+        return page
@@ -0,0 +1,64 @@
+# Standard Library imports
+import sys
+
+class GameRegistry():
+    """ A guild wide registry of every game the registered members have
+        launched. Each distinct game name is given a small integer id,
+        and an inverted index maps that id to the members who have
+        played the game, so "who plays X" is answered without looking
+        at every member's stats pack.
+
+        Attributes:
+            names: Game id to the canonical (interned) name of the game.
+    """
+
+    def __init__(self) -> None:
+        self.names = []     # Game id to name
+        self._ids = {}      # Key: Name of the game; Value: Game id
+        self._players = []  # Game id to the set of member ids
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, game_name: str) -> bool:
+        return game_name in self._ids
+
+    def intern(self, game_name: str) -> int:
+        """ Returns the id of a game, registering it if it is new. """
+        game_id = self._ids.get(game_name)
+        if game_id is None:
+            game_id = len(self.names)
+            game_name = sys.intern(game_name)
+            self._ids[game_name] = game_id
+            self.names.append(game_name)
+            self._players.append(set())
+        return game_id
+
+    def game_id(self, game_name: str) -> int:
+        """ Returns the id of a game, or None if no one has played it. """
+        return self._ids.get(game_name)
+
+    def add_player(self, game_name: str, member_id: int) -> int:
+        """ Record that a member has played a game. Returns the game id. """
+        game_id = self.intern(game_name)
+        self._players[game_id].add(member_id)
+        return game_id
+
+    def remove_member(self, member_id: int, game_names):
+        """ Drop a member from the index of every game they played.
+
+            Parameters:
+                member_id:  The member to remove.
+                game_names: The names of the games the member played.
+        """
+        for game_name in game_names:
+            game_id = self._ids.get(game_name)
+            if game_id is not None:
+                self._players[game_id].discard(member_id)
+
+    def players_of(self, game_name: str) -> frozenset:
+        """ Returns the ids of the members who have played a game. """
+        game_id = self._ids.get(game_name)
+        if game_id is None:
+            return frozenset()
+        return frozenset(self._players[game_id])
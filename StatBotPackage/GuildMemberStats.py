@@ -1,11 +1,79 @@
 # Standard Library imports
 from __future__ import annotations
-from datetime import datetime
+from datetime import datetime, timedelta, timezone, tzinfo
+from functools import lru_cache
+import itertools
 import re
+import sys
 
 # 3rd party imports
 import discord
 
+# Local Module imports
+from StatBotPackage.LaunchRanking import LaunchRankIndex
+from StatBotPackage.GameRegistry import GameRegistry
+from StatBotPackage.Playtime import SECONDS_PER_DAY, PlaytimeWindow
+
+# Version of the stats pack layout written by MemberStatsPack.json_encoder.
+# Version 1 (unmarked) stored copies of the most, least and last games.
+# Version 3 added session playtime; older layouts restore with none.
+# Version 4 added the index of days played.
+FORMAT_VERSION = 4
+
+# Type tags written next to each encoded object.
+GAME_STATS_TAG = "__GameStats__"
+STATS_PACK_TAG = "__MemberStatsPack__"
+
+# Dates are held in memory as whole seconds since the epoch (UTC).
+_EPOCH = datetime(1970, 1, 1)
+_ONE_SECOND = timedelta(seconds=1)
+
+# Stats pack versions are drawn from one counter, so a pack that replaces
+# another (e.g. a member who registers again) never repeats a version.
+_versions = itertools.count(1)
+
+def _game_key(game) -> str:
+    return None if game is None else game.name
+
+def _to_timestamp(date: datetime) -> int:
+    if date is None:
+        return None
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return (date - _EPOCH) // _ONE_SECOND
+
+def _from_timestamp(timestamp: int) -> datetime:
+    if timestamp is None:
+        return None
+    return _EPOCH + timedelta(seconds=timestamp)
+
+def _date_to_json(date: datetime) -> str:
+    return None if date is None else str(date)
+
+def day_ordinal(date: datetime, tz: tzinfo = None) -> int:
+    """ The day (proleptic Gregorian ordinal) a naive UTC date falls on
+        in a timezone, UTC by default.
+    """
+    if tz is not None:
+        date = date.replace(tzinfo=timezone.utc).astimezone(tz)
+    return date.toordinal()
+
+def _decode_day_bits(bits: str) -> int:
+    return None if bits is None else int(bits, 16)
+
+@lru_cache(maxsize=1 << 16)
+def _decode_date_cached(date_string: str) -> datetime:
+    try:
+        date = datetime.fromisoformat(date_string)
+    except ValueError:
+        return GameStats.decode_date_legacy(date_string)
+
+    # Stored dates have always been restored to the second.
+    if date.microsecond:
+        date = date.replace(microsecond=0)
+    return date
+
+
 class GameStats():
     """ A helper class for the Member Stats Pack class. This class
         represents a game that a user has launched in the past.
@@ -21,22 +89,174 @@ class GameStats():
                          launch as often.
             times_launched: The number of times a game was launched.
             days_launched: The number of days a game was launched.
+            total_playtime: Seconds spent playing the game.
+            longest_session: The longest session of the game in seconds.
+            sessions: The number of sessions played.
+            first_day: The ordinal of the first day in day_bits.
+            day_bits:  Bit n is set if the game was launched on the day
+                       first_day + n. Games restored from before days
+                       were indexed start with only their last day set,
+                       see index_last_day.
+            current_streak: Consecutive days played, up to the last day
+                            the game was launched.
+            longest_streak: The most consecutive days the game was played.
+
+        The dates are stored as integer seconds (UTC) and converted to and
+        from naive UTC datetime objects by the date properties. Game names
+        are interned, so every member that plays a game shares one string.
     """
+    __slots__ = ("name", "first_played_ts", "last_played_ts", "marked_game",
+                 "times_launched", "days_launched", "total_playtime",
+                 "longest_session", "sessions", "first_day", "day_bits",
+                 "current_streak", "longest_streak")
 
     def __init__(self, given_name: str,
                 date_first_played: datetime = None,
                 date_last_played: datetime = None,
                 marked_game: bool = False,
                 times_launched: int = 0 ,
-                days_launched: int  = 0):
-
-        self.__GameStats__ = True # metadata to parse JSON file.
-        self.name = given_name
-        self.date_first_played: datetime = date_first_played
-        self.date_last_played:  datetime = date_last_played
+                days_launched: int  = 0,
+                total_playtime: int = 0,
+                longest_session: int = 0,
+                sessions: int = 0,
+                first_day: int = None,
+                day_bits: int = None,
+                current_streak: int = 0,
+                longest_streak: int = 0):
+
+        self.name = sys.intern(given_name)
+        self.first_played_ts = _to_timestamp(date_first_played)
+        self.last_played_ts  = _to_timestamp(date_last_played)
         self.marked_game = marked_game
         self.times_launched = times_launched
         self.days_launched = days_launched
+        self.total_playtime = total_playtime
+        self.longest_session = longest_session
+        self.sessions = sessions
+
+        self.first_day = first_day
+        self.day_bits = day_bits
+        self.current_streak = current_streak
+        self.longest_streak = longest_streak
+        if day_bits is None:
+            # No index of days yet. The day last played depends on the
+            # guild's timezone, so it is set by index_last_day.
+            self.day_bits = 0
+
+    def index_last_day(self, tz: tzinfo = None):
+        """ Start the index of days of a game restored from before days
+            were indexed, from the day it was last played in a timezone.
+            Does nothing for a game whose days are indexed.
+        """
+        if (self.day_bits == 0 and self.days_launched > 0
+                and self.last_played_ts is not None):
+            self.first_day = day_ordinal(self.date_last_played, tz)
+            self.day_bits = 1
+            self.current_streak = max(self.current_streak, 1)
+            self.longest_streak = max(self.longest_streak, 1)
+
+    @property
+    def last_day(self) -> int:
+        """ The ordinal of the last day the game was launched, or None. """
+        if self.day_bits == 0:
+            return None
+        return self.first_day + self.day_bits.bit_length() - 1
+
+    def record_day(self, day: int):
+        """ Note that the game was launched on a day (an ordinal).
+
+            A day is only counted the first time it is seen. Launches
+            arrive in order, so the streaks are updated in O(1); a day
+            older than the last one, e.g. from a late event, is rare
+            and recounts the streaks from the bits.
+        """
+        if self.day_bits == 0:
+            self.first_day = day
+            self.day_bits = 1
+            self.days_launched += 1
+            self.current_streak = 1
+            self.longest_streak = max(self.longest_streak, 1)
+            return
+
+        offset = day - self.first_day
+        if offset < 0:
+            self.day_bits <<= -offset
+            self.first_day = day
+            offset = 0
+
+        bit = 1 << offset
+        if self.day_bits & bit:
+            return
+
+        last_offset = self.day_bits.bit_length() - 1
+        self.day_bits |= bit
+        self.days_launched += 1
+
+        if offset > last_offset:
+            if offset == last_offset + 1:
+                self.current_streak += 1
+            else:
+                self.current_streak = 1
+            self.longest_streak = max(self.longest_streak, self.current_streak)
+        else:
+            self._recount_streaks()
+
+    def _recount_streaks(self):
+        longest = 0
+        run = 0
+        bits = self.day_bits
+        while bits:
+            if bits & 1:
+                run += 1
+                longest = max(longest, run)
+            else:
+                run = 0
+            bits >>= 1
+        self.current_streak = run
+        self.longest_streak = max(self.longest_streak, longest)
+
+    def streak_on(self, day: int) -> int:
+        """ Returns the daily streak as of a day (an ordinal): the
+            current streak if the game was played that day or the day
+            before, otherwise 0.
+        """
+        last_day = self.last_day
+        if last_day is None or day - last_day > 1:
+            return 0
+        return self.current_streak
+
+    @property
+    def date_first_played(self) -> datetime:
+        return _from_timestamp(self.first_played_ts)
+
+    @date_first_played.setter
+    def date_first_played(self, date: datetime):
+        self.first_played_ts = _to_timestamp(date)
+
+    @property
+    def date_last_played(self) -> datetime:
+        return _from_timestamp(self.last_played_ts)
+
+    @date_last_played.setter
+    def date_last_played(self, date: datetime):
+        self.last_played_ts = _to_timestamp(date)
+
+    def to_json(self) -> dict:
+        """ Returns the JSON representation of the game, tagged with its type. """
+        return {GAME_STATS_TAG: True,
+                "name": self.name,
+                "date_first_played": _date_to_json(self.date_first_played),
+                "date_last_played": _date_to_json(self.date_last_played),
+                "marked_game": self.marked_game,
+                "times_launched": self.times_launched,
+                "days_launched": self.days_launched,
+                "total_playtime": self.total_playtime,
+                "longest_session": self.longest_session,
+                "sessions": self.sessions,
+                "first_day": self.first_day,
+                "day_bits": format(self.day_bits, "x"),
+                "current_streak": self.current_streak,
+                "longest_streak": self.longest_streak}
 
     def mark_game(self, marked: bool):
         """ Allow the user to mark a game they want to play. """
@@ -51,6 +271,21 @@ class GameStats():
             e.g. creating a date object from a json file.
 
             Returns None if the date string is None.
+
+            Dates are written with str(datetime), which is ISO 8601, so
+            they are parsed with fromisoformat. The same timestamp string
+            shows up many times in a file (the most, least and last games
+            repeat a game's dates), so decoded dates are cached and the
+            same immutable datetime object is shared.
+        """
+        if date_string is None:
+            return None
+        return _decode_date_cached(date_string)
+
+    @staticmethod
+    def decode_date_legacy(date_string: str) -> datetime:
+        """ The original hand rolled date parser. Only used for strings
+            that fromisoformat does not accept.
         """
         if date_string == None:
             return None
@@ -83,7 +318,7 @@ class GameStats():
         """
         game_obj = None
 
-        if dict is not None and  "__GameStats__" in dict:
+        if dict is not None and GAME_STATS_TAG in dict:
             last_played_date  =  cls.decode_date(dict["date_last_played"])
             first_played_date =  cls.decode_date(dict["date_first_played"])
 
@@ -92,7 +327,14 @@ class GameStats():
                                 date_last_played=last_played_date,
                                 marked_game=dict["marked_game"],
                                 times_launched=dict["times_launched"],
-                                days_launched=dict["days_launched"])
+                                days_launched=dict["days_launched"],
+                                total_playtime=dict.get("total_playtime", 0),
+                                longest_session=dict.get("longest_session", 0),
+                                sessions=dict.get("sessions", 0),
+                                first_day=dict.get("first_day"),
+                                day_bits=_decode_day_bits(dict.get("day_bits")),
+                                current_streak=dict.get("current_streak", 0),
+                                longest_streak=dict.get("longest_streak", 0))
 
         return game_obj
 
@@ -110,12 +352,30 @@ class MemberStatsPack():
             least_launched_game: The game that's been least launched.
             last_launched_game: The game that was launched last.
             game_dict: A dictionary of the games the user has launched.
+            marked_games: The marked entries of game_dict, by name, kept
+                          up to date by set_marked.
+            member_id: The id of the member the stats pack belongs to.
+            registry:  The guild's GameRegistry, kept up to date with the
+                       games this member plays. Set by attach.
+            total_playtime:  Seconds spent playing any game.
+            longest_session: The longest session of any game in seconds.
+            playtime:  A PlaytimeWindow of the last 30 days, or None
+                       until the member's first session.
+            timezone:  The guild's timezone, which decides the day a
+                       launch falls on. UTC if None. Set by attach.
+            version:   Increases whenever the stats pack changes, so
+                       anything rendered from it can be cached by version.
     """
+    __slots__ = ("most_launched_game", "least_launched_game",
+                 "last_launched_game", "game_dict", "member_id", "registry",
+                 "_rank_index", "total_playtime", "longest_session",
+                 "playtime", "timezone", "marked_games", "version")
 
     def __init__(self, most_launched: GameStats = None,
                 least_launched:GameStats = None,
                 last_game: GameStats = None,
-                restored_game_list: dict[GameStats] = None):
+                restored_game_list: dict[GameStats] = None,
+                playtime: PlaytimeWindow = None):
         """ The purpose of having all these args in the constructor is
             to be able to 'reload' the data into the class when read in
             from a JSON file. Generally, when a new member is registered,
@@ -134,8 +394,9 @@ class MemberStatsPack():
                                    from a json file a dictionary containing
                                    instance of gameobjects shall be assigned.)
 
+               playtime: The restored PlaytimeWindow, if any.
+
         """
-        self.__MemberStatsPack__ = True # metadata
         self.most_launched_game  = most_launched
         self.least_launched_game = least_launched
         self.last_launched_game  = last_game
@@ -145,6 +406,56 @@ class MemberStatsPack():
         else:
             self.game_dict = {} # Key: Name of the game; Value: GameStats object
 
+        # Ranks the games by times launched for the most/least updates.
+        # Built on the first ranked query, so members that are restored
+        # but never launch a game do not pay for it.
+        self._rank_index = None
+        # Key: Name of the game; Value: GameStats object
+        self.marked_games = {name: game for name, game in self.game_dict.items()
+                             if game.marked_game}
+
+        # The totals across games are kept up to date by add_playtime.
+        self.total_playtime = 0
+        self.longest_session = 0
+        for game in self.game_dict.values():
+            self.total_playtime += game.total_playtime
+            self.longest_session = max(self.longest_session, game.longest_session)
+        self.playtime = playtime
+
+        self.member_id = None
+        self.registry = None
+        self.timezone = None
+        self.version = next(_versions)
+
+    def touch(self):
+        """ Bump the version after a change. """
+        self.version = next(_versions)
+
+    def attach(self, registry: GameRegistry, member_id: int,
+               timezone: tzinfo = None):
+        """ Connect the stats pack to the guild's game registry, indexing
+            every game the member has already played.
+
+            Parameters:
+                registry:  The guild's GameRegistry.
+                member_id: The id of the member that owns this stats pack.
+                timezone:  The guild's timezone, UTC if None.
+        """
+        self.member_id = member_id
+        self.registry = registry
+        self.timezone = timezone
+        self.touch()
+        for game_name, game in self.game_dict.items():
+            registry.add_player(game_name, member_id)
+            game.index_last_day(timezone)
+
+    def detach(self):
+        """ Remove the member from the game registry e.g. when they
+            deregister from the bot.
+        """
+        if self.registry is not None:
+            self.registry.remove_member(self.member_id, self.game_dict)
+        self.registry = None
 
     def init_game_stats(self, current_game: discord.Game, date: datetime):
         """ This function should be called when creating a new gamestats object
@@ -155,17 +466,30 @@ class MemberStatsPack():
                 current_game: The discord game object
                 date: A datetime object for init'ing the game object
         """
-        game_object = GameStats(given_name=current_game.name,
+        game_name = current_game.name
+        if self.registry is not None:
+            # Share the registry's copy of the name across members.
+            game_id = self.registry.add_player(game_name, self.member_id)
+            game_name = self.registry.names[game_id]
+
+        game_object = GameStats(given_name=game_name,
                                 date_first_played=date,
                                 date_last_played=date,
                                 marked_game=False,
                                 times_launched=1,
-                                days_launched=1)
+                                days_launched=0,
+                                day_bits=0)
+        # Without a date the game counts as launched today.
+        game_object.record_day(day_ordinal(date or datetime.utcnow(),
+                                           self.timezone))
 
         # We add the game to the games list,
         # and it becomes the last game launched
-        self.game_dict[current_game.name] = game_object
+        self.game_dict[game_object.name] = game_object
+        if self._rank_index is not None:
+            self._rank_index.add(game_object)
         self.last_launched_game = game_object
+        self.touch()
 
         # One time initialization for defaults
         # No need to set this as the least launched if least launched is not None.
@@ -192,7 +516,21 @@ class MemberStatsPack():
             Parameters:
                 game_name: Key to be used to access the dictionary
         """
-        self.game_dict[game_name].mark_game(game_name, True)
+        self.set_marked(game_name, True)
+
+    def set_marked(self, game_name: str, marked: bool):
+        """ Mark or unmark a game in the members game dictionary.
+            Parameters:
+                game_name: Key to be used to access the dictionary
+                marked:    True to mark the game, false to unmark it.
+        """
+        game = self.game_dict[game_name]
+        game.mark_game(marked)
+        self.touch()
+        if marked:
+            self.marked_games[game_name] = game
+        else:
+            self.marked_games.pop(game_name, None)
 
     def is_game_marked(self, name_of_game: str):
         """ Given the name of the game return true if it's a
@@ -230,15 +568,21 @@ class MemberStatsPack():
         # Current game being queried, becomes the last game launched.
         self.last_launched_game = self.game_dict[game_activity.name]
 
+        if self.registry is not None:
+            self.registry.add_player(game_activity.name, self.member_id)
+
         # Retrieve what we were previously working with.
         prev_game_stats = self.game_dict[game_activity.name]
 
         if start_date is not None:
-            prev_start_day = prev_game_stats.date_last_played.day
-            if start_date.day > prev_start_day:
-                prev_game_stats.days_launched += 1
+            # Counted by the day of the guild's calendar the game started on.
+            prev_game_stats.index_last_day(self.timezone)
+            prev_game_stats.record_day(day_ordinal(start_date, self.timezone))
             prev_game_stats.date_last_played = start_date
             prev_game_stats.times_launched += 1
+            if self._rank_index is not None:
+                self._rank_index.update(prev_game_stats,
+                                        prev_game_stats.times_launched - 1)
         elif end_date is not None:
             # Merely update the time last played.
             # No need to update times launched
@@ -247,9 +591,17 @@ class MemberStatsPack():
             pass
 
         # Update games being processed.
+        self.touch()
         self.update_most_launched()
         self.update_least_launched(givenMin=prev_game_stats.times_launched)
 
+    @property
+    def rank_index(self) -> LaunchRankIndex:
+        """ The launch rank index, built the first time it is asked for. """
+        if self._rank_index is None:
+            self._rank_index = LaunchRankIndex(self.game_dict)
+        return self._rank_index
+
     def update_most_launched(self):
         """ Updates the most launched game.
 
@@ -258,53 +610,85 @@ class MemberStatsPack():
             found in the dictionary should two games have the same
             amount of times launched.
         """
-        max = 0
-        curr_game = None
-        most_launched = None
-
-        for game_name in self.game_dict:
-            curr_game = self.game_dict[game_name]
-            if curr_game.times_launched >= max:
-                max = curr_game.times_launched
-                most_launched = curr_game
-
-        self.most_launched_game = most_launched
+        self.most_launched_game = self.rank_index.most_launched()
 
     def update_least_launched(self, *, givenMin):
         """ Updates the least launched game.
                 Parameters:
                     givenMin: The given min to establish a baseline.
                               to create a new least launched game.
+                              The rank index always knows the true
+                              minimum, so this is kept for callers only.
 
             Tracks the time launched to determine when the least launched
             game should be updated. The game returned is the last one
             found in the dictionary should two games have the same
             amount of times launched.
         """
-        if self.least_launched_game is not None:
-            min = self.least_launched_game.times_launched
-        else:
-            min = givenMin
+        self.least_launched_game = self.rank_index.least_launched()
 
-        curr_game = None
-        least_launched = None
+    def add_playtime(self, game_name: str, start_ts: int, end_ts: int,
+                     credited: int = 0, new_session: bool = True):
+        """ Credit a stretch of play to a game and the running totals.
 
-        for game_name in self.game_dict:
-            curr_game = self.game_dict[game_name]
-            if curr_game.times_launched <= min:
-                min = curr_game.times_launched
-                least_launched = curr_game
-
-        self.least_launched_game = least_launched
+            Parameters:
+                game_name:   A game in the member's game dictionary.
+                start_ts:    When the stretch started (UTC seconds).
+                end_ts:      When the stretch ended (UTC seconds).
+                credited:    Seconds of the same session credited by
+                             earlier stretches, for the longest session.
+                new_session: If the stretch starts a new session.
+        """
+        seconds = max(0, end_ts - start_ts)
+        game = self.game_dict[game_name]
+        self.touch()
+        game.total_playtime += seconds
+        self.total_playtime += seconds
+        if new_session:
+            game.sessions += 1
+
+        session_length = credited + seconds
+        if session_length > game.longest_session:
+            game.longest_session = session_length
+        if session_length > self.longest_session:
+            self.longest_session = session_length
+
+        if self.playtime is None:
+            self.playtime = PlaytimeWindow(start_ts // SECONDS_PER_DAY)
+        self.playtime.add(start_ts, end_ts)
+
+    def recent_playtime(self, now: datetime = None) -> tuple:
+        """ Returns the seconds played in the last 7 and 30 days. """
+        if self.playtime is None:
+            return 0, 0
+        if now is None:
+            now = datetime.utcnow()
+        return self.playtime.totals(_to_timestamp(now))
+
+    def top_launched(self, k: int) -> list:
+        """ Returns up to k games, the most launched first.
+            Ties are ordered the same way as the most launched game.
+        """
+        return self.rank_index.top(k)
 
+    def bottom_launched(self, k: int) -> list:
+        """ Returns up to k games, the least launched first.
+            Ties are ordered the same way as the least launched game.
+        """
+        return self.rank_index.bottom(k)
 
     @classmethod
     def json_encoder(cls, obj):
         """ Helper function to decode all the goods in our stats pack.
 
-            The class itself can use it's dictionary dunder method, but
-            datetime objects cannot be as easily encoded, so they are encoded
-            as strings.
+            The classes use __slots__, so each one is turned into a dict
+            explicitly and tagged with its type for the decoder. Datetime
+            objects cannot be as easily encoded, so they are encoded as
+            strings.
+
+            The most, least, and last launched games are always entries of
+            the game dictionary, so they are written as the game's key
+            rather than as another copy of the game.
 
             Parameters:
                 Obj: The object that will be encoded.
@@ -313,8 +697,19 @@ class MemberStatsPack():
          """
         if isinstance(obj, datetime):
              return obj.__str__()
+        elif isinstance(obj, GameStats):
+            return obj.to_json()
+        elif isinstance(obj, MemberStatsPack):
+            # The rank index is rebuilt from the game dict when needed.
+            return {STATS_PACK_TAG: True,
+                    "__version__": FORMAT_VERSION,
+                    "most_launched_game": _game_key(obj.most_launched_game),
+                    "least_launched_game": _game_key(obj.least_launched_game),
+                    "last_launched_game": _game_key(obj.last_launched_game),
+                    "playtime": None if obj.playtime is None else obj.playtime.to_json(),
+                    "game_dict": obj.game_dict}
         else:
-            return obj.__dict__
+            raise TypeError(f"{type(obj).__name__} is not JSON serializable")
 
     @classmethod
     def json_decoder(cls, dict):
@@ -322,25 +717,36 @@ class MemberStatsPack():
 
             Returns none, if the dictionary is empty, has no entires,
             or is not a MemberStatsPack.
+
+            Both layouts are understood: version 2 stores the most, least,
+            and last games as keys into the game dictionary, while the
+            original layout stored full copies. Either way the restored
+            stats pack points at the game dictionary's own entries.
         """
         if (dict is not None and len(dict) > 0 and
-                "__MemberStatsPack__" in dict):
+                STATS_PACK_TAG in dict):
             decode_game = GameStats.decode_game
 
-            most_launched  = decode_game(dict["most_launched_game"])
-            least_launched = decode_game(dict["least_launched_game"])
-            last_launched  = decode_game(dict["last_launched_game"])
-
             json_game_dict = dict["game_dict"]
             restored_game_list = {}
 
             for game_key in json_game_dict:
                 decoded_game = decode_game(json_game_dict[game_key])
-                restored_game_list[game_key] = decoded_game
-
-            return MemberStatsPack(most_launched=most_launched,
-                                   least_launched=least_launched,
-                                   last_game=last_launched,
-                                   restored_game_list=restored_game_list)
+                restored_game_list[decoded_game.name] = decoded_game
+
+            def resolve(entry):
+                if entry is None:
+                    return None
+                if isinstance(entry, str):
+                    return restored_game_list.get(entry)
+                # Original layout: a full copy of the game.
+                game = restored_game_list.get(entry.get("name"))
+                return game if game is not None else decode_game(entry)
+
+            return MemberStatsPack(most_launched=resolve(dict["most_launched_game"]),
+                                   least_launched=resolve(dict["least_launched_game"]),
+                                   last_game=resolve(dict["last_launched_game"]),
+                                   restored_game_list=restored_game_list,
+                                   playtime=PlaytimeWindow.from_json(dict.get("playtime")))
         else:
-            return None
\ No newline at end of file
+            return None
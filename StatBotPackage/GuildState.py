@@ -0,0 +1,378 @@
+""" Per guild state for the stats bot.
+
+    Every guild the bot is in gets its own GuildState: its registered
+    users, its game registry, its alert channel, and its own persistence
+    shard (storage, journal and write-behind recorder) and settings,
+    such as the timezone its days are counted in. Guilds share nothing,
+    so one process can serve many guilds, and guilds can be moved
+    between processes by moving their shard files.
+"""
+
+# Standard Library Imports
+import json
+import logging
+import os
+from datetime import datetime
+from functools import partial
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    # Python < 3.9: every guild counts days in UTC.
+    ZoneInfo = None
+
+# Third party Imports
+import discord
+
+# Local Module imports
+from StatBotPackage.GuildMemberStats import GameStats, MemberStatsPack, _to_timestamp, day_ordinal
+from StatBotPackage.GameRegistry import GameRegistry
+from StatBotPackage.Playtime import SessionTracker
+from StatBotPackage.Storage.EventJournal import EventJournal, JournalEvent
+from StatBotPackage.Storage.LaunchHistory import LAUNCH, SESSION, LaunchHistory
+from StatBotPackage.Storage.LazyMembers import LazyMembers
+from StatBotPackage.Storage.SnapshotFile import load_snapshot, write_snapshot
+from StatBotPackage.Storage.WriteBehind import WriteBehindRecorder
+
+logger = logging.getLogger(__name__)
+
+def load_timezone(name: str):
+    """ Returns the tzinfo of an IANA timezone name e.g. Europe/Berlin,
+        or None for UTC.
+
+        Raises ValueError if the timezone is unknown or timezones are not
+        supported by this version of python.
+    """
+    if name is None or name.upper() == "UTC":
+        return None
+    if ZoneInfo is None:
+        raise ValueError("Timezones need python 3.9 or greater.")
+    try:
+        return ZoneInfo(name)
+    except (KeyError, ValueError, OSError):
+        raise ValueError(f"Unknown timezone {name}")
+
+def shard_path(base_path: str, guild_id: int) -> str:
+    """ Returns the guild's own file for a configured path,
+        e.g. stats.json becomes stats.<guild id>.json
+    """
+    root, extension = os.path.splitext(base_path)
+    return f"{root}.{guild_id}{extension}"
+
+
+def adopt_legacy_files(base_path: str, guild_path: str, suffixes):
+    """ Move files written before the bot kept a shard per guild over to
+        the guild's shard, unless the shard already has its own copy.
+
+        Parameters:
+            base_path:  The configured path e.g. JSON_FILE.
+            guild_path: The guild's shard of that path.
+            suffixes:   Suffixes of the companion files to move as well
+                        e.g. older generations or the journal.
+    """
+    for suffix in suffixes:
+        legacy = base_path + suffix
+        target = guild_path + suffix
+        if os.path.exists(legacy) and not os.path.exists(target):
+            os.replace(legacy, target)
+            logger.info(f"Adopted {legacy} as {target}")
+
+
+class GuildState():
+    """ The stats and persistence of a single guild.
+
+        Attributes:
+            guild_id:         The id of the guild.
+            registered_users: User id to the user's MemberStatsPack, a
+                              LazyMembers that loads stats packs on
+                              first use.
+            game_registry:    Every game the users play, and who plays it.
+            alert_channel:    The channel marked game alerts are sent to.
+            settings:         The guild's settings, saved with set_setting.
+            timezone:         The tzinfo days are counted in, None for UTC.
+            sessions:         The games members are playing right now.
+            storage:          The guild's StatsStorage shard.
+            journal:          The guild's EventJournal.
+            history:          The guild's LaunchHistory.
+            history_built:    A future, done once the history of earlier
+                              runs is aggregated, or None before start.
+            recorder:         The guild's WriteBehindRecorder.
+    """
+
+    def __init__(self, guild_id: int, storage, journal_path: str,
+                 history_path: str, settings_path: str, *,
+                 flush_interval: float = 30.0, flush_threshold: int = 50,
+                 journal_compact_bytes: int = 1048576,
+                 default_timezone: str = None) -> None:
+        self.guild_id = guild_id
+        self.registered_users = LazyMembers()
+        self.game_registry = GameRegistry()
+        self.alert_channel = None
+
+        self._settings_path = settings_path
+        self.settings = load_snapshot(settings_path, json.loads,
+                                      generations=1) or {}
+        self.timezone = None
+        timezone_name = self.settings.get("timezone", default_timezone)
+        try:
+            self.timezone = load_timezone(timezone_name)
+        except ValueError:
+            logger.error(f"Guild {guild_id} has an unusable timezone "
+                         f"{timezone_name}, counting days in UTC.")
+        self.sessions = SessionTracker()
+
+        self.storage = storage
+        self.journal = None
+        self._journal_path = journal_path
+        self._journal_compact_bytes = journal_compact_bytes
+        self.history = LaunchHistory(history_path)
+        self.history_built = None
+
+        # Mutations only mark a member dirty, the recorder coalesces them
+        # into a single write in the background.
+        self.recorder = WriteBehindRecorder(self.flush_dirty,
+                                            interval=flush_interval,
+                                            dirty_threshold=flush_threshold)
+
+    def load(self, apply_update):
+        """ Restore the guild's users from storage and replay the journal.
+
+            Parameters:
+                apply_update: The function used to apply a launch or stop
+                              to a stats pack, with the signature of
+                              CoreFunctions.deterministic_gameupdate.
+        """
+        try:
+            registered_users = self.storage.load()
+        except OSError:
+            logger.error(f"Failed to read the stats storage of guild {self.guild_id}.")
+            registered_users = {}
+        if not isinstance(registered_users, LazyMembers):
+            registered_users = LazyMembers(registered_users)
+
+        # Members the storage did not decode yet are attached as they load.
+        registered_users.on_load = self.attach_user
+        for user_id, user in registered_users.loaded_items():
+            self.attach_user(user_id, user)
+        self.registered_users = registered_users
+
+        # Anything that happened after the last snapshot is in the journal.
+        self.journal = EventJournal(self._journal_path,
+                                    start_seq=self.storage.journal_seq)
+        self.replay_journal(apply_update)
+
+    def start(self, loop):
+        self.recorder.start(loop)
+        # The history of earlier runs is aggregated off the event loop.
+        self.history_built = loop.run_in_executor(None, self.history.build_buckets)
+
+    def close(self):
+        """ Credit the sessions still open, do a final flush, then
+            release the shard's files.
+        """
+        self.close_sessions(datetime.utcnow())
+        self.recorder.stop()
+        self.history.close()
+        self.journal.close()
+        self.storage.close()
+
+    def set_setting(self, key: str, value):
+        """ Change one of the guild's settings and save them. """
+        self.settings[key] = value
+        payload = json.dumps(self.settings, indent=2).encode("utf-8")
+        write_snapshot(self._settings_path, payload, generations=1)
+
+    def attach_user(self, user_id: int, user: MemberStatsPack):
+        """ Connect a loaded stats pack to the guild. """
+        user.attach(self.game_registry, user_id, self.timezone)
+
+    def players_of(self, game_name: str) -> frozenset:
+        """ Returns the ids of the registered users who have played a game.
+            The game registry only knows the games of loaded members, so
+            everyone is loaded the first time this is asked.
+        """
+        self.registered_users.load_all()
+        return self.game_registry.players_of(game_name)
+
+    def set_timezone(self, name: str):
+        """ Count the guild's days in a timezone from now on. Days that
+            were already counted keep the day they were counted on.
+
+            Raises ValueError if the timezone is unknown.
+        """
+        self.timezone = load_timezone(name)
+        self.set_setting("timezone", name)
+        # Members loaded later are given the timezone by attach_user.
+        for _, user in self.registered_users.loaded_items():
+            user.timezone = self.timezone
+
+    def today(self) -> int:
+        """ Today's day ordinal in the guild's timezone. """
+        return day_ordinal(datetime.utcnow(), self.timezone)
+
+    def refresh_alert_channel(self, guild: discord.Guild):
+        """ Cache the channel marked game alerts go to. The first text
+            channel is used, but this can be sent to general chat etc.
+        """
+        channels = guild.text_channels
+        self.alert_channel = channels[0] if len(channels) > 0 else None
+
+    def mark_dirty(self, user_id: int, game_name: str = None):
+        """ Note that a user's stats need to be saved. The write itself
+            happens later in the background.
+        """
+        self.recorder.mark_dirty(user_id, game_name)
+
+    def record_event(self, kind: str, user_id: int, game=None,
+                     timestamp: datetime = None):
+        """ Journal a change that was just applied to a user's stats, and
+            mark the user for the next snapshot.
+
+            Parameters:
+                kind:      The kind of journal event e.g. start or mark.
+                user_id:   The id of the user that changed.
+                game:      The discord game or GameStats that changed.
+                timestamp: The date the change applies to. Start events
+                           default to the game's start time.
+        """
+        game_name = None
+        game_start = None
+        if game is not None:
+            game_name = game.name
+            game_start = getattr(game, "start", None)
+            if kind == "start" and timestamp is None:
+                timestamp = game_start
+
+        self.journal.append(kind, user_id, game_name, timestamp, game_start)
+        self.mark_dirty(user_id, game_name)
+
+        if self.journal.size >= self._journal_compact_bytes:
+            self.recorder.request_flush()
+
+    def update_session(self, kind: str, user_id: int, game_name: str,
+                       timestamp: datetime, seq: int = None):
+        """ Open, resume or close a member's game session for a start,
+            resume or end event. seq is the journal entry of a replayed
+            event, so the history can skip rows it already holds.
+        """
+        timestamp = _to_timestamp(timestamp)
+        if timestamp is None:
+            return
+        if kind == "start":
+            self.sessions.open(user_id, game_name, timestamp)
+            self.history.record(user_id, game_name, timestamp, LAUNCH, seq=seq)
+        elif kind == "resume":
+            self.sessions.resume(user_id, game_name, timestamp)
+        elif kind == "end":
+            played = self.sessions.close(user_id, game_name, timestamp,
+                                         self.registered_users.get(user_id))
+            if played is not None:
+                start, seconds = played
+                self.history.record(user_id, game_name, start, SESSION, seconds,
+                                    seq=seq)
+                self.mark_dirty(user_id, game_name)
+
+    def resume_sessions(self, guild: discord.Guild):
+        """ Open sessions for the members already playing a game when
+            the guild's state is loaded. Play up to the last shutdown was
+            credited then, so these continue from now.
+        """
+        now = datetime.utcnow()
+        for user_id in self.registered_users:
+            member = guild.get_member(user_id)
+            activity = None if member is None else member.activity
+            # Only members playing right now need their stats loaded.
+            if (user_id not in self.sessions and activity is not None
+                    and activity.type == discord.ActivityType.playing
+                    and self.registered_users[user_id].previously_played(activity.name)):
+                self.update_session("resume", user_id, activity.name, now)
+
+    def close_sessions(self, end_date: datetime):
+        """ Close and credit every open session e.g. on shutdown. """
+        for user_id, session in self.sessions.items():
+            self.update_session("end", user_id, session.game_name, end_date)
+
+    def replay_journal(self, apply_update):
+        """ Re-apply the journal entries that are newer than the snapshot
+            that was just loaded.
+        """
+        replayed = 0
+        for event in self.journal.read(after_seq=self.storage.journal_seq):
+            self.replay_event(event, apply_update)
+            replayed += 1
+        if replayed > 0:
+            logger.info(f"Replayed {replayed} journal events for guild {self.guild_id}")
+
+    def replay_event(self, event: JournalEvent, apply_update):
+        """ Apply a single journal event to the registered users.
+            The user is marked dirty so that the next snapshot contains
+            the change before the journal entry is compacted away.
+        """
+        user_id = event.user_id
+        user = self.registered_users.get(user_id)
+
+        if event.kind == "register":
+            if user is None:
+                self.add_user(user_id)
+        elif event.kind == "deregister":
+            self.remove_user(user_id)
+        elif user is None:
+            return
+        elif event.kind in ("mark", "unmark"):
+            if user.previously_played(event.game_name):
+                user.set_marked(event.game_name, event.kind == "mark")
+        elif event.kind == "resume":
+            self.update_session("resume", user_id, event.game_name,
+                                GameStats.decode_date(event.timestamp), event.seq)
+        else:
+            decode_date = GameStats.decode_date
+            timestamp = decode_date(event.timestamp)
+            game = discord.Game(name=event.game_name)
+            if event.kind == "start":
+                apply_update(user, game, start_date=timestamp,
+                             game_start=decode_date(event.game_start))
+            else:
+                apply_update(user, game, end_date=timestamp,
+                             game_start=decode_date(event.game_start))
+            self.update_session(event.kind, user_id, event.game_name, timestamp,
+                                event.seq)
+
+        self.mark_dirty(user_id, event.game_name)
+
+    def add_user(self, user_id: int) -> MemberStatsPack:
+        """ Create a registered user's stats pack. """
+        user = MemberStatsPack()
+        user.attach(self.game_registry, user_id, self.timezone)
+        self.registered_users[user_id] = user
+        return user
+
+    def remove_user(self, user_id: int):
+        """ Drop a user's stats pack. """
+        user = self.registered_users.pop(user_id, None)
+        self.sessions.forget(user_id)
+        self.history.forget_member(user_id)
+        if user is not None:
+            user.detach()
+
+    def flush_dirty(self, dirty: dict):
+        """ Flush callback for the write-behind recorder.
+            The snapshot records how far into the journal it goes, and
+            once it is safely written the journal up to that point is
+            compacted away.
+        """
+        logger.debug(f"Attempting to record guild {self.guild_id} to storage")
+        journal_seq, journal_offset = self.journal.checkpoint()
+        writer = self.storage.prepare_write(self.registered_users, dirty,
+                                            journal_seq)
+        history_writer = self.history.prepare_write(journal_seq)
+        return partial(self.write_and_compact, writer, history_writer,
+                       journal_offset)
+
+    def write_and_compact(self, writer, history_writer,
+                          journal_offset: int) -> int:
+        # The history goes first: once the snapshot is written the journal
+        # entries its rows come from are compacted away. If the snapshot
+        # fails, the history knows which replayed rows it already holds.
+        written = history_writer()
+        written += writer()
+        self.journal.compact(journal_offset)
+        return written
@@ -0,0 +1,113 @@
+# Standard Library imports
+from __future__ import annotations
+from array import array
+from bisect import bisect_left
+
+# Keys pack the launch count and the insertion order into one integer:
+# count in the high bits, order in the low 32 bits.
+_ORDER_BITS = 32
+_ORDER_MASK = (1 << _ORDER_BITS) - 1
+
+class LaunchRankIndex():
+    """ Keeps a member's games ranked by the number of times they were
+        launched, so that the most and least launched games can be found
+        without scanning the whole game dictionary.
+
+        The games are kept in one list sorted by launch count, and within
+        a count by the order they were added to the dictionary. Next to it
+        is an array of 64 bit keys packing the two, sorted the same way,
+        which is bisected to find a count's games. Nothing is kept on the
+        games themselves, and the index costs a list slot and a key per
+        game.
+
+        Ties are broken the same way a scan of the game dictionary does:
+        the game found last i.e. added to the dictionary last, wins.
+    """
+    __slots__ = ("_game_dict", "_ranked", "_keys", "_next_order")
+
+    def __init__(self, game_dict: dict) -> None:
+        """ Parameters:
+                game_dict: The member's dictionary of name to GameStats,
+                           indexed in its iteration order.
+        """
+        self._game_dict = game_dict
+        ranked = sorted(enumerate(game_dict.values()),
+                        key=lambda entry: (entry[1].times_launched, entry[0]))
+        self._ranked = [game for _, game in ranked]
+        self._keys = array("q", (self._key(game.times_launched, order)
+                                 for order, game in ranked))
+        self._next_order = len(ranked)
+
+    def __len__(self) -> int:
+        return len(self._ranked)
+
+    @staticmethod
+    def _key(count: int, order: int) -> int:
+        return (count << _ORDER_BITS) | order
+
+    def _count_range(self, count: int) -> tuple:
+        """ Returns the slice of the ranked list holding a count's games. """
+        keys = self._keys
+        return (bisect_left(keys, count << _ORDER_BITS),
+                bisect_left(keys, (count + 1) << _ORDER_BITS))
+
+    def _insert(self, game: GameStats, order: int):
+        key = self._key(game.times_launched, order)
+        position = bisect_left(self._keys, key)
+        self._keys.insert(position, key)
+        self._ranked.insert(position, game)
+
+    def add(self, game: GameStats):
+        """ Index a game that was just added to the game dictionary. """
+        if len(self._ranked) >= len(self._game_dict):
+            # The game replaced one of the same name, in its place.
+            self.__init__(self._game_dict)
+        else:
+            self._insert(game, self._next_order)
+            self._next_order += 1
+
+    def update(self, game: GameStats, previous: int):
+        """ Re-rank a game after its times launched has changed.
+
+            Parameters:
+                game:     The game, with its new times launched.
+                previous: Its times launched before the change.
+        """
+        start, end = self._count_range(previous)
+        try:
+            position = self._ranked.index(game, start, end)
+        except ValueError:
+            # Not where its previous count puts it, start over.
+            self.__init__(self._game_dict)
+            return
+        order = self._keys[position] & _ORDER_MASK
+        del self._keys[position]
+        del self._ranked[position]
+        self._insert(game, order)
+
+    def most_launched(self) -> GameStats:
+        """ Returns the most launched game, or None if there are no games. """
+        return self._ranked[-1] if self._ranked else None
+
+    def least_launched(self) -> GameStats:
+        """ Returns the least launched game, or None if there are no games. """
+        if not self._ranked:
+            return None
+        _, end = self._count_range(self._keys[0] >> _ORDER_BITS)
+        return self._ranked[end - 1]
+
+    def top(self, k: int) -> list:
+        """ Returns up to k games, most launched first. """
+        ranked = self._ranked
+        return ranked[max(len(ranked) - k, 0):][::-1]
+
+    def bottom(self, k: int) -> list:
+        """ Returns up to k games, least launched first. """
+        result = []
+        start = 0
+        # Counts in increasing order, each count's games last added first.
+        while len(result) < k and start < len(self._ranked):
+            _, end = self._count_range(self._keys[start] >> _ORDER_BITS)
+            result.extend(reversed(self._ranked[start:end]))
+            start = end
+        return result[:k]
@@ -0,0 +1,329 @@
+""" Counters and histograms for the bot, served as text over HTTP.
+
+    One MetricsRegistry is shared by every cog of a bot. Hot paths only
+    add to a counter or a histogram bucket they already hold, which is a
+    dictionary lookup and an addition. Components that keep their own
+    counters, like the presence pipeline or the write-behind recorder,
+    are not touched at all: the registry reads them through a collector
+    when the metrics are scraped.
+
+    The text follows the Prometheus exposition format, so the endpoint
+    can be scraped by Prometheus or read with curl.
+"""
+
+# Standard Library Imports
+import asyncio
+import logging
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the default histogram buckets.
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# The content type of the text exposition format.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def metrics_for(bot) -> "MetricsRegistry":
+    """ Returns the bot's metrics registry, creating it the first time a
+        cog asks for it.
+    """
+    registry = getattr(bot, "metrics", None)
+    if registry is None:
+        registry = bot.metrics = MetricsRegistry()
+    return registry
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(pairs) + "}"
+
+
+def _escape(value) -> str:
+    return (str(value).replace("\\", "\\\\").replace("\n", "\\n")
+            .replace('"', '\\"'))
+
+
+class Counter():
+    """ A value that only goes up, kept per combination of label values.
+
+        Attributes:
+            name:   The metric's name.
+            help:   One line describing it.
+            labels: The names of its labels.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}  # Key: Tuple of label values; Value: The count
+
+    def inc(self, amount: float = 1, labels: tuple = ()):
+        values = self._values
+        values[labels] = values.get(labels, 0) + amount
+
+    def value(self, labels: tuple = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def items(self) -> list:
+        return list(self._values.items())
+
+    def render(self) -> list:
+        return [f"{self.name}{_format_labels(self.labels, label_values)} "
+                f"{_format_value(value)}"
+                for label_values, value in self._values.items()]
+
+
+class _HistogramSeries():
+    """ The buckets of a histogram for one combination of label values. """
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets: int) -> None:
+        # One more than the buckets, for values above the last bound.
+        self.counts = [0] * (buckets + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram():
+    """ Observations counted into fixed buckets, kept per combination of
+        label values. Observing finds the bucket by bisection, and the
+        buckets are only made cumulative when they are rendered.
+
+        Attributes:
+            name:    The metric's name.
+            help:    One line describing it.
+            labels:  The names of its labels.
+            buckets: The upper bounds of the buckets, in increasing order.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (),
+                 buckets: tuple = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # Key: Tuple of label values; Value: _HistogramSeries
+
+    def observe(self, value: float, labels: tuple = ()):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = _HistogramSeries(len(self.buckets))
+        series.counts[bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def summary(self, labels: tuple = ()) -> dict:
+        """ Returns the count, sum and mean of one series. """
+        series = self._series.get(labels)
+        if series is None:
+            return {"count": 0, "sum": 0.0, "mean": 0.0}
+        return {"count": series.count, "sum": series.sum,
+                "mean": series.sum / series.count}
+
+    def quantile(self, fraction: float, labels: tuple = ()) -> float:
+        """ Returns the upper bound of the bucket the given fraction of
+            the observations fall in, or 0 if there are none.
+        """
+        series = self._series.get(labels)
+        if series is None or series.count == 0:
+            return 0.0
+        rank = fraction * series.count
+        seen = 0
+        for index, count in enumerate(series.counts):
+            seen += count
+            if seen >= rank:
+                break
+        if index < len(self.buckets):
+            return self.buckets[index]
+        return float("inf")
+
+    def label_values(self) -> list:
+        """ Returns the tuples of label values observed so far. """
+        return list(self._series)
+
+    def render(self) -> list:
+        lines = []
+        for label_values, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series.counts):
+                cumulative += count
+                le = 'le="' + _format_value(float(bound)) + '"'
+                lines.append(f"{self.name}_bucket"
+                             f"{_format_labels(self.labels, label_values, le)} "
+                             f"{cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series.sum)}")
+            lines.append(f"{self.name}_count{labels} {series.count}")
+        return lines
+
+
+class Collected():
+    """ A metric read from somewhere else when it is rendered.
+
+        Attributes:
+            name:   The metric's name.
+            help:   One line describing it.
+            kind:   "counter" or "gauge".
+            labels: The names of its labels.
+            read:   Returns the value, or a dictionary of tuples of label
+                    values to values.
+    """
+
+    def __init__(self, name: str, help: str, kind: str, read,
+                 labels: tuple = ()) -> None:
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.read = read
+        self.labels = tuple(labels)
+
+    def render(self) -> list:
+        values = self.read()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [f"{self.name}{_format_labels(self.labels, label_values)} "
+                f"{_format_value(value)}"
+                for label_values, value in values.items()
+                if value is not None]
+
+
+class MetricsRegistry():
+    """ The metrics of a bot, by name. """
+
+    def __init__(self) -> None:
+        self._metrics = {}  # Key: Metric name; Value: The metric
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._metrics
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def _add(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            if type(existing) is not type(metric):
+                raise ValueError(f"{metric.name} is already a {existing.kind}")
+            if isinstance(metric, Collected):
+                # A reloaded cog reads from its new components.
+                existing.read = metric.read
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        """ Returns the counter with this name, creating it if needed. """
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: tuple = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        """ Returns the histogram with this name, creating it if needed. """
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def collect(self, name: str, help: str, kind: str, read,
+                labels: tuple = ()) -> Collected:
+        """ Adds a metric that is read by calling read() when rendered. """
+        return self._add(Collected(name, help, kind, read, labels))
+
+    def remove(self, name: str):
+        self._metrics.pop(name, None)
+
+    def render(self) -> str:
+        """ Returns every metric in the text exposition format. """
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                samples = metric.render()
+            except Exception:
+                logger.exception(f"Failed to read metric {metric.name}.")
+                continue
+            lines.append(f"# HELP {metric.name} {_escape(metric.help)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer():
+    """ Serves a registry's metrics over HTTP at /metrics.
+
+        Only GET is understood and every connection serves one request,
+        which is all a scraper needs; anything else gets a 404 or 405.
+
+        Attributes:
+            host:    The address listened on.
+            port:    The port listened on.
+            scrapes: Requests for the metrics served.
+    """
+
+    def __init__(self, registry: MetricsRegistry, host: str = "127.0.0.1",
+                 port: int = 9100, *, timeout: float = 5.0) -> None:
+        """ Parameters:
+                registry: The metrics to serve.
+                host:     The address to listen on.
+                port:     The port to listen on; 0 picks a free one.
+                timeout:  Seconds a client has to send its request.
+        """
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.scrapes = 0
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host,
+                                                  self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def _handle(self, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), self.timeout)
+            # Read past the headers; none of them matter here.
+            while True:
+                header = await asyncio.wait_for(reader.readline(), self.timeout)
+                if header in (b"\r\n", b"\n", b""):
+                    break
+
+            parts = request.split()
+            path = parts[1].split(b"?")[0] if len(parts) > 1 else b""
+            if not parts or parts[0] != b"GET":
+                status, body = "405 Method Not Allowed", b""
+            elif path in (b"/metrics", b"/"):
+                status, body = "200 OK", self.registry.render().encode("utf-8")
+                self.scrapes += 1
+            else:
+                status, body = "404 Not Found", b""
+
+            writer.write((f"HTTP/1.1 {status}\r\n"
+                          f"Content-Type: {CONTENT_TYPE}\r\n"
+                          f"Content-Length: {len(body)}\r\n"
+                          f"Connection: close\r\n\r\n").encode("ascii") + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
@@ -0,0 +1,187 @@
+# Standard Library imports
+from __future__ import annotations
+from array import array
+
+# Playtime is kept per day, for this many days back.
+WINDOW_DAYS = 30
+SECONDS_PER_DAY = 86400
+
+def format_duration(seconds: int) -> str:
+    """ Returns a duration as e.g. 3h 25m """
+    hours, remainder = divmod(int(seconds), 3600)
+    minutes = remainder // 60
+    if hours > 0:
+        return f"{hours}h {minutes}m"
+    return f"{minutes}m"
+
+
+class PlaytimeWindow():
+    """ A member's playtime over the last 30 days, kept as a ring of one
+        bucket per day with running totals for the last 7 and 30 days.
+
+        Adding playtime and reading the totals are O(1): when the day
+        rolls over, only the buckets that fall out of the window are
+        subtracted from the totals, so no history is ever rescanned.
+
+        Attributes:
+            day:          The newest day in the window, as days since
+                          the epoch (UTC).
+            buckets:      Seconds played per day, indexed by day % 30.
+            last_7_days:  Seconds played in the 7 days up to day.
+            last_30_days: Seconds played in the 30 days up to day.
+    """
+    __slots__ = ("day", "buckets", "last_7_days", "last_30_days")
+
+    def __init__(self, day: int = 0, buckets=None) -> None:
+        self.day = day
+        self.buckets = array("q", buckets or bytes(8 * WINDOW_DAYS))
+        self.last_30_days = sum(self.buckets)
+        self.last_7_days = sum(self.buckets[(day - offset) % WINDOW_DAYS]
+                               for offset in range(7))
+
+    def advance(self, day: int):
+        """ Move the window forward so that day is the newest day. """
+        if day <= self.day:
+            return
+        if day - self.day >= WINDOW_DAYS:
+            self.buckets = array("q", bytes(8 * WINDOW_DAYS))
+            self.last_7_days = 0
+            self.last_30_days = 0
+        else:
+            buckets = self.buckets
+            for new_day in range(self.day + 1, day + 1):
+                self.last_7_days -= buckets[(new_day - 7) % WINDOW_DAYS]
+                self.last_30_days -= buckets[new_day % WINDOW_DAYS]
+                buckets[new_day % WINDOW_DAYS] = 0
+        self.day = day
+
+    def add(self, start_ts: int, end_ts: int):
+        """ Add the seconds between two timestamps, split across the days
+            they fall on. Days older than the window are ignored.
+        """
+        while start_ts < end_ts:
+            day = start_ts // SECONDS_PER_DAY
+            day_end = min(end_ts, (day + 1) * SECONDS_PER_DAY)
+            seconds = day_end - start_ts
+            start_ts = day_end
+
+            self.advance(day)
+            if day <= self.day - WINDOW_DAYS:
+                continue
+            self.buckets[day % WINDOW_DAYS] += seconds
+            self.last_30_days += seconds
+            if day > self.day - 7:
+                self.last_7_days += seconds
+
+    def totals(self, now_ts: int) -> tuple:
+        """ Returns the seconds played in the last 7 and 30 days. """
+        self.advance(now_ts // SECONDS_PER_DAY)
+        return self.last_7_days, self.last_30_days
+
+    def to_json(self) -> dict:
+        return {"day": self.day, "buckets": self.buckets.tolist()}
+
+    @classmethod
+    def from_json(cls, dict) -> PlaytimeWindow:
+        if dict is None:
+            return None
+        return cls(dict["day"], dict["buckets"])
+
+
+class OpenSession():
+    """ A game a member is playing right now.
+
+        Attributes:
+            game_name:     The game being played.
+            session_start: When the session started (UTC seconds).
+            segment_start: When playtime was last credited up to. A
+                           session that was resumed after a flap is
+                           credited in segments.
+            credited:      Seconds of this session already credited.
+            counted:       If the session has been counted as a session.
+    """
+    __slots__ = ("game_name", "session_start", "segment_start", "credited",
+                 "counted")
+
+    def __init__(self, game_name: str, session_start: int,
+                 segment_start: int, credited: int = 0,
+                 counted: bool = False) -> None:
+        self.game_name = game_name
+        self.session_start = session_start
+        self.segment_start = segment_start
+        self.credited = credited
+        self.counted = counted
+
+
+class SessionTracker():
+    """ The open game sessions of a guild's members, keyed by member id.
+
+        Sessions are opened when a member starts a game and closed when
+        they stop, at which point the session is credited to the
+        member's stats pack. The session that stopped last is kept per
+        member, so that a game restarted moments later (see
+        PresenceCoalescer) continues it rather than starting a new one.
+    """
+
+    def __init__(self) -> None:
+        self._open = {}     # Key: Member id; Value: OpenSession
+        self._stopped = {}  # Key: Member id; Value: The last closed OpenSession
+
+    def __len__(self) -> int:
+        return len(self._open)
+
+    def __contains__(self, member_id: int) -> bool:
+        return member_id in self._open
+
+    def get(self, member_id: int) -> OpenSession:
+        return self._open.get(member_id)
+
+    def open(self, member_id: int, game_name: str, start_ts: int):
+        """ Start a new session. A session still open for the member
+            missed its stop and is discarded rather than guessed at.
+        """
+        self._stopped.pop(member_id, None)
+        self._open[member_id] = OpenSession(game_name, start_ts, start_ts)
+
+    def resume(self, member_id: int, game_name: str, now_ts: int):
+        """ Continue the member's last session of the game from now.
+            Without one, e.g. after the bot restarted, a session is
+            opened from now that does not count as a new session.
+        """
+        stopped = self._stopped.pop(member_id, None)
+        if stopped is not None and stopped.game_name == game_name:
+            stopped.segment_start = now_ts
+            self._open[member_id] = stopped
+        else:
+            self._open[member_id] = OpenSession(game_name, now_ts, now_ts,
+                                                counted=True)
+
+    def close(self, member_id: int, game_name: str, end_ts: int, user) -> tuple:
+        """ Close the member's session of a game and credit it to their
+            MemberStatsPack.
+
+            Returns the (start, seconds) of the stretch of play credited,
+            or None if no such session was open.
+        """
+        session = self._open.get(member_id)
+        if session is None or session.game_name != game_name:
+            return None
+        del self._open[member_id]
+
+        seconds = max(0, end_ts - session.segment_start)
+        if user is not None and user.previously_played(game_name):
+            user.add_playtime(game_name, session.segment_start, end_ts,
+                              session.credited, new_session=not session.counted)
+        session.credited += seconds
+        session.counted = True
+        self._stopped[member_id] = session
+        return session.segment_start, seconds
+
+    def items(self) -> list:
+        """ Returns the (member id, OpenSession) of every open session. """
+        return list(self._open.items())
+
+    def forget(self, member_id: int):
+        """ Drop a member's sessions without crediting them. """
+        self._open.pop(member_id, None)
+        self._stopped.pop(member_id, None)
@@ -0,0 +1,368 @@
+""" The presence event pipeline.
+
+    on_member_update only captures the event and puts it on a bounded
+    queue. Worker tasks drain the queue in batches and apply the stats
+    changes, and alerts for marked games are handed to a separate, rate
+    limited sender. Under a presence storm the gateway callback stays
+    cheap: once the queue is full, new events are dropped and counted
+    instead of piling up in memory.
+
+    Before an event is queued, a coalescing stage drops repeated
+    deliveries of the same change and collapses clients that flap
+    between stopping and starting a game into a single session.
+"""
+
+# Standard Library Imports
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+
+# Third party Imports
+import discord
+
+logger = logging.getLogger(__name__)
+
+def _percentile(samples, fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(fraction * len(ordered)))
+    return ordered[index]
+
+
+def _activity_key(activity):
+    """ The part of an activity the stats care about: the name and start
+        of a game, or None for anything that is not a game.
+    """
+    if activity is None or activity.type != discord.ActivityType.playing:
+        return None
+    return (activity.name, activity.start)
+
+
+class PresenceEvent():
+    """ A presence change captured in on_member_update.
+
+        The member objects discord.py hands over are reused for later
+        updates, so the activities are copied out when the event arrives.
+
+        Attributes:
+            member:          The member after the update.
+            before_activity: The member's activity before the update.
+            after_activity:  The member's activity after the update.
+            received_at:     The UTC time the event arrived, used as the
+                             time a game was stopped.
+            received:        Monotonic arrival time, for latency metrics.
+            resumed:         True if the game started continues a session
+                             of the same game that just stopped, so it is
+                             not a new launch.
+    """
+    __slots__ = ("member", "before_activity", "after_activity",
+                 "received_at", "received", "resumed")
+
+    def __init__(self, before, after) -> None:
+        self.member = after
+        self.before_activity = before.activity
+        self.after_activity = after.activity
+        self.received_at = datetime.utcnow()
+        self.received = time.monotonic()
+        self.resumed = False
+
+    @property
+    def user_id(self) -> int:
+        return self.member.id
+
+    @property
+    def guild_id(self) -> int:
+        return self.member.guild.id
+
+
+class PipelineMetrics():
+    """ Counters for the presence pipeline.
+
+        Attributes:
+            enqueued:  Events accepted onto the queue.
+            applied:   Events applied to the stats.
+            dropped:   Events rejected because the queue was full.
+            failed:    Events whose handler raised.
+            unchanged: Events that did not change the member's game.
+            deduplicated: Repeated deliveries of the same change.
+            collapsed: Game starts folded into the session that had
+                       just stopped.
+            batches:   Batches applied.
+            max_depth: The deepest the queue has been.
+            latencies: Recent event-to-applied latencies in seconds.
+    """
+
+    def __init__(self, samples: int = 1024) -> None:
+        self.enqueued = 0
+        self.applied = 0
+        self.dropped = 0
+        self.failed = 0
+        self.unchanged = 0
+        self.deduplicated = 0
+        self.collapsed = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.latencies = deque(maxlen=samples)
+
+    def as_dict(self, depth: int = 0) -> dict:
+        return {"depth": depth,
+                "max_depth": self.max_depth,
+                "enqueued": self.enqueued,
+                "applied": self.applied,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "unchanged": self.unchanged,
+                "deduplicated": self.deduplicated,
+                "collapsed": self.collapsed,
+                "batches": self.batches,
+                "latency_p50": _percentile(self.latencies, 0.50),
+                "latency_p99": _percentile(self.latencies, 0.99)}
+
+
+class PresenceCoalescer():
+    """ Filters presence events before they are queued.
+
+        Discord repeats on_member_update for every change to a member,
+        including ones that have nothing to do with games (nicknames,
+        roles), and may deliver the same change more than once. Clients
+        that flap also stop and restart the same game within seconds.
+        Within the window the coalescer:
+
+            * drops events that do not change the member's game,
+            * drops a delivery identical to the last change admitted for
+              the member in the same guild,
+            * marks the start of a game that stopped moments ago as
+              resumed, so it counts as one session rather than a launch.
+
+        Events are keyed by guild, member, and the game's name and start
+        time. Guilds keep separate stats, so the same change delivered
+        for two guilds is applied once to each of them.
+    """
+
+    def __init__(self, window: float, metrics: PipelineMetrics) -> None:
+        """ Parameters:
+                window:  Seconds within which repeats are coalesced.
+                metrics: The PipelineMetrics the counters are kept in.
+        """
+        self.window = window
+        self.metrics = metrics
+        # Key: (guild id, member id); Value: (change, monotonic time)
+        self._last_change = OrderedDict()
+        # Key: (guild id, member id, game name); Value: monotonic time
+        self._stopped = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._last_change) + len(self._stopped)
+
+    def _expire(self, now: float):
+        # Both maps are kept in time order, so expired entries are in front.
+        horizon = now - self.window
+        last_change = self._last_change
+        while last_change and next(iter(last_change.values()))[1] <= horizon:
+            last_change.popitem(last=False)
+        stopped = self._stopped
+        while stopped and next(iter(stopped.values())) <= horizon:
+            stopped.popitem(last=False)
+
+    def admit(self, event: PresenceEvent) -> bool:
+        """ Returns false if the event should be dropped. """
+        before_key = _activity_key(event.before_activity)
+        after_key = _activity_key(event.after_activity)
+        if before_key == after_key:
+            self.metrics.unchanged += 1
+            return False
+
+        now = event.received
+        self._expire(now)
+
+        member_key = (event.guild_id, event.user_id)
+        change = (before_key, after_key)
+        last = self._last_change.get(member_key)
+        if last is not None and last[0] == change:
+            self.metrics.deduplicated += 1
+            return False
+        self._last_change.pop(member_key, None)
+        self._last_change[member_key] = (change, now)
+
+        if before_key is not None:
+            stopped_key = member_key + (before_key[0],)
+            self._stopped.pop(stopped_key, None)
+            self._stopped[stopped_key] = now
+
+        if after_key is not None:
+            if self._stopped.pop(member_key + (after_key[0],), None) is not None:
+                event.resumed = True
+                self.metrics.collapsed += 1
+        return True
+
+
+class PresencePipeline():
+    """ A bounded queue of presence events drained by worker tasks.
+
+        Attributes:
+            batch_size: The most events a worker applies in one go.
+            metrics:    A PipelineMetrics instance for this pipeline.
+    """
+
+    def __init__(self, apply_event, *, maxsize: int = 10000,
+                 workers: int = 1, batch_size: int = 100,
+                 coalesce_window: float = 0.0) -> None:
+        """ Parameters:
+                apply_event: Called on the event loop with each
+                             PresenceEvent, in arrival order.
+                maxsize:     How many events may wait in the queue.
+                workers:     How many worker tasks drain the queue.
+                batch_size:  The most events applied per batch.
+                coalesce_window: Seconds within which repeated and
+                             flapping events are coalesced. 0 disables
+                             coalescing.
+        """
+        self._apply_event = apply_event
+        self._maxsize = maxsize
+        self._workers = workers
+        self.batch_size = batch_size
+        self.metrics = PipelineMetrics()
+        self.coalescer = None
+        if coalesce_window > 0:
+            self.coalescer = PresenceCoalescer(coalesce_window, self.metrics)
+
+        self._queue = None
+        self._tasks = []
+
+    @property
+    def depth(self) -> int:
+        return 0 if self._queue is None else self._queue.qsize()
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """ Start the worker tasks on the given event loop. """
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self._maxsize)
+        for _ in range(self._workers):
+            self._tasks.append(loop.create_task(self._run()))
+
+    def submit(self, before, after) -> bool:
+        """ Queue a presence change without waiting.
+
+            Returns false if the event was coalesced away, or the queue was
+            full and the event was dropped.
+        """
+        event = PresenceEvent(before, after)
+        if self.coalescer is not None and not self.coalescer.admit(event):
+            return False
+
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.metrics.dropped += 1
+            return False
+
+        self.metrics.enqueued += 1
+        depth = self._queue.qsize()
+        if depth > self.metrics.max_depth:
+            self.metrics.max_depth = depth
+        return True
+
+    async def _run(self):
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            self._apply_batch(batch)
+            for _ in batch:
+                queue.task_done()
+
+    def _apply_batch(self, batch: list):
+        for event in batch:
+            try:
+                self._apply_event(event)
+            except Exception:
+                self.metrics.failed += 1
+                logger.exception("Failed to apply a presence event.")
+                continue
+            self.metrics.applied += 1
+            self.metrics.latencies.append(time.monotonic() - event.received)
+        self.metrics.batches += 1
+
+    def stop(self):
+        """ Cancel the workers and apply whatever is still queued. """
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+        if self._queue is not None:
+            remaining = []
+            while not self._queue.empty():
+                remaining.append(self._queue.get_nowait())
+            if remaining:
+                self._apply_batch(remaining)
+
+
+class AlertSender():
+    """ Sends alert messages from a queue at a limited rate, so that a
+        burst of alerts can not stall event handling or trip discord's
+        rate limits.
+
+        Attributes:
+            interval: Seconds to wait between two sends.
+            sent:     Alerts sent.
+            dropped:  Alerts dropped because the queue was full.
+            failed:   Alerts discord refused.
+    """
+
+    def __init__(self, *, rate: float = 1.0, maxsize: int = 100) -> None:
+        """ Parameters:
+                rate:    The most alerts sent per second.
+                maxsize: How many alerts may wait to be sent.
+        """
+        self.interval = 1.0 / rate
+        self._maxsize = maxsize
+        self._queue = None
+        self._task = None
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+
+    @property
+    def depth(self) -> int:
+        return 0 if self._queue is None else self._queue.qsize()
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self._maxsize)
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+
+    def send(self, channel, embed) -> bool:
+        """ Queue an embed to be sent to a channel.
+            Returns false if the alert was dropped.
+        """
+        try:
+            self._queue.put_nowait((channel, embed))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        return True
+
+    async def _run(self):
+        while True:
+            channel, embed = await self._queue.get()
+            try:
+                await channel.send(embed=embed)
+                self.sent += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("Failed to send an alert.")
+            await asyncio.sleep(self.interval)
+
+    def as_dict(self) -> dict:
+        return {"depth": self.depth, "sent": self.sent,
+                "dropped": self.dropped, "failed": self.failed}
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,244 @@
+""" Opt-in profiling of the bot's event handlers.
+
+    When profiling is turned on, StatsBot hands every cog to a
+    HandlerProfiler as it is added, which wraps the cog's listeners and
+    commands. Each wrapped handler records its calls, wall time and CPU
+    time. The CPU time only counts the handler's own steps, not the time
+    other tasks run while it awaits. A sampler thread also records the
+    event loop thread's stack every few milliseconds, tagged with the
+    handler running at the time. Those stacks are dumped in the collapsed
+    format that flamegraph.pl and speedscope read.
+
+    When profiling is off nothing is wrapped and no thread is started,
+    so it costs nothing.
+"""
+
+# Standard Library Imports
+import asyncio
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# The tag of samples taken while no profiled handler was running.
+NO_HANDLER = "(no handler)"
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)})"
+
+
+class HandlerStats():
+    """ The calls and times of one profiled handler.
+
+        Attributes:
+            calls:    Calls that finished, or raised.
+            wall:     Seconds from each call to its return, added up.
+            cpu:      CPU seconds spent in the handler's own steps,
+                      added up.
+            max_wall: The slowest call, in seconds.
+            max_cpu:  The most CPU time one call took, in seconds.
+    """
+    __slots__ = ("calls", "wall", "cpu", "max_wall", "max_cpu")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.max_wall = 0.0
+        self.max_cpu = 0.0
+
+    def add(self, wall: float, cpu: float):
+        self.calls += 1
+        self.wall += wall
+        self.cpu += cpu
+        if wall > self.max_wall:
+            self.max_wall = wall
+        if cpu > self.max_cpu:
+            self.max_cpu = cpu
+
+    def as_dict(self) -> dict:
+        calls = self.calls or 1
+        return {"calls": self.calls, "wall": self.wall, "cpu": self.cpu,
+                "mean_wall": self.wall / calls, "mean_cpu": self.cpu / calls,
+                "max_wall": self.max_wall, "max_cpu": self.max_cpu}
+
+
+class _TimedCoroutine():
+    """ Drives a handler's coroutine, adding up the CPU time of each of
+        its steps and telling the profiler which handler is running.
+    """
+    __slots__ = ("_coro", "_name", "_profiler")
+
+    def __init__(self, coro, name: str, profiler: "HandlerProfiler") -> None:
+        self._coro = coro
+        self._name = name
+        self._profiler = profiler
+
+    def __await__(self):
+        coro = self._coro
+        profiler = self._profiler
+        started = time.perf_counter()
+        cpu = 0.0
+        value = None
+        error = None
+        try:
+            while True:
+                outer = profiler.current
+                profiler.current = self._name
+                step = time.thread_time()
+                try:
+                    if error is not None:
+                        yielded = coro.throw(error)
+                    else:
+                        yielded = coro.send(value)
+                except StopIteration as stop:
+                    return stop.value
+                finally:
+                    cpu += time.thread_time() - step
+                    profiler.current = outer
+
+                try:
+                    value = yield yielded
+                    error = None
+                except BaseException as raised:
+                    value = None
+                    error = raised
+        finally:
+            profiler.record(self._name, time.perf_counter() - started, cpu)
+
+
+class HandlerProfiler():
+    """ Times the handlers of the cogs it instruments and samples the
+        event loop thread's stack.
+
+        Attributes:
+            interval: Seconds between two stack samples.
+            current:  The name of the profiled handler running right now,
+                      or None.
+            handlers: Handler name to its HandlerStats.
+            samples:  Stack samples taken.
+    """
+
+    def __init__(self, interval: float = 0.005) -> None:
+        """ Parameters:
+                interval: Seconds between two stack samples.
+        """
+        self.interval = interval
+        self.current = None
+        self.handlers = {}
+        self.samples = 0
+        self._stacks = {}  # Key: Collapsed stack; Value: Samples of it
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+        self._target = None
+
+    def record(self, name: str, wall: float, cpu: float):
+        stats = self.handlers.get(name)
+        if stats is None:
+            stats = self.handlers[name] = HandlerStats()
+        stats.add(wall, cpu)
+
+    def wrap(self, func, name: str = None):
+        """ Returns func, timed under the given name. Coroutine functions
+            stay coroutine functions, so the result can be a listener or
+            a command's callback.
+        """
+        name = name or func.__qualname__
+        profiler = self
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def timed(*args, **kwargs):
+                return await _TimedCoroutine(func(*args, **kwargs), name, profiler)
+        else:
+            @functools.wraps(func)
+            def timed(*args, **kwargs):
+                outer = profiler.current
+                profiler.current = name
+                started = time.perf_counter()
+                step = time.thread_time()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    profiler.record(name, time.perf_counter() - started,
+                                    time.thread_time() - step)
+                    profiler.current = outer
+        return timed
+
+    def instrument(self, cog):
+        """ Wrap a cog's listeners and commands. Must be called before the
+            cog is added to the bot, which registers them.
+        """
+        cog_name = type(cog).__name__
+        for _, method_name in type(cog).__cog_listeners__:
+            listener = getattr(cog, method_name)
+            setattr(cog, method_name,
+                    self.wrap(listener, f"{cog_name}.{method_name}"))
+        for command in cog.walk_commands():
+            command.callback = self.wrap(command.callback,
+                                         f"!{command.qualified_name}")
+
+    def start(self, thread_id: int = None):
+        """ Start sampling a thread's stack, by default the calling one,
+            which should be the event loop's.
+        """
+        if self._thread is not None:
+            return
+        self._target = thread_id or threading.get_ident()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._sample_loop,
+                                        name="handler-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"Sampling stacks every {self.interval * 1e3:.1f}ms")
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def sampling(self) -> bool:
+        return self._thread is not None
+
+    def _sample_loop(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            names.append(self.current or NO_HANDLER)
+            stack = ";".join(reversed(names))
+            with self._lock:
+                self._stacks[stack] = self._stacks.get(stack, 0) + 1
+                self.samples += 1
+
+    def collapsed(self) -> str:
+        """ Returns the stack samples in the collapsed format: one line
+            per stack, outermost frame first, followed by its count.
+            The outermost frame is the handler that was running.
+        """
+        with self._lock:
+            stacks = sorted(self._stacks.items())
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def top(self, count: int = 10, key: str = "wall") -> list:
+        """ Returns the (name, HandlerStats) of the handlers that took the
+            most time, by "wall" or "cpu".
+        """
+        return sorted(self.handlers.items(),
+                      key=lambda item: -getattr(item[1], key))[:count]
+
+    def reset(self):
+        with self._lock:
+            self._stacks = {}
+            self.samples = 0
+        self.handlers = {}
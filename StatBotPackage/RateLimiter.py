@@ -0,0 +1,164 @@
+# Standard Library Imports
+import time
+from collections import OrderedDict
+
+def parse_policies(spec: str) -> dict:
+    """ Parses rate limit policies written as name=count/seconds pairs,
+        separated by commas e.g. "default=5/10,trend=2/30".
+
+        Returns a dictionary of policy name to RatePolicy.
+        Raises ValueError if the spec is malformed.
+    """
+    policies = {}
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, limit = entry.partition("=")
+        count, _, seconds = limit.partition("/")
+        policies[name.strip()] = RatePolicy(int(count), float(seconds))
+    return policies
+
+
+class RatePolicy():
+    """ Allows a burst of count calls, refilled evenly over seconds.
+
+        Attributes:
+            capacity: The most calls allowed at once.
+            rate:     Calls regained per second.
+    """
+    __slots__ = ("capacity", "rate")
+
+    def __init__(self, count: int, seconds: float) -> None:
+        if count <= 0 or seconds <= 0:
+            raise ValueError("A rate policy needs a positive count and period.")
+        self.capacity = float(count)
+        self.rate = count / seconds
+
+    @property
+    def refill_time(self) -> float:
+        """ Seconds for an empty bucket to fill up again. """
+        return self.capacity / self.rate
+
+
+class TokenBucket():
+    """ The tokens one key has left under one policy.
+
+        Attributes:
+            tokens:  Tokens left as of updated.
+            updated: The monotonic time tokens was last brought up to date.
+            warned:  If the key was told it is throttled since its last
+                     allowed call.
+    """
+    __slots__ = ("tokens", "updated", "warned")
+
+    def __init__(self, tokens: float, updated: float) -> None:
+        self.tokens = tokens
+        self.updated = updated
+        self.warned = False
+
+
+class RateLimiter():
+    """ Token bucket rate limiting of calls, per policy and key e.g. per
+        command and user.
+
+        Buckets are kept in least recently used order. A bucket that has
+        been idle long enough to refill completely is the same as a new
+        one, so it is evicted; past max_entries the least recently used
+        bucket is evicted regardless. Memory is bounded either way.
+
+        Time comes from a monotonic clock, so changes to the system
+        clock never lift or extend a limit.
+
+        Attributes:
+            default:    The policy for names without a policy of their own.
+            policies:   Policy name to RatePolicy.
+            allowed:    Calls allowed.
+            throttled:  Calls refused.
+            evicted:    Buckets evicted.
+            throttled_by_name: Policy name to the calls it refused.
+    """
+
+    def __init__(self, default: RatePolicy, policies: dict = None, *,
+                 max_entries: int = 10000, clock=time.monotonic) -> None:
+        """ Parameters:
+                default:     The policy used for names not in policies.
+                policies:    Policy name to RatePolicy.
+                max_entries: The most buckets kept.
+                clock:       The clock, in seconds.
+        """
+        self.default = default
+        self.policies = policies or {}
+        self._max_entries = max_entries
+        self._clock = clock
+        # Key: (policy name, key); Value: TokenBucket
+        self._buckets = OrderedDict()
+
+        self.allowed = 0
+        self.throttled = 0
+        self.evicted = 0
+        self.throttled_by_name = {}
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def policy(self, name: str) -> RatePolicy:
+        return self.policies.get(name, self.default)
+
+    def _evict(self, now: float):
+        buckets = self._buckets
+        while buckets:
+            (name, _), bucket = next(iter(buckets.items()))
+            idle = now - bucket.updated
+            if len(buckets) <= self._max_entries and idle < self.policy(name).refill_time:
+                break
+            buckets.popitem(last=False)
+            self.evicted += 1
+
+    def acquire(self, name: str, key) -> float:
+        """ Take a token from the key's bucket under the named policy.
+
+            Returns 0.0 if the call may go ahead, otherwise the seconds
+            until a token is available.
+        """
+        now = self._clock()
+        policy = self.policy(name)
+        bucket_key = (name, key)
+
+        bucket = self._buckets.pop(bucket_key, None)
+        if bucket is None:
+            bucket = TokenBucket(policy.capacity, now)
+        else:
+            bucket.tokens = min(policy.capacity,
+                                bucket.tokens + (now - bucket.updated) * policy.rate)
+            bucket.updated = now
+        self._buckets[bucket_key] = bucket
+        self._evict(now)
+
+        if bucket.tokens >= 1.0:
+            bucket.tokens -= 1.0
+            bucket.warned = False
+            self.allowed += 1
+            return 0.0
+
+        self.throttled += 1
+        self.throttled_by_name[name] = self.throttled_by_name.get(name, 0) + 1
+        return (1.0 - bucket.tokens) / policy.rate
+
+    def warn_once(self, name: str, key) -> bool:
+        """ Returns true the first time it is asked about a throttled key
+            since the key's last allowed call, so that a throttled user
+            is told once rather than on every call.
+        """
+        bucket = self._buckets.get((name, key))
+        if bucket is None or bucket.warned:
+            return False
+        bucket.warned = True
+        return True
+
+    def as_dict(self) -> dict:
+        return {"buckets": len(self._buckets),
+                "allowed": self.allowed,
+                "throttled": self.throttled,
+                "evicted": self.evicted,
+                "throttled_by_name": dict(self.throttled_by_name)}
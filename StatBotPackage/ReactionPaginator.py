@@ -0,0 +1,238 @@
+""" Paginated messages that are turned with reaction buttons.
+
+    One ReactionPaginator is shared by every cog of a bot. It has a
+    single on_raw_reaction_add listener, which finds the session of a
+    reacted message with one dictionary lookup, however many paginated
+    messages are open. Sessions time out through a timer wheel that is
+    advanced by a single task, so a button press only moves a deadline
+    and no timer is created or cancelled per session.
+"""
+
+# Standard Library Imports
+import asyncio
+import logging
+import time
+
+# Third party Imports
+import discord
+
+logger = logging.getLogger(__name__)
+
+# The buttons of a paginated message, and the page each one turns to
+# given the current page and the number of pages.
+PAGE_BUTTONS = {'⏮': lambda page_idx, total_pages: 0,
+                '⬅️': lambda page_idx, total_pages: max(page_idx - 1, 0),
+                '➡️': lambda page_idx, total_pages: min(page_idx + 1, total_pages - 1),
+                '⏭': lambda page_idx, total_pages: total_pages - 1}
+
+def paginator_for(bot) -> "ReactionPaginator":
+    """ Returns the bot's paginator, creating it and adding its listener
+        the first time a cog asks for it.
+    """
+    paginator = getattr(bot, "paginator", None)
+    if paginator is None:
+        paginator = bot.paginator = ReactionPaginator(bot)
+        bot.add_listener(paginator.on_raw_reaction_add)
+    return paginator
+
+
+class TimerWheel():
+    """ Deadlines kept in a ring of slots, one slot per tick.
+
+        A key is put in the slot of its deadline's tick. Advancing the
+        wheel only looks at the slots of the ticks that passed. Moving a
+        deadline later only updates it: when the old slot comes up, the
+        key is moved to the slot of its new deadline instead of expiring.
+        Deadlines further away than one turn of the wheel go round it
+        again the same way.
+    """
+
+    def __init__(self, *, tick: float = 1.0, slots: int = 64,
+                 clock=time.monotonic) -> None:
+        """ Parameters:
+                tick:  Seconds per slot; deadlines are this precise.
+                slots: The number of slots in the ring.
+                clock: The clock, in seconds.
+        """
+        self.tick = tick
+        self.clock = clock
+        self._slots = [set() for _ in range(slots)]
+        self._deadlines = {}  # Key: The key; Value: Its deadline
+        self._ticks = int(clock() / tick)  # The last tick advanced to.
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def __contains__(self, key) -> bool:
+        return key in self._deadlines
+
+    def _slot(self, deadline: float) -> set:
+        return self._slots[int(deadline / self.tick) % len(self._slots)]
+
+    def schedule(self, key, deadline: float):
+        """ Set the deadline of a key, adding it if need be. """
+        current = self._deadlines.get(key)
+        self._deadlines[key] = deadline
+        if current is None:
+            self._slot(deadline).add(key)
+        elif deadline < current:
+            self._slot(current).discard(key)
+            self._slot(deadline).add(key)
+
+    def cancel(self, key):
+        deadline = self._deadlines.pop(key, None)
+        if deadline is not None:
+            self._slot(deadline).discard(key)
+
+    def advance(self, now: float = None) -> list:
+        """ Returns the keys whose deadline is up, removing them. """
+        if now is None:
+            now = self.clock()
+        target = int(now / self.tick)
+        # The last tick advanced to is looked at again: a key whose
+        # deadline falls later in that tick was not due yet. After a long
+        # gap every slot is due, but only once.
+        first = max(self._ticks, target - len(self._slots) + 1)
+        self._ticks = max(self._ticks, target)
+
+        expired = []
+        for tick in range(first, target + 1):
+            slot = self._slots[tick % len(self._slots)]
+            for key in list(slot):
+                deadline = self._deadlines[key]
+                if deadline <= now:
+                    slot.discard(key)
+                    del self._deadlines[key]
+                    expired.append(key)
+                elif self._slot(deadline) is not slot:
+                    slot.discard(key)
+                    self._slot(deadline).add(key)
+        return expired
+
+
+class PaginatorSession():
+    """ A paginated message that is still taking button presses.
+
+        Attributes:
+            message:   The paginated message.
+            author_id: The id of the only user that can turn the pages.
+            pages:     A sequence of embeds. Any object with len and
+                       indexing will do, so pages can be made as they are
+                       turned to.
+            page_idx:  The page shown.
+            timeout:   Seconds the session lasts after the last press.
+            timeout_embed: Shown once the session times out, or None to
+                       leave the last page.
+    """
+    __slots__ = ("message", "author_id", "pages", "page_idx", "timeout",
+                 "timeout_embed")
+
+    def __init__(self, message: discord.Message, author_id: int, pages,
+                 timeout: float, timeout_embed: discord.Embed = None) -> None:
+        self.message = message
+        self.author_id = author_id
+        self.pages = pages
+        self.page_idx = 0
+        self.timeout = timeout
+        self.timeout_embed = timeout_embed
+
+
+class ReactionPaginator():
+    """ Serves every paginated message of a bot.
+
+        Attributes:
+            bot:     The bot.
+            wheel:   The TimerWheel the sessions time out on.
+            opened:  Sessions opened.
+            expired: Sessions timed out.
+    """
+
+    def __init__(self, bot, *, tick: float = 1.0) -> None:
+        self.bot = bot
+        self.wheel = TimerWheel(tick=tick)
+        # Key: Message id; Value: PaginatorSession
+        self._sessions = {}
+        self._task = None
+        self.opened = 0
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    async def paginate(self, destination, author_id: int, pages, *,
+                       timeout: float = 30.0,
+                       timeout_embed: discord.Embed = None) -> discord.Message:
+        """ Send the first page to a destination (e.g. a context or a
+            channel), and let the author turn the pages with reactions.
+            A single page is sent without buttons.
+
+            Returns the message sent.
+        """
+        message = await destination.send(embed=pages[0])
+        if len(pages) < 2:
+            return message
+
+        # The session is registered before the buttons are added, so that
+        # a press on the first button is not missed.
+        session = PaginatorSession(message, author_id, pages, timeout,
+                                   timeout_embed)
+        self._sessions[message.id] = session
+        self.wheel.schedule(message.id, self.wheel.clock() + timeout)
+        self.opened += 1
+        if self._task is None or self._task.done():
+            self._task = self.bot.loop.create_task(self._run())
+
+        # Setup the buttons we will be using for our message.
+        for button in PAGE_BUTTONS:
+            await message.add_reaction(button)
+        return message
+
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
+        session = self._sessions.get(payload.message_id)
+        if session is None or payload.user_id != session.author_id:
+            return
+        turn_page = PAGE_BUTTONS.get(str(payload.emoji))
+        if turn_page is None:
+            return
+
+        self.wheel.schedule(payload.message_id,
+                            self.wheel.clock() + session.timeout)
+        page_idx = turn_page(session.page_idx, len(session.pages))
+        try:
+            await session.message.remove_reaction(payload.emoji,
+                                                  discord.Object(payload.user_id))
+        except discord.HTTPException:
+            # Without the manage messages permission the button stays
+            # pressed, but the page still turns.
+            pass
+        if page_idx != session.page_idx:
+            session.page_idx = page_idx
+            await session.message.edit(embed=session.pages[page_idx])
+
+    async def _run(self):
+        while self._sessions:
+            await asyncio.sleep(self.wheel.tick)
+            for message_id in self.wheel.advance():
+                session = self._sessions.pop(message_id, None)
+                if session is not None:
+                    self.expired += 1
+                    self.bot.loop.create_task(self._close_session(session))
+
+    async def _close_session(self, session: PaginatorSession):
+        try:
+            if session.timeout_embed is not None:
+                await session.message.edit(embed=session.timeout_embed)
+            # Once the message has expired, we clear all reactions on the message.
+            await session.message.clear_reactions()
+        except discord.HTTPException:
+            logger.exception("Failed to close a paginated message.")
+
+    def close(self, message_id: int):
+        """ Stop taking button presses for a message. """
+        self._sessions.pop(message_id, None)
+        self.wheel.cancel(message_id)
+
+    def as_dict(self) -> dict:
+        return {"sessions": len(self._sessions),
+                "opened": self.opened,
+                "expired": self.expired}
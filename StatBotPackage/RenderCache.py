@@ -0,0 +1,61 @@
+# Standard Library Imports
+from collections import OrderedDict
+
+class RenderCache():
+    """ A bounded, least recently used cache of rendered output, e.g. the
+        fields of a !stats embed.
+
+        Keys carry the version of whatever was rendered (see
+        MemberStatsPack.version), so entries never need invalidating: a
+        change makes a new key, and the stale entry ages out.
+
+        Attributes:
+            hits:    Lookups answered from the cache.
+            misses:  Lookups that had to render.
+            evicted: Entries dropped to stay under max_entries.
+    """
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        """ Parameters:
+                max_entries: The most entries kept.
+        """
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return self.hits / lookups
+
+    def get(self, key, render):
+        """ Returns the entry for a key, calling render() to make it on a
+            miss.
+        """
+        entries = self._entries
+        value = entries.get(key)
+        if value is not None:
+            entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = entries[key] = render()
+        while len(entries) > self._max_entries:
+            entries.popitem(last=False)
+            self.evicted += 1
+        return value
+
+    def as_dict(self) -> dict:
+        return {"entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evicted": self.evicted,
+                "hit_rate": self.hit_rate}
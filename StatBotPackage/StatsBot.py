@@ -10,16 +10,24 @@
 
 # Standard Library Imports 
 import os
+import sys
 
 # Third party Imports
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
 
+# Local Module imports
+sys.path.append('../')
+from StatBotPackage.Profiler import HandlerProfiler
+
 # Loading environment...
 load_dotenv()
 TOKEN     = os.getenv('DISCORD_TOKEN')
-GUILD     = os.getenv('DISCORD_GUILD')
+# Set to 1 to time every cog listener and command and sample the stack
+# every PROFILE_INTERVAL seconds; see !profile.
+PROFILE_HANDLERS = os.getenv('PROFILE_HANDLERS', '0') == '1'
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))
 
 # Get permissions to see other members on the server. # had .default before
 intents_var = discord.Intents.all()
@@ -28,28 +36,65 @@ intents_var = discord.Intents.all()
 # in the event of network retries etc, that it does not load our cogs again.
 has_loaded = False
 
+class StatsBot(commands.Bot):
+    """ The bot, which also dispatches an extension_load or
+        extension_unload event whenever an extension is loaded or
+        unloaded. Cogs that cache something built from the loaded
+        commands, like the help pages, listen for these to refresh it.
+
+        Attributes:
+            profiler: A HandlerProfiler every cog is instrumented with as
+                      it is added, or None when profiling is off.
+    """
+
+    def __init__(self, *args, profiler: HandlerProfiler = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.profiler = profiler
+
+    def add_cog(self, cog: commands.Cog):
+        # Listeners and commands are registered by add_cog, so they are
+        # wrapped before.
+        if self.profiler is not None:
+            self.profiler.instrument(cog)
+        super().add_cog(cog)
+
+    def load_extension(self, name: str):
+        super().load_extension(name)
+        self._dispatch_extension("extension_load", name)
+
+    def reload_extension(self, name: str):
+        super().reload_extension(name)
+        self._dispatch_extension("extension_load", name)
+
+    def unload_extension(self, name: str):
+        super().unload_extension(name)
+        self._dispatch_extension("extension_unload", name)
+
+    def _dispatch_extension(self, event: str, name: str):
+        # Extensions are also unloaded once the bot has closed, when
+        # there is no event loop left to run the listeners on.
+        if not self.is_closed():
+            self.dispatch(event, name)
+
 # Use the ! prefix as a command instigator for this bot. 
 # Alternatively, a user can simply mention the bot. 
 # That will solve the problem if two bots on a server share the same
 # command prefix for a bot. 
-bot = commands.Bot(command_prefix=commands.when_mentioned_or('!'), 
-                   intents=intents_var, description="The Launched Stats Bot!\n"
-                   "Command me with my prefix: '!' or via @'ing me!\n"
-                   "Example: !<command> [args] or @Launched <command> [args]",
-                   help_command=None)
+bot = StatsBot(command_prefix=commands.when_mentioned_or('!'), 
+               intents=intents_var, description="The Launched Stats Bot!\n"
+               "Command me with my prefix: '!' or via @'ing me!\n"
+               "Example: !<command> [args] or @Launched <command> [args]",
+               help_command=None,
+               profiler=HandlerProfiler(PROFILE_INTERVAL) if PROFILE_HANDLERS else None)
 
 # The main function to kick off: 
 @bot.event
 async def on_ready():
-    guild = discord.utils.get(bot.guilds, name=GUILD)
-    print(
-        f'{bot.user} is connected to the following guild:\n'
-        f'{guild.name}(id: {guild.id})'
-    )
-   
-    # For debugging purposes. 
-    members = '\n - '.join([member.name for member in guild.members])
-    print(f'Guild Members:\n - {members}')
+    # The bot keeps separate stats for every guild it is in.
+    guilds = '\n - '.join([f'{guild.name}(id: {guild.id}, '
+                            f'members: {guild.member_count})'
+                            for guild in bot.guilds])
+    print(f'{bot.user} is connected to the following guilds:\n - {guilds}')
 
     # Load Cogs
     # The on ready function can be called multiple times...
@@ -62,4 +107,14 @@ async def on_ready():
         has_loaded = True
 
 # Kick start / main function
-bot.run(TOKEN)
\ No newline at end of file
+# bot.run runs the event loop on this thread, which is the one sampled.
+if bot.profiler is not None:
+    bot.profiler.start()
+bot.run(TOKEN)
+
+# bot.run only returns once the bot has closed. Unloading the extensions
+# gives each cog the chance to flush any stats it has not yet written.
+for extension in list(bot.extensions):
+    bot.unload_extension(extension)
+if bot.profiler is not None:
+    bot.profiler.stop()
\ No newline at end of file
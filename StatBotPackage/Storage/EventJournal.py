@@ -0,0 +1,197 @@
+""" Append-only journal of the events that change the stats.
+
+    Each launch, stop, mark, registration and so on is appended to the
+    journal as a single JSON line, which costs one small write no matter
+    how many members are registered. On startup the stats are rebuilt
+    from the last snapshot plus a replay of the journal entries that came
+    after it. Compaction drops the entries a snapshot already contains.
+"""
+
+# Standard Library Imports
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+class JournalEvent():
+    """ One entry of the journal.
+
+        Attributes:
+            seq:       Sequence number, increasing by one per event.
+            kind:      One of start, end, resume, mark, unmark,
+                       register, or deregister.
+            user_id:   The member the event belongs to.
+            game_name: The game the event is about, if any.
+            timestamp: The string form of the event's datetime, if any.
+            game_start: The string form of the time discord reported the
+                        game as started, used when a game is first seen.
+    """
+
+    def __init__(self, seq: int, kind: str, user_id: int,
+                 game_name: str = None, timestamp: str = None,
+                 game_start: str = None) -> None:
+        self.seq = seq
+        self.kind = kind
+        self.user_id = user_id
+        self.game_name = game_name
+        self.timestamp = timestamp
+        self.game_start = game_start
+
+    def encode(self) -> bytes:
+        entry = {"seq": self.seq, "kind": self.kind, "user": self.user_id}
+        if self.game_name is not None:
+            entry["game"] = self.game_name
+        if self.timestamp is not None:
+            entry["ts"] = self.timestamp
+        if self.game_start is not None:
+            entry["start"] = self.game_start
+        return json.dumps(entry, separators=(",", ":")).encode("utf-8") + b"\n"
+
+    @classmethod
+    def decode(cls, line: bytes) -> "JournalEvent":
+        entry = json.loads(line)
+        return cls(entry["seq"], entry["kind"], entry["user"],
+                   entry.get("game"), entry.get("ts"), entry.get("start"))
+
+
+class EventJournal():
+    """ A JSON lines journal file.
+
+        Attributes:
+            path:     The journal file.
+            last_seq: The sequence number of the newest event.
+            bytes_written: Bytes appended since the journal was opened.
+    """
+
+    def __init__(self, path: str, start_seq: int = 0) -> None:
+        """ Parameters:
+                path:      The journal file, created if missing.
+                start_seq: The sequence number already covered by the
+                           snapshot. Used when the journal is empty.
+        """
+        self.path = path
+        self.last_seq = start_seq
+        self.bytes_written = 0
+        # Appends come from the event loop, compaction from a worker thread.
+        self._lock = threading.Lock()
+
+        for event in self.read():
+            self.last_seq = max(self.last_seq, event.seq)
+
+        self._trim_torn_tail()
+        self._file = open(self.path, "ab")
+
+    def _trim_torn_tail(self):
+        """ Cut off a torn line left at the end of the file by a crash in
+            the middle of an append. Otherwise the next append would be
+            glued to it and lost as corrupt on the next replay.
+        """
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, "r+b") as journal_file:
+            end = journal_file.seek(0, os.SEEK_END)
+            keep = 0
+            position = end
+            while position > 0:
+                step = min(4096, position)
+                position -= step
+                journal_file.seek(position)
+                newline = journal_file.read(step).rfind(b"\n")
+                if newline != -1:
+                    keep = position + newline + 1
+                    break
+
+            if keep < end:
+                logger.warning(f"Cutting {end - keep} bytes of a torn journal "
+                               f"entry off {self.path}")
+                journal_file.truncate(keep)
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+
+    @property
+    def size(self) -> int:
+        """ The current size of the journal in bytes. """
+        # Compaction swaps the file out from a worker thread.
+        with self._lock:
+            return self._file.tell()
+
+    def append(self, kind: str, user_id: int, game_name: str = None,
+               timestamp=None, game_start=None) -> int:
+        """ Append an event to the journal and return its sequence number.
+
+            Parameters:
+                kind:      The kind of event, see JournalEvent.
+                user_id:   The member the event belongs to.
+                game_name: The game the event is about, if any.
+                timestamp: A datetime for the event, if any.
+                game_start: The datetime discord gave as the game's start.
+        """
+        with self._lock:
+            self.last_seq += 1
+            event = JournalEvent(self.last_seq, kind, user_id, game_name,
+                                 None if timestamp is None else str(timestamp),
+                                 None if game_start is None else str(game_start))
+            line = event.encode()
+            self._file.write(line)
+            self._file.flush()
+            self.bytes_written += len(line)
+        return event.seq
+
+    def read(self, after_seq: int = 0):
+        """ Yield the events with a sequence number above after_seq.
+
+            A torn line at the end of the file, left behind by a crash in
+            the middle of an append, is ignored.
+        """
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, "rb") as journal_file:
+            for line in journal_file:
+                if not line.endswith(b"\n"):
+                    logger.warning(f"Ignoring torn journal entry in {self.path}")
+                    break
+                try:
+                    event = JournalEvent.decode(line)
+                except (ValueError, KeyError):
+                    logger.warning(f"Ignoring corrupt journal entry in {self.path}")
+                    continue
+                if event.seq > after_seq:
+                    yield event
+
+    def checkpoint(self):
+        """ Returns the (sequence number, byte offset) of the journal's
+            current end. Pass the offset to compact once a snapshot
+            containing everything up to that sequence number is safe.
+        """
+        with self._lock:
+            return self.last_seq, self._file.tell()
+
+    def compact(self, offset: int):
+        """ Drop every entry before offset, keeping the events that were
+            appended after the checkpoint was taken.
+        """
+        temp_path = self.path + ".tmp"
+        with self._lock:
+            self._file.flush()
+            with open(self.path, "rb") as journal_file:
+                journal_file.seek(offset)
+                tail = journal_file.read()
+            # Only whole lines are kept, so appends always start a new one.
+            tail = tail[:tail.rfind(b"\n") + 1]
+
+            with open(temp_path, "wb") as temp_file:
+                temp_file.write(tail)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+
+            self._file.close()
+            os.replace(temp_path, self.path)
+            self._file = open(self.path, "ab")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
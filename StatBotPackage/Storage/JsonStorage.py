@@ -0,0 +1,159 @@
+""" The JSON storage format.
+
+    The file starts with a header line, followed by one line per member
+    holding the JSON array [user id, stats pack]. Loading only indexes
+    where each member's line is in the memory mapped file; a member is
+    decoded the first time they are used (see LazyMembers), and members
+    that were never loaded are written back as the bytes they were read
+    as.
+
+    Files from before the line format are one JSON document holding
+    every member, and are still read, one member at a time.
+"""
+
+# Standard Library Imports
+import json
+from functools import partial
+
+# Local Module imports
+from StatBotPackage.GuildMemberStats import MemberStatsPack
+from StatBotPackage.Storage.LazyMembers import UNLOADED, LazyMembers
+from StatBotPackage.Storage.StatsStorage import StatsStorage
+from StatBotPackage.Storage.SnapshotFile import load_snapshot, write_snapshot
+
+# Key of the journal watermark, stored alongside the user ids.
+JOURNAL_SEQ_KEY = "__journal_seq__"
+# Key of the header line that starts a file in the line format.
+MEMBERS_KEY = "__members__"
+
+_HEADER_START = b'{"' + MEMBERS_KEY.encode("ascii") + b'"'
+# Documents were written with indent=2, so each top level entry starts a
+# line with exactly two spaces; nested entries are indented further, and
+# strings never hold a raw newline.
+_ENTRY_START = b'\n  "'
+
+def encode_member(user_id: int, user: MemberStatsPack) -> bytes:
+    """ Returns a member's line in the line format. """
+    return json.dumps([user_id, user], separators=(",", ":"),
+                      default=MemberStatsPack.json_encoder).encode("utf-8") + b"\n"
+
+
+def iter_document(mapped, length: int):
+    """ Yields the (key, value) entries of a file from before the line
+        format one at a time, so only one member's JSON is decoded at
+        once rather than the whole document.
+
+        Documents not written with indent=2 are decoded whole.
+    """
+    start = mapped.find(_ENTRY_START, 0, length)
+    if start == -1:
+        yield from json.loads(mapped[:length]).items()
+        return
+
+    while start != -1:
+        end = mapped.find(_ENTRY_START, start + 1, length)
+        if end == -1:
+            # The last entry runs up to the document's closing brace.
+            stop = mapped.rfind(b"}", start, length)
+        else:
+            stop = end
+        entry = mapped[start:stop].rstrip().rstrip(b",")
+        yield from json.loads(b"{" + entry + b"}").items()
+        start = end
+
+
+class JsonStorage(StatsStorage):
+    """ Keeps all registered users in a single JSON file.
+
+        Any change rewrites the whole file, so dirty members are only
+        used to decide whether a write is needed at all.
+
+        Attributes:
+            path:        The JSON file.
+            generations: The amount of older snapshots that are kept.
+    """
+
+    def __init__(self, path: str, generations: int = 3) -> None:
+        self.path = path
+        self.generations = generations
+        # The file the members were loaded from, while any are unloaded.
+        self._mapped = None
+        self._lines = {}  # Key: User id; Value: (start, end) of their line
+
+    def load(self) -> LazyMembers:
+        self.close()
+        registered_users = load_snapshot(self.path, self._index,
+                                         generations=self.generations,
+                                         mapped=True)
+        if registered_users is None:
+            return LazyMembers()
+        return registered_users
+
+    def _index(self, mapped, length: int) -> LazyMembers:
+        header_end = mapped.find(b"\n", 0, length)
+        if header_end == -1:
+            header_end = length
+        if not mapped[:header_end].startswith(_HEADER_START):
+            # A file from before the line format.
+            try:
+                return self._decode_document(iter_document(mapped, length))
+            finally:
+                mapped.close()
+
+        header = json.loads(mapped[:header_end])
+        lines = {}
+        start = header_end + 1
+        while start < length:
+            end = mapped.find(b"\n", start, length)
+            if end == -1:
+                end = length
+            if end > start:
+                user_id = int(mapped[start + 1:mapped.find(b",", start, end)])
+                lines[user_id] = (start, end)
+            start = end + 1
+
+        self.journal_seq = header.get(JOURNAL_SEQ_KEY, 0)
+        self._mapped = mapped
+        self._lines = lines
+        return LazyMembers(unloaded=lines, loader=self._load_member)
+
+    def _decode_document(self, entries) -> LazyMembers:
+        self.journal_seq = 0
+        registered_users = {}
+        for key, value in entries:
+            if key == JOURNAL_SEQ_KEY:
+                self.journal_seq = value
+            else:
+                registered_users[int(key)] = MemberStatsPack.json_decoder(value)
+        return LazyMembers(registered_users)
+
+    def _load_member(self, user_id: int) -> MemberStatsPack:
+        start, end = self._lines[user_id]
+        entry = json.loads(self._mapped[start:end])
+        return MemberStatsPack.json_decoder(entry[1])
+
+    def prepare_write(self, registered_users: dict, dirty: dict,
+                      journal_seq: int = 0):
+        header = json.dumps({MEMBERS_KEY: len(registered_users),
+                             JOURNAL_SEQ_KEY: journal_seq}).encode("utf-8")
+        parts = [header + b"\n"]
+        raw_items = getattr(registered_users, "raw_items", registered_users.items)
+        for user_id, user in raw_items():
+            if user is UNLOADED:
+                # Copied from the loaded file by the writer.
+                parts.append(self._lines[user_id])
+            else:
+                parts.append(encode_member(user_id, user))
+        return partial(self._write, parts, self._mapped)
+
+    def _write(self, parts: list, mapped) -> int:
+        payload = b"".join(part if isinstance(part, bytes)
+                           else mapped[part[0]:part[1]] + b"\n"
+                           for part in parts)
+        return write_snapshot(self.path, payload, generations=self.generations)
+
+    def close(self):
+        self._lines = {}
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
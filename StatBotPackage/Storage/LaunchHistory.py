@@ -0,0 +1,468 @@
+""" Columnar history of every launch and session, for trend queries.
+
+    The history is a directory with one file per column: timestamps,
+    member ids, game ids, the kind of row, and seconds played. Each file
+    is a flat array of fixed size integers, so the rows written by
+    earlier runs are memory mapped rather than read, and startup costs
+    nothing no matter how long the history is. Game ids index games.txt,
+    which holds one game name per line.
+
+    Rows added while the bot runs are kept in arrays and written to the
+    column files by the write-behind recorder, before the snapshot. The
+    history records the last journal entry its columns hold, so rows
+    replayed from the journal after a crash are not added twice.
+
+    Launches and playtime are pre-aggregated into daily and weekly
+    buckets per member and game, so a trend reads one bucket per day or
+    week. Rows added while the bot runs go into the buckets as they are
+    recorded. The rows of earlier runs are aggregated once, in a worker
+    thread, by build_buckets.
+
+    Forgetting a member drops their buckets at once, and their rows are
+    compacted out of the column files with the next write.
+"""
+
+# Standard Library Imports
+import logging
+import mmap
+import os
+import threading
+from array import array
+from functools import partial
+
+# Local Module imports
+from StatBotPackage.Storage.SnapshotFile import (SnapshotCorruptError,
+                                                 load_snapshot, write_snapshot)
+
+logger = logging.getLogger(__name__)
+
+# The kinds of row.
+LAUNCH = 0
+SESSION = 1
+
+SECONDS_PER_DAY = 86400
+
+# Column name to array type code.
+_COLUMNS = {"ts": "q", "member": "q", "game": "i", "kind": "b", "seconds": "i"}
+
+_GAMES_FILE = "games.txt"
+# The last journal entry whose rows are in the column files.
+_SEQ_FILE = "journal_seq"
+
+# Compacted columns are written next to the columns with this suffix,
+# and only replace them once all are on disk and the marker exists.
+_COMPACT_SUFFIX = ".compact"
+_COMPACT_DONE = "compact.done"
+
+# Rows read at a time while compacting.
+_COMPACT_CHUNK = 65536
+
+def day_of(timestamp: int) -> int:
+    """ Days since the epoch (UTC) of a timestamp. """
+    return timestamp // SECONDS_PER_DAY
+
+def week_of(day: int) -> int:
+    """ Weeks since the epoch of a day, with weeks starting on Monday.
+        The epoch was a Thursday, hence the offset.
+    """
+    return (day + 3) // 7
+
+def week_start(week: int) -> int:
+    """ The day (a Monday) a week starts on. """
+    return week * 7 - 3
+
+
+class MemberBuckets():
+    """ A member's launches and playtime per game and day, and per game
+        and week.
+
+        Attributes:
+            daily:  Key: (game id, day); Value: [launches, seconds]
+            weekly: Key: (game id, week); Value: [launches, seconds]
+    """
+    __slots__ = ("daily", "weekly")
+
+    def __init__(self) -> None:
+        self.daily = {}
+        self.weekly = {}
+
+    def add(self, game_id: int, timestamp: int, kind: int, seconds: int):
+        day = day_of(timestamp)
+        for buckets, key in ((self.daily, (game_id, day)),
+                             (self.weekly, (game_id, week_of(day)))):
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = [0, 0]
+            if kind == LAUNCH:
+                bucket[0] += 1
+            else:
+                bucket[1] += seconds
+
+
+class LaunchHistory():
+    """ The launch and session history of a guild.
+
+        Attributes:
+            path:        The history directory.
+            names:       Game id to game name.
+            journal_seq: The last journal entry whose rows are on disk.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+        self.names = []
+        self._ids = {}
+        games_path = os.path.join(path, _GAMES_FILE)
+        if os.path.exists(games_path):
+            with open(games_path, "r", encoding="utf-8") as games_file:
+                for line in games_file:
+                    self._add_name(line.rstrip("\n"))
+        self._names_written = len(self.names)
+
+        try:
+            self.journal_seq = load_snapshot(os.path.join(path, _SEQ_FILE), int,
+                                             generations=0) or 0
+        except SnapshotCorruptError:
+            logger.warning(f"Unreadable journal sequence in {path}")
+            self.journal_seq = 0
+
+        # Rows from earlier runs, memory mapped.
+        self._finish_compaction()
+        self._maps = []
+        self._stored = self._map_columns()
+
+        # Rows added since startup, and how many of them are on disk.
+        self._recent = {column: array(code) for column, code in _COLUMNS.items()}
+        self._written = 0
+        self._lock = threading.Lock()
+
+        # Buckets of the rows recorded since startup, kept on the loop.
+        self._buckets = {}  # Key: Member id; Value: MemberBuckets
+        # Buckets of the rows of earlier runs, the first _startup_rows
+        # stored rows, once build_buckets has run.
+        self._stored_buckets = None
+        self._startup_rows = len(self._stored["ts"])
+        self._build_lock = threading.Lock()
+        # Members whose rows are purged by the next write: member id to
+        # the number of rows there were when they were forgotten.
+        self._forgotten = {}
+        # Members forgotten since startup, left out of _stored_buckets.
+        self._dropped = set()
+
+    def _add_name(self, game_name: str) -> int:
+        game_id = len(self.names)
+        self._ids[game_name] = game_id
+        self.names.append(game_name)
+        return game_id
+
+    def _column_path(self, column: str) -> str:
+        return os.path.join(self.path, column + ".col")
+
+    def _finish_compaction(self):
+        """ Complete a compaction a crash interrupted. Once the marker
+            is written every compacted column is on disk, so they replace
+            the columns; before that they are thrown away.
+        """
+        marker = os.path.join(self.path, _COMPACT_DONE)
+        done = os.path.exists(marker)
+        for column in _COLUMNS:
+            compacted = self._column_path(column) + _COMPACT_SUFFIX
+            if not os.path.exists(compacted):
+                continue
+            if done:
+                os.replace(compacted, self._column_path(column))
+            else:
+                os.remove(compacted)
+        if done:
+            logger.warning(f"Finished an interrupted compaction of {self.path}")
+            os.remove(marker)
+
+    def _map_columns(self) -> dict:
+        """ Memory map the column files. A crash can leave the columns
+            with different lengths, so they are cut to the shortest.
+        """
+        rows = None
+        for column, code in _COLUMNS.items():
+            column_path = self._column_path(column)
+            size = os.path.getsize(column_path) if os.path.exists(column_path) else 0
+            count = size // array(code).itemsize
+            rows = count if rows is None else min(rows, count)
+
+        columns = {}
+        for column, code in _COLUMNS.items():
+            column_path = self._column_path(column)
+            length = rows * array(code).itemsize
+            with open(column_path, "a+b") as column_file:
+                if os.path.getsize(column_path) != length:
+                    logger.warning(f"Truncating torn history column {column_path}")
+                    column_file.truncate(length)
+                if length == 0:
+                    columns[column] = array(code)
+                    continue
+                mapped = mmap.mmap(column_file.fileno(), length,
+                                   access=mmap.ACCESS_READ)
+            self._maps.append(mapped)
+            columns[column] = memoryview(mapped).cast(code)
+        return columns
+
+    def __len__(self) -> int:
+        return len(self._stored["ts"]) + len(self._recent["ts"])
+
+    def game_id(self, game_name: str) -> int:
+        """ Returns the id of a game, or None if it has no history. """
+        return self._ids.get(game_name)
+
+    def record(self, member_id: int, game_name: str, timestamp: int,
+               kind: int = LAUNCH, seconds: int = 0, seq: int = None):
+        """ Add a launch, or a session of a number of seconds.
+
+            Parameters:
+                seq: The journal entry a replayed row comes from. Rows of
+                     entries the columns already hold are skipped.
+        """
+        if seq is not None and seq <= self.journal_seq:
+            return
+        game_id = self._ids.get(game_name)
+        if game_id is None:
+            game_id = self._add_name(game_name)
+
+        recent = self._recent
+        with self._lock:
+            recent["ts"].append(timestamp)
+            recent["member"].append(member_id)
+            recent["game"].append(game_id)
+            recent["kind"].append(kind)
+            recent["seconds"].append(seconds)
+
+        buckets = self._buckets.get(member_id)
+        if buckets is None:
+            buckets = self._buckets[member_id] = MemberBuckets()
+        buckets.add(game_id, timestamp, kind, seconds)
+
+    def prepare_write(self, journal_seq: int = 0):
+        """ Returns a zero argument callable that appends the rows not yet
+            on disk to the column files, and returns the bytes written.
+            Called on the event loop; the callable may run in a thread.
+
+            Parameters:
+                journal_seq: The last journal entry whose rows have been
+                             recorded, saved once the rows are on disk.
+        """
+        with self._lock:
+            start = self._written
+            end = len(self._recent["ts"])
+            pending = {column: values[start:end]
+                       for column, values in self._recent.items()}
+            purge = dict(self._forgotten)
+        base_rows = len(self._stored["ts"]) + start
+        names = None
+        if len(self.names) > self._names_written:
+            names = list(self.names)
+        return partial(self._write, pending, base_rows, end, names, purge,
+                       journal_seq)
+
+    def _write(self, pending: dict, base_rows: int, end: int,
+               names: list, purge: dict, journal_seq: int) -> int:
+        written = 0
+        if names is not None:
+            # Names go first, so a game id on disk always has its name.
+            # The file is small and replaced whole, so ids never shift.
+            games_path = os.path.join(self.path, _GAMES_FILE)
+            with open(games_path + ".tmp", "w", encoding="utf-8") as games_file:
+                games_file.write("".join(name + "\n" for name in names))
+                games_file.flush()
+                os.fsync(games_file.fileno())
+            os.replace(games_path + ".tmp", games_path)
+            self._names_written = len(names)
+        for column, values in pending.items():
+            if len(values) == 0:
+                continue
+            with open(self._column_path(column), "r+b") as column_file:
+                # Drop whatever a failed write left behind, so the
+                # columns stay aligned.
+                column_file.truncate(base_rows * values.itemsize)
+                column_file.seek(0, os.SEEK_END)
+                values.tofile(column_file)
+                column_file.flush()
+                os.fsync(column_file.fileno())
+            written += len(values) * values.itemsize
+        self._written = end
+        if journal_seq > self.journal_seq:
+            # Only once the rows are safely on disk.
+            written += write_snapshot(os.path.join(self.path, _SEQ_FILE),
+                                      str(journal_seq).encode("ascii"),
+                                      generations=0)
+            self.journal_seq = journal_seq
+        if purge:
+            written += self._compact(purge, base_rows + len(pending["ts"]), end)
+        return written
+
+    def _compact(self, purge: dict, rows: int, end: int) -> int:
+        """ Rewrite the columns without the rows of forgotten members.
+            Runs in the writer, once the first end recent rows are on
+            disk, and returns the bytes written.
+
+            Parameters:
+                purge: Member id to the number of rows there were when
+                       they were forgotten; their rows before it go.
+                rows:  The rows on disk.
+                end:   The recent rows on disk.
+        """
+        sources = {column: open(self._column_path(column), "rb")
+                   for column in _COLUMNS}
+        targets = {column: open(self._column_path(column) + _COMPACT_SUFFIX, "wb")
+                   for column in _COLUMNS}
+        removed = 0
+        removed_startup = 0
+        written = 0
+        try:
+            for first in range(0, rows, _COMPACT_CHUNK):
+                count = min(_COMPACT_CHUNK, rows - first)
+                chunk = {}
+                for column, code in _COLUMNS.items():
+                    chunk[column] = array(code)
+                    chunk[column].fromfile(sources[column], count)
+                keep = [row for row, member in enumerate(chunk["member"])
+                        if first + row >= purge.get(member, 0)]
+                removed += count - len(keep)
+                startup = min(count, max(0, self._startup_rows - first))
+                removed_startup += startup - sum(1 for row in keep if row < startup)
+                for column, code in _COLUMNS.items():
+                    values = chunk[column]
+                    kept = array(code, (values[row] for row in keep))
+                    kept.tofile(targets[column])
+                    written += len(kept) * kept.itemsize
+            for target in targets.values():
+                target.flush()
+                os.fsync(target.fileno())
+        finally:
+            for opened in (*sources.values(), *targets.values()):
+                opened.close()
+
+        marker = os.path.join(self.path, _COMPACT_DONE)
+        with open(marker, "wb") as marker_file:
+            os.fsync(marker_file.fileno())
+        for column in _COLUMNS:
+            os.replace(self._column_path(column) + _COMPACT_SUFFIX,
+                       self._column_path(column))
+        os.remove(marker)
+
+        with self._lock:
+            # The recent rows written are in the new columns now. The old
+            # maps are left to be collected, a trend may still read them.
+            self._maps = []
+            self._stored = self._map_columns()
+            for values in self._recent.values():
+                del values[:end]
+            self._written = 0
+            self._startup_rows -= removed_startup
+            for member, forgotten_at in list(self._forgotten.items()):
+                if purge.get(member) == forgotten_at:
+                    del self._forgotten[member]
+                else:
+                    # Forgotten again since, counted in the old rows.
+                    self._forgotten[member] = forgotten_at - removed
+
+        logger.info(f"Purged {removed} history rows of {len(purge)} members")
+        return written
+
+    def build_buckets(self):
+        """ Aggregate the rows of earlier runs into buckets. It reads the
+            whole history, so it is meant to run once, in a worker thread.
+        """
+        with self._build_lock:
+            if self._stored_buckets is not None or not self._stored:
+                # Built already, or closed.
+                return
+            with self._lock:
+                columns = self._stored
+                rows = self._startup_rows
+
+            stored = {}
+            for member, timestamp, game_id, kind, seconds in zip(
+                    columns["member"][:rows], columns["ts"][:rows],
+                    columns["game"][:rows], columns["kind"][:rows],
+                    columns["seconds"][:rows]):
+                buckets = stored.get(member)
+                if buckets is None:
+                    buckets = stored[member] = MemberBuckets()
+                buckets.add(game_id, timestamp, kind, seconds)
+
+            with self._lock:
+                for member_id in self._dropped:
+                    stored.pop(member_id, None)
+                self._stored_buckets = stored
+
+    def member_buckets(self, member_id: int) -> list:
+        """ Returns the member's MemberBuckets: the rows of earlier runs
+            and the rows since startup. Builds the buckets of earlier runs
+            if build_buckets has not run yet.
+        """
+        if self._stored_buckets is None:
+            self.build_buckets()
+        return [buckets for buckets in (self._stored_buckets.get(member_id),
+                                        self._buckets.get(member_id))
+                if buckets is not None]
+
+    def weekly_trend(self, member_id: int, game_name: str, weeks: int,
+                     now_ts: int) -> list:
+        """ Returns [week start day, launches, seconds] for each of the
+            last weeks, oldest first.
+        """
+        return self._trend(member_id, game_name, weeks,
+                           week_of(day_of(now_ts)), "weekly")
+
+    def daily_trend(self, member_id: int, game_name: str, days: int,
+                    now_ts: int) -> list:
+        """ Returns [day, launches, seconds] for each of the last days,
+            oldest first.
+        """
+        return self._trend(member_id, game_name, days, day_of(now_ts), "daily")
+
+    def _trend(self, member_id: int, game_name: str, count: int,
+               current: int, period: str) -> list:
+        game_id = self._ids.get(game_name)
+        sources = [getattr(buckets, period)
+                   for buckets in self.member_buckets(member_id)]
+        trend = []
+        for index in range(current - count + 1, current + 1):
+            start = week_start(index) if period == "weekly" else index
+            entry = [start, 0, 0]
+            for buckets in sources:
+                bucket = buckets.get((game_id, index))
+                if bucket is not None:
+                    entry[1] += bucket[0]
+                    entry[2] += bucket[1]
+            trend.append(entry)
+        return trend
+
+    def forget_member(self, member_id: int):
+        """ Drop a member's buckets, and purge their rows from the
+            column files with the next write.
+        """
+        self._buckets.pop(member_id, None)
+        with self._lock:
+            self._dropped.add(member_id)
+            if self._stored_buckets is not None:
+                self._stored_buckets.pop(member_id, None)
+            self._forgotten[member_id] = (len(self._stored["ts"])
+                                          + len(self._recent["ts"]))
+
+    def close(self):
+        # Wait for a build in progress, it reads the maps.
+        with self._build_lock:
+            self._buckets = {}
+            self._stored_buckets = None
+        for column in self._stored.values():
+            if isinstance(column, memoryview):
+                column.release()
+        self._stored = {}
+        for mapped in self._maps:
+            try:
+                mapped.close()
+            except BufferError:
+                # A memoryview of the map is still referenced somewhere.
+                pass
+        self._maps = []
@@ -0,0 +1,115 @@
+""" A dictionary of user id to MemberStatsPack that decodes each stats
+    pack the first time it is used.
+
+    Storage can hand back the ids of the registered users together with a
+    loader instead of every decoded stats pack, so a guild is ready as
+    soon as it knows who is registered. Looking a member up with [], get
+    or pop loads them; values and items load everyone. Membership tests,
+    len and iterating over the ids never load anyone.
+"""
+
+class _Unloaded():
+    """ The value of a member that has not been loaded yet. """
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "<unloaded>"
+
+
+UNLOADED = _Unloaded()
+
+class LazyMembers(dict):
+    """ User id to MemberStatsPack, loading stats packs on first use.
+
+        Attributes:
+            on_load: Called with the user id and stats pack of every
+                     member as they are loaded, e.g. to attach them to
+                     the guild's game registry.
+            loaded:  Members loaded on first use so far.
+    """
+
+    def __init__(self, members: dict = None, unloaded=(), loader=None) -> None:
+        """ Parameters:
+                members:  User id to the stats packs already decoded.
+                unloaded: The ids of the members to load on first use.
+                loader:   Called with a user id, returns their stats pack.
+        """
+        super().__init__(members or {})
+        for user_id in unloaded:
+            dict.__setitem__(self, user_id, UNLOADED)
+        self._unloaded = len(self) - len(members or {})
+        self._loader = loader
+        self.on_load = None
+        self.loaded = 0
+
+    @property
+    def unloaded(self) -> int:
+        """ The number of members not loaded yet. """
+        return self._unloaded
+
+    def _load(self, user_id: int):
+        user = self._loader(user_id)
+        dict.__setitem__(self, user_id, user)
+        self._unloaded -= 1
+        self.loaded += 1
+        if self._unloaded == 0:
+            self._loader = None
+        if self.on_load is not None:
+            self.on_load(user_id, user)
+        return user
+
+    def __getitem__(self, user_id: int):
+        user = dict.__getitem__(self, user_id)
+        if user is UNLOADED:
+            user = self._load(user_id)
+        return user
+
+    def __setitem__(self, user_id: int, user):
+        if dict.get(self, user_id) is UNLOADED:
+            self._unloaded -= 1
+        dict.__setitem__(self, user_id, user)
+
+    def __delitem__(self, user_id: int):
+        if dict.get(self, user_id) is UNLOADED:
+            self._unloaded -= 1
+        dict.__delitem__(self, user_id)
+
+    def get(self, user_id: int, default=None):
+        if user_id in self:
+            return self[user_id]
+        return default
+
+    def pop(self, user_id: int, *default):
+        if user_id in self:
+            user = self[user_id]
+            dict.__delitem__(self, user_id)
+            return user
+        if default:
+            return default[0]
+        raise KeyError(user_id)
+
+    def load_all(self):
+        """ Load every member not loaded yet. """
+        if self._unloaded > 0:
+            for user_id, user in list(dict.items(self)):
+                if user is UNLOADED:
+                    self._load(user_id)
+
+    def values(self):
+        self.load_all()
+        return dict.values(self)
+
+    def items(self):
+        self.load_all()
+        return dict.items(self)
+
+    def raw_items(self):
+        """ The (user id, stats pack) pairs without loading anyone. The
+            stats pack of a member not loaded yet is UNLOADED.
+        """
+        return dict.items(self)
+
+    def loaded_items(self) -> list:
+        """ The (user id, stats pack) pairs of the members loaded so far. """
+        return [(user_id, user) for user_id, user in dict.items(self)
+                if user is not UNLOADED]
@@ -0,0 +1,205 @@
+""" Crash-safe snapshot files.
+
+    A snapshot is written to a temporary file in the same directory,
+    fsynced, and then atomically renamed over the live file, so a reader
+    only ever sees the old snapshot or the new one. The previous
+    generations are kept next to it as <path>.1, <path>.2, ... and each
+    file ends with a checksum trailer so that a torn or corrupt file can
+    be detected and skipped in favour of an older generation.
+"""
+
+# Standard Library Imports
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# The trailer appended to every snapshot. Files written before snapshots
+# existed have no trailer and are accepted as legacy files.
+TRAILER_PREFIX = b"\n#launched-snapshot sha256="
+
+# Serialises writers of the same process so that a final flush during
+# shutdown can not interleave with a flush still running in a worker.
+_write_lock = threading.Lock()
+
+class SnapshotCorruptError(Exception):
+    """ Raised when a snapshot's content does not match its checksum. """
+
+
+def generation_path(path: str, generation: int) -> str:
+    """ Returns the file name of a generation. Generation 0 is the live file. """
+    if generation == 0:
+        return path
+    return f"{path}.{generation}"
+
+
+def _fsync_directory(directory: str):
+    # Persist the rename itself. Not every platform can open a directory.
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+def write_snapshot(path: str, payload: bytes, generations: int = 3) -> int:
+    """ Atomically replace the snapshot at path with payload.
+
+        Parameters:
+            path:        The live snapshot file.
+            payload:     The serialized content to store.
+            generations: How many older snapshots to keep around.
+
+        Returns the number of bytes written, trailer included.
+    """
+    digest = hashlib.sha256(payload).hexdigest().encode("ascii")
+    trailer = TRAILER_PREFIX + digest + b" length=" + str(len(payload)).encode("ascii") + b"\n"
+    directory = os.path.dirname(os.path.abspath(path))
+
+    with _write_lock:
+        fd, temp_path = tempfile.mkstemp(dir=directory,
+                                         prefix=os.path.basename(path) + ".",
+                                         suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                temp_file.write(payload)
+                temp_file.write(trailer)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+
+            # Shift the older generations down, dropping the oldest.
+            for generation in range(generations, 0, -1):
+                older = generation_path(path, generation - 1)
+                if os.path.exists(older):
+                    os.replace(older, generation_path(path, generation))
+
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        _fsync_directory(directory)
+
+    return len(payload) + len(trailer)
+
+
+def _payload_length(content, path: str) -> int:
+    """ Returns the length of the payload in front of the trailer.
+
+        Raises SnapshotCorruptError if the checksum does not match.
+    """
+    index = content.rfind(TRAILER_PREFIX)
+    if index == -1:
+        return len(content)
+
+    try:
+        fields = bytes(content[index + len(TRAILER_PREFIX):]).split()
+        digest = fields[0].decode("ascii")
+        length = int(fields[1].split(b"=")[1])
+    except (IndexError, ValueError, UnicodeDecodeError):
+        raise SnapshotCorruptError(f"Malformed snapshot trailer in {path}")
+
+    if (length != index
+            or hashlib.sha256(memoryview(content)[:index]).hexdigest() != digest):
+        raise SnapshotCorruptError(f"Checksum mismatch in {path}")
+
+    return index
+
+
+def read_snapshot(path: str) -> bytes:
+    """ Returns the verified payload of a single snapshot file.
+
+        Raises SnapshotCorruptError if the checksum does not match.
+        A file without a trailer is returned as is.
+    """
+    with open(path, "rb") as snapshot_file:
+        content = snapshot_file.read()
+
+    return content[:_payload_length(content, path)]
+
+
+def map_snapshot(path: str) -> tuple:
+    """ Memory maps a single snapshot file and verifies it, rather than
+        reading it.
+
+        Returns the (mmap, payload length) of the file. The mmap is None
+        if the file is empty. Raises SnapshotCorruptError if the checksum
+        does not match.
+    """
+    with open(path, "rb") as snapshot_file:
+        if os.fstat(snapshot_file.fileno()).st_size == 0:
+            return None, 0
+        mapped = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        return mapped, _payload_length(mapped, path)
+    except SnapshotCorruptError:
+        mapped.close()
+        raise
+
+
+def load_snapshot(path: str, decode, generations: int = 3,
+                  mapped: bool = False):
+    """ Decode the newest valid generation of a snapshot.
+
+        Parameters:
+            path:        The live snapshot file.
+            decode:      Called with the payload bytes; any exception it
+                         raises marks that generation as unusable.
+            generations: How many older generations to fall back on.
+            mapped:      If true, the file is memory mapped instead of
+                         read, and decode is called with the mmap and
+                         the payload's length. decode owns the mmap
+                         unless it raises.
+
+        Returns the result of decode, or None if there is no snapshot
+        at all. Raises SnapshotCorruptError if every generation is bad.
+    """
+    found_any = False
+
+    for generation in range(generations + 1):
+        candidate = generation_path(path, generation)
+        if not os.path.exists(candidate):
+            continue
+        try:
+            if mapped:
+                payload = map_snapshot(candidate)
+            else:
+                payload = read_snapshot(candidate)
+        except (OSError, SnapshotCorruptError) as error:
+            found_any = True
+            logger.error(f"Skipping snapshot {candidate}: {error}")
+            continue
+
+        # An empty file holds no data, same as a missing one.
+        if payload[1] == 0 if mapped else not payload.strip():
+            if mapped and payload[0] is not None:
+                payload[0].close()
+            continue
+
+        found_any = True
+        try:
+            result = decode(*payload) if mapped else decode(payload)
+        except Exception as error:
+            if mapped:
+                payload[0].close()
+            logger.error(f"Skipping snapshot {candidate}: {error}")
+            continue
+
+        if generation > 0:
+            logger.warning(f"Restored from fallback generation {candidate}")
+        return result
+
+    if found_any:
+        raise SnapshotCorruptError(f"No valid snapshot generation for {path}")
+    return None
@@ -0,0 +1,404 @@
+""" SQLite storage for the stats bot.
+
+    Members and games are stored as rows, so a single launch only costs
+    an upsert of one member row and one game row instead of rewriting
+    every member. Loading only reads the member ids; a member's games are
+    read the first time the member is used. The database runs in WAL mode
+    and reads go through their own connection, so that they are never
+    blocked by the background writer.
+
+    An existing JSON file can be migrated with:
+        python -m StatBotPackage.Storage.SqliteStorage <json file> <db file>
+    The JSON journal is moved next to the database, so the changes made
+    after the last JSON snapshot are replayed when it is loaded.
+"""
+
+# Standard Library Imports
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from functools import partial
+
+# Local Module imports
+from StatBotPackage.GuildMemberStats import GameStats, MemberStatsPack
+from StatBotPackage.Playtime import PlaytimeWindow
+from StatBotPackage.Storage.EventJournal import EventJournal
+from StatBotPackage.Storage.StatsStorage import StatsStorage
+from StatBotPackage.Storage.JsonStorage import JsonStorage
+from StatBotPackage.Storage.LazyMembers import UNLOADED, LazyMembers
+
+logger = logging.getLogger(__name__)
+
+# Bump when the schema changes and add the upgrade to _MIGRATIONS.
+SCHEMA_VERSION = 4
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS members (
+    user_id        INTEGER PRIMARY KEY,
+    most_launched  TEXT,
+    least_launched TEXT,
+    last_launched  TEXT,
+    playtime       TEXT
+);
+CREATE TABLE IF NOT EXISTS games (
+    user_id           INTEGER NOT NULL,
+    name              TEXT    NOT NULL,
+    date_first_played TEXT,
+    date_last_played  TEXT,
+    marked_game       INTEGER NOT NULL DEFAULT 0,
+    times_launched    INTEGER NOT NULL DEFAULT 0,
+    days_launched     INTEGER NOT NULL DEFAULT 0,
+    total_playtime    INTEGER NOT NULL DEFAULT 0,
+    longest_session   INTEGER NOT NULL DEFAULT 0,
+    sessions          INTEGER NOT NULL DEFAULT 0,
+    first_day         INTEGER,
+    day_bits          TEXT,
+    current_streak    INTEGER NOT NULL DEFAULT 0,
+    longest_streak    INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value INTEGER
+);
+"""
+
+# Schema upgrades, indexed by the version they upgrade from.
+_MIGRATIONS = {
+    1: """
+    CREATE TABLE IF NOT EXISTS meta (
+        key   TEXT PRIMARY KEY,
+        value INTEGER
+    );
+    """,
+    2: """
+    ALTER TABLE members ADD COLUMN playtime TEXT;
+    ALTER TABLE games ADD COLUMN total_playtime INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE games ADD COLUMN longest_session INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE games ADD COLUMN sessions INTEGER NOT NULL DEFAULT 0;
+    """,
+    3: """
+    ALTER TABLE games ADD COLUMN first_day INTEGER;
+    ALTER TABLE games ADD COLUMN day_bits TEXT;
+    ALTER TABLE games ADD COLUMN current_streak INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE games ADD COLUMN longest_streak INTEGER NOT NULL DEFAULT 0;
+    """,
+}
+
+_SELECT_MEMBER = """
+SELECT most_launched, least_launched, last_launched, playtime
+FROM members WHERE user_id = ?
+"""
+
+_SELECT_GAMES = """
+SELECT name, date_first_played, date_last_played, marked_game,
+       times_launched, days_launched, total_playtime, longest_session,
+       sessions, first_day, day_bits, current_streak, longest_streak
+FROM games WHERE user_id = ?
+"""
+
+# The meta key recording the JSON migration: 0 while it runs, 1 once done.
+JSON_MIGRATED_KEY = "json_migrated"
+
+_SET_META = """
+INSERT INTO meta (key, value) VALUES (?, ?)
+ON CONFLICT(key) DO UPDATE SET value = excluded.value
+"""
+
+_SET_JOURNAL_SEQ = """
+INSERT INTO meta (key, value) VALUES ('journal_seq', ?)
+ON CONFLICT(key) DO UPDATE SET value = excluded.value
+"""
+
+_UPSERT_MEMBER = """
+INSERT INTO members (user_id, most_launched, least_launched, last_launched,
+                     playtime)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(user_id) DO UPDATE SET
+    most_launched  = excluded.most_launched,
+    least_launched = excluded.least_launched,
+    last_launched  = excluded.last_launched,
+    playtime       = excluded.playtime
+"""
+
+_UPSERT_GAME = """
+INSERT INTO games (user_id, name, date_first_played, date_last_played,
+                   marked_game, times_launched, days_launched,
+                   total_playtime, longest_session, sessions, first_day,
+                   day_bits, current_streak, longest_streak)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(user_id, name) DO UPDATE SET
+    date_first_played = excluded.date_first_played,
+    date_last_played  = excluded.date_last_played,
+    marked_game       = excluded.marked_game,
+    times_launched    = excluded.times_launched,
+    days_launched     = excluded.days_launched,
+    total_playtime    = excluded.total_playtime,
+    longest_session   = excluded.longest_session,
+    sessions          = excluded.sessions,
+    first_day         = excluded.first_day,
+    day_bits          = excluded.day_bits,
+    current_streak    = excluded.current_streak,
+    longest_streak    = excluded.longest_streak
+"""
+
+def _date_to_text(date):
+    return None if date is None else str(date)
+
+def _game_name(game: GameStats):
+    return None if game is None else game.name
+
+def _day_bits_from_text(text: str) -> int:
+    # Rows from before days were indexed have no bits.
+    return None if text is None else int(text, 16)
+
+def _playtime_to_text(playtime: PlaytimeWindow):
+    return None if playtime is None else json.dumps(playtime.to_json())
+
+def _playtime_from_text(text: str) -> PlaytimeWindow:
+    return None if text is None else PlaytimeWindow.from_json(json.loads(text))
+
+def _row_size(row: tuple) -> int:
+    # A cheap estimate of the bytes a row puts on disk.
+    return sum(len(str(value)) for value in row if value is not None)
+
+
+class SqliteStorage(StatsStorage):
+    """ Keeps registered users in a SQLite database.
+
+        Attributes:
+            path: The database file.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # Writes happen in a worker thread, so the connection is shared
+        # between threads and guarded by a lock.
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+        # Members are loaded on the event loop while the worker may be
+        # writing; in WAL mode a second connection reads without waiting.
+        self._read_lock = threading.Lock()
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+
+    def _create_schema(self):
+        with self._lock, self._connection:
+            version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+            if version == 0:
+                self._connection.executescript(_SCHEMA)
+            else:
+                while version < SCHEMA_VERSION:
+                    self._connection.executescript(_MIGRATIONS[version])
+                    version += 1
+            self._connection.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def is_empty(self) -> bool:
+        with self._read_lock:
+            row = self._reader.execute("SELECT 1 FROM members LIMIT 1").fetchone()
+        return row is None
+
+    def get_meta(self, key: str) -> int:
+        """ Returns the value of a meta key, or None if it is not set. """
+        with self._read_lock:
+            row = self._reader.execute("SELECT value FROM meta WHERE key = ?",
+                                       (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def set_meta(self, key: str, value: int):
+        with self._lock, self._connection:
+            self._connection.execute(_SET_META, (key, value))
+
+    def json_migrated(self) -> bool:
+        """ Whether the JSON file was migrated into the database. A
+            database filled before the migration was recorded counts as
+            migrated; an interrupted migration does not.
+        """
+        migrated = self.get_meta(JSON_MIGRATED_KEY)
+        if migrated is None:
+            return not self.is_empty()
+        return migrated == 1
+
+    def load(self) -> LazyMembers:
+        with self._read_lock:
+            user_ids = [row[0] for row in self._reader.execute(
+                "SELECT user_id FROM members")]
+            seq_row = self._reader.execute(
+                "SELECT value FROM meta WHERE key = 'journal_seq'").fetchone()
+
+        self.journal_seq = 0 if seq_row is None else seq_row[0]
+        return LazyMembers(unloaded=user_ids, loader=self._load_member)
+
+    def _load_member(self, user_id: int) -> MemberStatsPack:
+        decode_date = GameStats.decode_date
+
+        with self._read_lock:
+            most, least, last, playtime = self._reader.execute(
+                _SELECT_MEMBER, (user_id,)).fetchone()
+            game_rows = self._reader.execute(_SELECT_GAMES, (user_id,)).fetchall()
+
+        game_dict = {}
+        for (name, first_played, last_played, marked, times_launched,
+                days_launched, total_playtime, longest_session, sessions,
+                first_day, day_bits, current_streak,
+                longest_streak) in game_rows:
+            game_dict[name] = GameStats(given_name=name,
+                                        date_first_played=decode_date(first_played),
+                                        date_last_played=decode_date(last_played),
+                                        marked_game=bool(marked),
+                                        times_launched=times_launched,
+                                        days_launched=days_launched,
+                                        total_playtime=total_playtime,
+                                        longest_session=longest_session,
+                                        sessions=sessions,
+                                        first_day=first_day,
+                                        day_bits=_day_bits_from_text(day_bits),
+                                        current_streak=current_streak,
+                                        longest_streak=longest_streak)
+
+        return MemberStatsPack(most_launched=game_dict.get(most),
+                               least_launched=game_dict.get(least),
+                               last_game=game_dict.get(last),
+                               restored_game_list=game_dict,
+                               playtime=_playtime_from_text(playtime))
+
+    def prepare_write(self, registered_users: dict, dirty: dict,
+                      journal_seq: int = 0):
+        member_rows = []
+        game_rows = []
+        replaced = []
+        deleted = []
+
+        for user_id, game_names in dirty.items():
+            # Looked up without loading: a member that was never loaded
+            # has not changed, and their rows are already stored.
+            user = dict.get(registered_users, user_id)
+            if user is None:
+                deleted.append((user_id,))
+                continue
+            if user is UNLOADED:
+                continue
+
+            member_rows.append((user_id,
+                                _game_name(user.most_launched_game),
+                                _game_name(user.least_launched_game),
+                                _game_name(user.last_launched_game),
+                                _playtime_to_text(user.playtime)))
+
+            if game_names is None:
+                # The whole member is rewritten, drop whatever was there.
+                replaced.append((user_id,))
+                game_names = user.game_dict
+
+            for name in game_names:
+                game = user.game_dict.get(name)
+                if game is None:
+                    continue
+                game_rows.append((user_id, game.name,
+                                  _date_to_text(game.date_first_played),
+                                  _date_to_text(game.date_last_played),
+                                  int(game.marked_game),
+                                  game.times_launched,
+                                  game.days_launched,
+                                  game.total_playtime,
+                                  game.longest_session,
+                                  game.sessions,
+                                  game.first_day,
+                                  format(game.day_bits, "x"),
+                                  game.current_streak,
+                                  game.longest_streak))
+
+        return partial(self._write, member_rows, game_rows, replaced, deleted,
+                       journal_seq)
+
+    def _write(self, member_rows, game_rows, replaced, deleted,
+               journal_seq) -> int:
+        with self._lock, self._connection:
+            connection = self._connection
+            connection.executemany("DELETE FROM games WHERE user_id = ?", deleted)
+            connection.executemany("DELETE FROM members WHERE user_id = ?", deleted)
+            connection.executemany("DELETE FROM games WHERE user_id = ?", replaced)
+            connection.executemany(_UPSERT_MEMBER, member_rows)
+            connection.executemany(_UPSERT_GAME, game_rows)
+            connection.execute(_SET_JOURNAL_SEQ, (journal_seq,))
+
+        return (sum(_row_size(row) for row in member_rows)
+                + sum(_row_size(row) for row in game_rows))
+
+    def close(self):
+        with self._read_lock:
+            self._reader.close()
+        with self._lock:
+            self._connection.close()
+
+
+def migrate_json_to_sqlite(json_path: str, storage: SqliteStorage,
+                           generations: int = 3, json_journal: str = None,
+                           sqlite_journal: str = None) -> int:
+    """ One shot copy of the JSON file format into a SQLite database.
+        The migration is recorded in the database, see json_migrated.
+
+        The JSON snapshot does not hold the changes made after it, those
+        are in the JSON journal. It is moved to the SQLite journal, where
+        they are replayed from when the storage is loaded. If the SQLite
+        journal already has entries the two cannot be joined, and the
+        migration is refused until the bot checkpoints the JSON journal.
+
+        Parameters:
+            json_path:      The JSON file written by the JSON storage.
+            storage:        The SQLite storage to fill.
+            generations:    Older JSON snapshots to fall back on if the
+                            newest one is damaged.
+            json_journal:   The journal of the JSON storage, None if both
+                            storages share one.
+            sqlite_journal: The journal of the SQLite storage.
+
+        Returns the number of members migrated.
+    """
+    json_storage = JsonStorage(json_path, generations=generations)
+    registered_users = json_storage.load()
+    journal_seq = json_storage.journal_seq
+
+    move_journal = False
+    if json_journal is not None and os.path.exists(json_journal):
+        journal = EventJournal(json_journal, start_seq=journal_seq)
+        move_journal = any(True for _ in journal.read(after_seq=journal_seq))
+        journal.close()
+    if (move_journal and os.path.exists(sqlite_journal)
+            and os.path.getsize(sqlite_journal) > 0):
+        json_storage.close()
+        logger.error(f"Not migrating {json_path}: its journal {json_journal} "
+                     f"has changes newer than the snapshot and "
+                     f"{sqlite_journal} is not empty. Run the bot with the "
+                     f"JSON storage once to checkpoint its journal.")
+        return 0
+
+    storage.set_meta(JSON_MIGRATED_KEY, 0)
+    registered_users.load_all()
+    json_storage.close()
+    dirty = dict.fromkeys(registered_users)
+    storage.prepare_write(registered_users, dirty, journal_seq)()
+    if move_journal:
+        os.replace(json_journal, sqlite_journal)
+    storage.set_meta(JSON_MIGRATED_KEY, 1)
+
+    logger.info(f"Migrated {len(registered_users)} members from {json_path}")
+    return len(registered_users)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("usage: python -m StatBotPackage.Storage.SqliteStorage "
+              "<json file> <db file>")
+        sys.exit(1)
+    sqlite_storage = SqliteStorage(sys.argv[2])
+    count = migrate_json_to_sqlite(sys.argv[1], sqlite_storage,
+                                   json_journal=sys.argv[1] + ".journal",
+                                   sqlite_journal=sys.argv[2] + ".journal")
+    sqlite_storage.close()
+    print(f"Migrated {count} members.")
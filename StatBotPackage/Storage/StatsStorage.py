@@ -0,0 +1,39 @@
+""" The storage interface that sits behind the CoreFunctions cog.
+
+    Every backend restores the registered users on startup and persists
+    batches of dirty members handed over by the write-behind recorder.
+"""
+
+class StatsStorage():
+    """ Base class for the places the stats bot can keep its data.
+
+        Writes are split into two steps. prepare_write is called on the
+        event loop and must copy whatever it needs out of the live stats
+        packs. The callable it returns does the actual I/O, may be run in
+        a worker thread, and returns the number of bytes written.
+
+        Attributes:
+            journal_seq: The last event journal entry contained in the
+                         stored data, set by load.
+    """
+    journal_seq = 0
+
+    def load(self) -> dict:
+        """ Returns a dictionary of user id to MemberStatsPack. """
+        raise NotImplementedError
+
+    def prepare_write(self, registered_users: dict, dirty: dict,
+                      journal_seq: int = 0):
+        """ Parameters:
+                registered_users: The live dictionary of stats packs.
+                dirty: Member id to the set of game names that changed,
+                       or None when the whole member must be written.
+                       Ids missing from registered_users were removed.
+                journal_seq: The last journal entry reflected in
+                             registered_users, stored with the data.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """ Release any handles held by the backend. """
+        pass
@@ -0,0 +1,291 @@
+""" Write-behind persistence for the stats bot.
+
+    Rather than rewriting the stats file every time a presence event
+    mutates a member's stats pack, callers mark the member as dirty and
+    a background task flushes all pending changes at once, either on a
+    fixed interval or once enough members have become dirty.
+"""
+
+# Standard Library Imports
+import asyncio
+import concurrent.futures
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Writers run here instead of in the loop's default executor, so that
+# the future of a writer still running can be kept and waited for.
+_writer_pool = concurrent.futures.ThreadPoolExecutor(thread_name_prefix="write-behind")
+
+def _merge_dirty(dirty: dict, user_id: int, game_name: str):
+    if game_name is None:
+        dirty[user_id] = None
+    elif user_id not in dirty:
+        dirty[user_id] = {game_name}
+    elif dirty[user_id] is not None:
+        dirty[user_id].add(game_name)
+
+
+class FlushMetrics():
+    """ Running counters describing the behaviour of a WriteBehindRecorder.
+
+        Attributes:
+            flush_count:        The number of flushes that reached storage.
+            failed_flushes:     The number of flushes that raised.
+            marks:              The number of mutations that were recorded.
+            coalesced_writes:   Mutations absorbed into another flush
+                                i.e. writes that never had to happen.
+            bytes_written:      Total bytes handed to storage.
+            last_flush_bytes:   Bytes written by the most recent flush.
+            last_flush_latency: Seconds spent in the most recent flush.
+            max_flush_latency:  The slowest flush seen so far, in seconds.
+            total_flush_latency: Seconds spent flushing over the lifetime.
+    """
+
+    def __init__(self) -> None:
+        self.flush_count = 0
+        self.failed_flushes = 0
+        self.marks = 0
+        self.coalesced_writes = 0
+        self.bytes_written = 0
+        self.last_flush_bytes = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+
+    @property
+    def mean_flush_latency(self) -> float:
+        if self.flush_count == 0:
+            return 0.0
+        return self.total_flush_latency / self.flush_count
+
+    def as_dict(self) -> dict:
+        """ Returns a plain dictionary of the counters, handy for logging
+            or for rendering into an embed.
+        """
+        return {"flush_count": self.flush_count,
+                "failed_flushes": self.failed_flushes,
+                "marks": self.marks,
+                "coalesced_writes": self.coalesced_writes,
+                "bytes_written": self.bytes_written,
+                "last_flush_bytes": self.last_flush_bytes,
+                "last_flush_latency": self.last_flush_latency,
+                "max_flush_latency": self.max_flush_latency,
+                "mean_flush_latency": self.mean_flush_latency}
+
+
+class WriteBehindRecorder():
+    """ Collects dirty member ids and flushes them to storage in the
+        background.
+
+        A flush happens in two steps. The snapshot callback runs on the
+        event loop, where it is safe to read the stats packs, and returns
+        a writer. The writer does the disk work and is run in a worker
+        thread, so the event loop never waits on the disk.
+
+        Attributes:
+            interval:        Seconds between periodic flushes.
+            dirty_threshold: Flush early once this many members are dirty.
+            metrics:         A FlushMetrics instance for this recorder.
+            on_flush:        Called with the bytes written and the seconds
+                             taken after every flush that reached storage,
+                             e.g. to feed a histogram.
+    """
+
+    def __init__(self, snapshot_callback, *, interval: float = 30.0,
+                 dirty_threshold: int = 50) -> None:
+        """ Parameters:
+                snapshot_callback: Called with a dictionary of dirty member
+                                 ids to the game names that changed.
+                                 Must return a callable taking no
+                                 arguments that persists them and returns
+                                 the number of bytes written.
+                interval:        Seconds between periodic flushes.
+                dirty_threshold: The amount of dirty members that forces
+                                 a flush before the interval elapses.
+        """
+        self._snapshot_callback = snapshot_callback
+        self.interval = interval
+        self.dirty_threshold = dirty_threshold
+        self.metrics = FlushMetrics()
+        self.on_flush = None
+
+        # Member id to the set of game names that changed, or None when
+        # the whole member needs to be written.
+        self._dirty = {}
+        self._pending_marks = 0
+        self._wakeup = None
+        self._task = None
+        # Held while a flush runs, so flushes never overlap.
+        self._flush_lock = None
+        # The future, dirty members and marks of the writer in a worker
+        # thread, until the flush that started it sees it finish.
+        self._in_flight = None
+
+    @property
+    def dirty_count(self) -> int:
+        return len(self._dirty)
+
+    def mark_dirty(self, user_id: int, game_name: str = None):
+        """ Record that a member's stats have changed and need persisting.
+
+            Parameters:
+                user_id:   The id of the member whose stats pack changed.
+                game_name: The game that changed. Leave as None when the
+                           change is not limited to one game.
+        """
+        _merge_dirty(self._dirty, user_id, game_name)
+        self._pending_marks += 1
+        self.metrics.marks += 1
+
+        if (len(self._dirty) >= self.dirty_threshold
+                and self._wakeup is not None):
+            self._wakeup.set()
+
+    def request_flush(self):
+        """ Ask the background task to flush without waiting for the
+            interval to elapse.
+        """
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """ Start the background flush task on the given event loop. """
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        self._wakeup = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(),
+                                       timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush_async()
+
+    def _take_dirty(self):
+        dirty, self._dirty = self._dirty, {}
+        marks, self._pending_marks = self._pending_marks, 0
+        return dirty, marks
+
+    def _restore_dirty(self, dirty: dict, marks: int):
+        for user_id, game_names in dirty.items():
+            if game_names is None:
+                _merge_dirty(self._dirty, user_id, None)
+            else:
+                for game_name in game_names:
+                    _merge_dirty(self._dirty, user_id, game_name)
+        self._pending_marks += marks
+
+    def _flush_failed(self, dirty: dict, marks: int):
+        logger.exception("Write-behind flush failed, will retry.")
+        self._restore_dirty(dirty, marks)
+        self.metrics.failed_flushes += 1
+
+    async def flush_async(self) -> bool:
+        """ Write every dirty member to storage, doing the disk work in
+            the write-behind thread pool.
+
+            Returns true if anything was written. On failure the dirty
+            set is kept so that the next flush retries it. A flush that
+            is already running is waited for first.
+        """
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            return await self._flush_async()
+
+    async def _flush_async(self) -> bool:
+        if not self._dirty:
+            return False
+
+        dirty, marks = self._take_dirty()
+        start = time.perf_counter()
+        try:
+            future = _writer_pool.submit(self._snapshot_callback(dirty))
+        except Exception:
+            self._flush_failed(dirty, marks)
+            return False
+
+        self._in_flight = (future, dirty, marks)
+        try:
+            written = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # The writer may still be running. stop() waits for it and
+            # picks the members back up if it did not finish.
+            raise
+        except Exception:
+            self._in_flight = None
+            self._flush_failed(dirty, marks)
+            return False
+
+        self._in_flight = None
+        self._record(dirty, marks, written, time.perf_counter() - start)
+        return True
+
+    def flush(self) -> bool:
+        """ Write every dirty member to storage now, blocking the caller.
+            Used for the final flush when there may be no running loop.
+
+            Returns true if anything was written.
+        """
+        if not self._dirty:
+            return False
+
+        dirty, marks = self._take_dirty()
+        start = time.perf_counter()
+        try:
+            written = self._snapshot_callback(dirty)()
+        except Exception:
+            self._flush_failed(dirty, marks)
+            return False
+
+        self._record(dirty, marks, written, time.perf_counter() - start)
+        return True
+
+    def _record(self, dirty: dict, marks: int, written: int, elapsed: float):
+        metrics = self.metrics
+        metrics.flush_count += 1
+        metrics.coalesced_writes += marks - 1
+        metrics.bytes_written += written
+        metrics.last_flush_bytes = written
+        metrics.last_flush_latency = elapsed
+        metrics.total_flush_latency += elapsed
+        if elapsed > metrics.max_flush_latency:
+            metrics.max_flush_latency = elapsed
+        if self.on_flush is not None:
+            self.on_flush(written, elapsed)
+
+        logger.debug(f"Flushed {len(dirty)} members ({written} bytes, "
+                     f"{marks} mutations) in {elapsed:.4f}s")
+
+    def _wait_in_flight(self):
+        if self._in_flight is None:
+            return
+        future, dirty, marks = self._in_flight
+        self._in_flight = None
+
+        # Cancelling a flush does not stop its writer once it is in a
+        # worker thread. Waiting for it means the final flush is written
+        # after it, and never overwritten or compacted away by it.
+        concurrent.futures.wait([future])
+        if future.cancelled():
+            self._restore_dirty(dirty, marks)
+        elif future.exception() is not None:
+            logger.error("Write-behind flush failed, will retry.",
+                         exc_info=future.exception())
+            self._restore_dirty(dirty, marks)
+            self.metrics.failed_flushes += 1
+
+    def stop(self):
+        """ Cancel the background task, wait for a write it left running
+            and perform a final flush.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._wait_in_flight()
+        self.flush()
@@ -0,0 +1,50 @@
+import os
+import tempfile
+
+from StatBotPackage.Storage.EventJournal import EventJournal
+
+def test_append_after_torn_tail_survives_replay():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "stats.journal")
+        journal = EventJournal(path)
+        journal.append("start", 1, "A")
+        journal.append("end", 1, "A")
+        journal.close()
+        # A crash in the middle of the next append.
+        with open(path, "ab") as journal_file:
+            journal_file.write(b'{"seq":3,"kind":"st')
+
+        journal = EventJournal(path)
+        assert journal.last_seq == 2
+        journal.append("start", 1, "B")
+        journal.append("end", 1, "B")
+        journal.close()
+
+        events = list(EventJournal(path).read())
+        assert [event.seq for event in events] == [1, 2, 3, 4]
+        assert [event.kind for event in events] == ["start", "end",
+                                                    "start", "end"]
+
+
+def test_torn_only_line_is_cut():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "stats.journal")
+        with open(path, "wb") as journal_file:
+            journal_file.write(b'{"seq":1,"ki')
+        journal = EventJournal(path, start_seq=5)
+        journal.append("register", 2)
+        journal.close()
+        assert [event.seq for event in EventJournal(path).read()] == [6]
+
+
+def test_compact_keeps_entries_after_checkpoint():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "stats.journal")
+        journal = EventJournal(path)
+        journal.append("start", 1, "A")
+        seq, offset = journal.checkpoint()
+        journal.append("end", 1, "A")
+        journal.compact(offset)
+        journal.append("mark", 1, "A")
+        journal.close()
+        assert [event.seq for event in EventJournal(path).read()] == [2, 3]
@@ -0,0 +1,50 @@
+""" Days a game was launched on, counted in the guild's timezone. """
+
+# Standard Library Imports
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+# Third party Imports
+import discord
+
+# Local Module imports
+from StatBotPackage.GameRegistry import GameRegistry
+from StatBotPackage.GuildMemberStats import MemberStatsPack, day_ordinal
+
+LOS_ANGELES = ZoneInfo("America/Los_Angeles")
+
+def test_legacy_game_days_use_the_guild_timezone():
+    # 03:00 UTC is still the evening before in Los Angeles.
+    last_played = datetime(2024, 3, 10, 3)
+    user = MemberStatsPack.json_decoder(
+        {"__MemberStatsPack__": True,
+         "most_launched_game": "A", "least_launched_game": "A",
+         "last_launched_game": "A",
+         "game_dict": {"A": {"__GameStats__": True, "name": "A",
+                             "date_first_played": str(last_played),
+                             "date_last_played": str(last_played),
+                             "marked_game": False, "times_launched": 3,
+                             "days_launched": 2}}})
+    user.attach(GameRegistry(), 1, LOS_ANGELES)
+    game = user.game_dict["A"]
+    assert game.last_day == day_ordinal(last_played, LOS_ANGELES)
+    assert game.last_day == datetime(2024, 3, 9).toordinal()
+
+    # Played again the next evening in Los Angeles: a two day streak.
+    user.update_game_stats(discord.Game(name="A"),
+                           start_date=last_played + timedelta(days=1))
+    assert game.current_streak == 2
+    assert game.days_launched == 3
+
+
+def test_game_without_a_date_counts_today_once():
+    user = MemberStatsPack()
+    user.attach(GameRegistry(), 1, LOS_ANGELES)
+    user.init_game_stats(discord.Game(name="A"), None)
+    game = user.game_dict["A"]
+    assert game.days_launched == 1
+    assert game.last_day == day_ordinal(datetime.utcnow(), LOS_ANGELES)
+
+    user.update_game_stats(discord.Game(name="A"), start_date=datetime.utcnow())
+    assert game.days_launched == 1
+    assert game.times_launched == 2
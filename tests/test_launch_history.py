@@ -0,0 +1,189 @@
+""" LaunchHistory trends against a scan of the rows, across restarts,
+    and the purge of forgotten members.
+"""
+
+# Standard Library Imports
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+# Third party Imports
+import discord
+
+# Local Module imports
+from StatBotPackage.GuildState import GuildState
+from StatBotPackage.Storage.JsonStorage import JsonStorage
+from StatBotPackage.Storage.LaunchHistory import (LAUNCH, SESSION,
+                                                  LaunchHistory, day_of)
+
+NOW = 1_700_000_000
+GAMES = ["A", "B", "C"]
+
+def scan_daily(rows: list, member_id: int, game_name: str, days: int) -> list:
+    today = day_of(NOW)
+    trend = [[day, 0, 0] for day in range(today - days + 1, today + 1)]
+    for member, game, timestamp, kind, seconds in rows:
+        index = day_of(timestamp) - (today - days + 1)
+        if member != member_id or game != game_name or not 0 <= index < days:
+            continue
+        if kind == LAUNCH:
+            trend[index][1] += 1
+        else:
+            trend[index][2] += seconds
+    return trend
+
+
+def record_random(history: LaunchHistory, rows: list, rng: random.Random,
+                  count: int, members: int = 4):
+    for _ in range(count):
+        row = (rng.randrange(members), rng.choice(GAMES),
+               NOW - rng.randrange(20 * 86400),
+               rng.choice((LAUNCH, SESSION)), rng.randrange(1, 3600))
+        history.record(row[0], row[1], row[2], row[3], row[4])
+        rows.append(row)
+
+
+def check_trends(history: LaunchHistory, rows: list, members: int = 4):
+    for member_id in range(members):
+        for game_name in GAMES:
+            assert (history.daily_trend(member_id, game_name, 20, NOW)
+                    == scan_daily(rows, member_id, game_name, 20))
+
+
+def test_trends_match_a_scan_across_restarts(tmp_path):
+    rng = random.Random(7)
+    rows = []
+    path = str(tmp_path / "history")
+
+    history = LaunchHistory(path)
+    record_random(history, rows, rng, 300)
+    history.prepare_write()()
+    history.close()
+
+    history = LaunchHistory(path)
+    assert len(history) == 300
+    # Rows recorded before the earlier runs are aggregated.
+    record_random(history, rows, rng, 100)
+    history.build_buckets()
+    record_random(history, rows, rng, 100)
+    check_trends(history, rows)
+    history.close()
+
+
+def test_forgotten_member_rows_are_purged(tmp_path):
+    rng = random.Random(11)
+    rows = []
+    path = str(tmp_path / "history")
+
+    history = LaunchHistory(path)
+    record_random(history, rows, rng, 200)
+    history.prepare_write()()
+    history.close()
+
+    history = LaunchHistory(path)
+    history.build_buckets()
+    record_random(history, rows, rng, 50)
+    history.forget_member(1)
+    rows = [row for row in rows if row[0] != 1]
+    check_trends(history, rows)
+
+    # Rows of the member after they were forgotten are kept.
+    record_random(history, rows, rng, 50)
+    history.prepare_write()()
+    check_trends(history, rows)
+    record_random(history, rows, rng, 20)
+    history.prepare_write()()
+    assert len(history) == len(rows)
+    history.close()
+
+    history = LaunchHistory(path)
+    assert len(history) == len(rows)
+    check_trends(history, rows)
+    history.close()
+
+
+def test_interrupted_compaction(tmp_path):
+    path = str(tmp_path / "history")
+    history = LaunchHistory(path)
+    history.record(1, "A", NOW)
+    history.record(2, "A", NOW)
+    history.prepare_write()()
+    history.close()
+
+    # Compacted columns without the marker are thrown away.
+    for column in ("ts", "member", "game", "kind", "seconds"):
+        with open(os.path.join(path, column + ".col.compact"), "wb"):
+            pass
+    history = LaunchHistory(path)
+    assert len(history) == 2
+    history.forget_member(1)
+    history.prepare_write()()
+    history.close()
+    assert sorted(os.listdir(path)) == ["game.col", "games.txt", "kind.col",
+                                        "member.col", "seconds.col", "ts.col"]
+
+    history = LaunchHistory(path)
+    assert len(history) == 1
+    assert history.daily_trend(2, "A", 1, NOW)[0][1] == 1
+    assert history.daily_trend(1, "A", 1, NOW)[0][1] == 0
+    history.close()
+
+
+def test_compaction_with_marker_is_finished(tmp_path):
+    path = str(tmp_path / "history")
+    history = LaunchHistory(path)
+    history.record(1, "A", NOW)
+    history.record(2, "A", NOW)
+    history.prepare_write()()
+    history.close()
+
+    # Every compacted column made it to disk, keeping the second row.
+    for column in ("ts", "member", "game", "kind", "seconds"):
+        column_path = os.path.join(path, column + ".col")
+        with open(column_path, "rb") as column_file:
+            data = column_file.read()
+        with open(column_path + ".compact", "wb") as compacted:
+            compacted.write(data[len(data) // 2:])
+    open(os.path.join(path, "compact.done"), "wb").close()
+
+    history = LaunchHistory(path)
+    assert len(history) == 1
+    assert not os.path.exists(os.path.join(path, "compact.done"))
+    assert history.daily_trend(1, "A", 1, NOW)[0][1] == 0
+    assert history.daily_trend(2, "A", 1, NOW)[0][1] == 1
+    history.close()
+
+
+def open_guild(directory) -> GuildState:
+    state = GuildState(10, JsonStorage(str(directory / "stats.json"), generations=0),
+                       str(directory / "stats.journal"),
+                       str(directory / "history"), str(directory / "settings.json"))
+    state.load(apply_update=lambda *args, **kwargs: None)
+    return state
+
+
+def test_crash_before_the_snapshot_keeps_history_once(tmp_path):
+    state = open_guild(tmp_path)
+    state.add_user(1)
+    state.record_event("register", 1)
+    started = datetime(2023, 11, 14, 12)
+    game = discord.Game(name="A")
+    for kind, timestamp in (("start", started),
+                            ("end", started + timedelta(hours=1))):
+        state.record_event(kind, 1, game, timestamp)
+        state.update_session(kind, 1, "A", timestamp)
+
+    # The history is written, then the bot dies before the snapshot.
+    flush = state.flush_dirty({1: None})
+    history_writer = flush.args[1]
+    history_writer()
+    state.history.close()
+    state.journal.close()
+    state.storage.close()
+
+    state = open_guild(tmp_path)
+    assert 1 in state.registered_users
+    assert len(state.history) == 2
+    trend = state.history.daily_trend(1, "A", 1, int(started.replace(tzinfo=timezone.utc).timestamp()) + 7200)
+    assert trend[0][1:] == [1, 3600]
+    state.close()
@@ -0,0 +1,108 @@
+""" Compares the launch rank index against a scan of the game dictionary,
+    the way the most and least launched games used to be found.
+"""
+import random
+from datetime import datetime, timedelta
+
+import discord
+
+from StatBotPackage.GuildMemberStats import MemberStatsPack
+from StatBotPackage.LaunchRanking import LaunchRankIndex
+
+class Game():
+    __slots__ = ("name", "times_launched")
+
+    def __init__(self, name: str, times_launched: int) -> None:
+        self.name = name
+        self.times_launched = times_launched
+
+
+def scan_most(game_dict: dict):
+    # The game found last wins a tie.
+    most = None
+    for game in game_dict.values():
+        if most is None or game.times_launched >= most.times_launched:
+            most = game
+    return most
+
+
+def scan_least(game_dict: dict):
+    least = None
+    for game in game_dict.values():
+        if least is None or game.times_launched <= least.times_launched:
+            least = game
+    return least
+
+
+def scan_top(game_dict: dict, k: int) -> list:
+    games = list(game_dict.values())
+    order = {game.name: position for position, game in enumerate(games)}
+    return sorted(games, key=lambda game: (-game.times_launched,
+                                           -order[game.name]))[:k]
+
+
+def scan_bottom(game_dict: dict, k: int) -> list:
+    games = list(game_dict.values())
+    order = {game.name: position for position, game in enumerate(games)}
+    return sorted(games, key=lambda game: (game.times_launched,
+                                           -order[game.name]))[:k]
+
+
+def names(games: list) -> list:
+    return [game.name for game in games]
+
+
+def check(index: LaunchRankIndex, game_dict: dict, rng: random.Random):
+    assert index.most_launched() is scan_most(game_dict)
+    assert index.least_launched() is scan_least(game_dict)
+    k = rng.randrange(0, len(game_dict) + 3)
+    assert names(index.top(k)) == names(scan_top(game_dict, k))
+    assert names(index.bottom(k)) == names(scan_bottom(game_dict, k))
+
+
+def test_index_matches_scan():
+    for seed in range(300):
+        rng = random.Random(seed)
+        game_dict = {}
+        for position in range(rng.randrange(0, 6)):
+            game = Game(f"Game {position}", rng.randrange(1, 4))
+            game_dict[game.name] = game
+        index = LaunchRankIndex(game_dict)
+        check(index, game_dict, rng)
+
+        for _ in range(rng.randrange(1, 200)):
+            if not game_dict or rng.random() < 0.2:
+                game = Game(f"Game {len(game_dict)}", rng.randrange(1, 4))
+                game_dict[game.name] = game
+                index.add(game)
+            else:
+                game = rng.choice(list(game_dict.values()))
+                previous = game.times_launched
+                # Few distinct counts, so ties are common.
+                game.times_launched += rng.choice((1, 1, 2))
+                index.update(game, previous)
+            check(index, game_dict, rng)
+
+
+def test_stats_pack_matches_scan():
+    for seed in range(50):
+        rng = random.Random(seed)
+        user = MemberStatsPack()
+        date = datetime(2024, 1, 1)
+        for _ in range(rng.randrange(1, 150)):
+            date += timedelta(hours=rng.randrange(1, 30))
+            name = f"Game {rng.randrange(0, 8)}"
+            activity = discord.Game(name=name)
+            if user.previously_played(name):
+                user.update_game_stats(activity, start_date=date)
+            else:
+                user.init_game_stats(activity, date)
+                user.update_most_launched()
+                user.update_least_launched(givenMin=1)
+
+            assert user.most_launched_game is scan_most(user.game_dict)
+            assert user.least_launched_game is scan_least(user.game_dict)
+            k = rng.randrange(1, 10)
+            assert names(user.top_launched(k)) == names(scan_top(user.game_dict, k))
+            assert (names(user.bottom_launched(k))
+                    == names(scan_bottom(user.game_dict, k)))
@@ -0,0 +1,95 @@
+""" The JSON to SQLite migration happens once and keeps the changes in
+    the JSON journal that are newer than the JSON snapshot.
+"""
+
+# Standard Library Imports
+import os
+
+# Local Module imports
+from StatBotPackage.GuildMemberStats import MemberStatsPack
+from StatBotPackage.GuildState import GuildState
+from StatBotPackage.Storage.EventJournal import EventJournal
+from StatBotPackage.Storage.JsonStorage import JsonStorage
+from StatBotPackage.Storage.SqliteStorage import (JSON_MIGRATED_KEY,
+                                                  SqliteStorage,
+                                                  migrate_json_to_sqlite)
+
+def write_json_shard(directory) -> str:
+    """ A JSON shard whose snapshot holds member 1 as of seq 1, and whose
+        journal registered member 2 after it.
+    """
+    json_path = str(directory / "stats.json")
+    journal = EventJournal(json_path + ".journal")
+    journal.append("register", 1)
+    journal.append("register", 2)
+    journal.close()
+    JsonStorage(json_path, generations=0).prepare_write(
+        {1: MemberStatsPack()}, {1: None}, journal_seq=1)()
+    return json_path
+
+
+def open_sqlite(directory, json_path: str) -> GuildState:
+    sqlite_path = str(directory / "stats.db")
+    storage = SqliteStorage(sqlite_path)
+    if not storage.json_migrated():
+        migrate_json_to_sqlite(json_path, storage, generations=0,
+                               json_journal=json_path + ".journal",
+                               sqlite_journal=sqlite_path + ".journal")
+    state = GuildState(10, storage, sqlite_path + ".journal",
+                       sqlite_path + ".history", str(directory / "settings.json"))
+    state.load(apply_update=None)
+    return state
+
+
+def test_journal_tail_is_replayed_after_migration(tmp_path):
+    json_path = write_json_shard(tmp_path)
+    state = open_sqlite(tmp_path, json_path)
+    assert sorted(state.registered_users) == [1, 2]
+    assert not os.path.exists(json_path + ".journal")
+    state.close()
+
+
+def test_migration_is_not_repeated(tmp_path):
+    json_path = write_json_shard(tmp_path)
+    state = open_sqlite(tmp_path, json_path)
+    state.remove_user(1)
+    state.remove_user(2)
+    state.mark_dirty(1)
+    state.mark_dirty(2)
+    state.close()
+
+    state = open_sqlite(tmp_path, json_path)
+    assert state.storage.is_empty()
+    assert len(state.registered_users) == 0
+    state.close()
+
+
+def test_interrupted_migration_is_redone(tmp_path):
+    json_path = write_json_shard(tmp_path)
+    storage = SqliteStorage(str(tmp_path / "stats.db"))
+    storage.set_meta(JSON_MIGRATED_KEY, 0)
+    storage.prepare_write({1: MemberStatsPack()}, {1: None})()
+    assert not storage.json_migrated()
+    storage.close()
+
+    state = open_sqlite(tmp_path, json_path)
+    assert sorted(state.registered_users) == [1, 2]
+    assert state.storage.json_migrated()
+    state.close()
+
+
+def test_migration_refused_when_both_journals_have_entries(tmp_path):
+    json_path = write_json_shard(tmp_path)
+    sqlite_path = str(tmp_path / "stats.db")
+    journal = EventJournal(sqlite_path + ".journal")
+    journal.append("register", 3)
+    journal.close()
+
+    storage = SqliteStorage(sqlite_path)
+    assert migrate_json_to_sqlite(json_path, storage, generations=0,
+                                  json_journal=json_path + ".journal",
+                                  sqlite_journal=sqlite_path + ".journal") == 0
+    assert storage.is_empty()
+    assert not storage.json_migrated()
+    assert os.path.exists(json_path + ".journal")
+    storage.close()
@@ -0,0 +1,51 @@
+from StatBotPackage.ReactionPaginator import TimerWheel
+
+class FakeClock():
+    def __init__(self, now: float = 0.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def run_until_expired(wheel: TimerWheel, clock: FakeClock, key,
+                      step: float = 1.0, limit: float = 200.0) -> float:
+    while clock.now < limit:
+        clock.now += step
+        if key in wheel.advance():
+            return clock.now
+    raise AssertionError(f"{key} never expired")
+
+
+def test_fractional_deadline_expires_on_the_next_advance():
+    # A deadline later in the tick advanced to must not wait a full turn.
+    clock = FakeClock(0.2)
+    wheel = TimerWheel(tick=1.0, slots=64, clock=clock)
+    wheel.schedule("session", 10.5)
+    expired_at = run_until_expired(wheel, clock, "session")
+    assert 10.5 <= expired_at <= 11.2 + 1e-9
+    assert len(wheel) == 0
+
+
+def test_fractional_deadlines_at_every_offset():
+    for offset in range(10):
+        for fraction in (0.05, 0.3, 0.5, 0.95):
+            clock = FakeClock(offset / 10)
+            wheel = TimerWheel(tick=1.0, slots=8, clock=clock)
+            deadline = 5 + fraction
+            wheel.schedule("key", deadline)
+            expired_at = run_until_expired(wheel, clock, "key")
+            assert deadline <= expired_at < deadline + 1.0
+
+
+def test_moved_deadline_and_cancel():
+    clock = FakeClock(0.0)
+    wheel = TimerWheel(tick=1.0, slots=4, clock=clock)
+    wheel.schedule("a", 2.5)
+    wheel.schedule("b", 3.0)
+    # Later than one turn of the wheel.
+    wheel.schedule("a", 9.5)
+    wheel.cancel("b")
+    expired_at = run_until_expired(wheel, clock, "a", step=0.5)
+    assert 9.5 <= expired_at < 10.5
+    assert "b" not in wheel
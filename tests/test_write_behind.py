@@ -0,0 +1,75 @@
+""" The final flush of WriteBehindRecorder.stop must come after a write
+    the cancelled background flush left running.
+"""
+
+# Standard Library Imports
+import asyncio
+import threading
+
+# Local Module imports
+from StatBotPackage.Storage.WriteBehind import WriteBehindRecorder
+
+class Store():
+    """ Records the members of each write, the first one held back until
+        released.
+    """
+
+    def __init__(self, fail_first: bool = False) -> None:
+        self.writes = []
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.fail_first = fail_first
+
+    def snapshot(self, dirty: dict):
+        members = sorted(dirty)
+
+        def writer() -> int:
+            if not self.writes and not self.started.is_set():
+                self.started.set()
+                self.release.wait(5)
+                if self.fail_first:
+                    self.fail_first = False
+                    raise OSError("disk full")
+            self.writes.append(members)
+            return len(members)
+        return writer
+
+
+def stop_during_write(store: Store) -> WriteBehindRecorder:
+    recorder = WriteBehindRecorder(store.snapshot, interval=3600)
+
+    async def run():
+        recorder.start(asyncio.get_event_loop())
+        recorder.mark_dirty(1)
+        flush = asyncio.ensure_future(recorder.flush_async())
+        while not store.started.is_set():
+            await asyncio.sleep(0.001)
+        recorder.mark_dirty(2)
+
+        # The writer finishes while stop() is waiting on the loop thread.
+        threading.Timer(0.05, store.release.set).start()
+        recorder.stop()
+        flush.cancel()
+        await asyncio.gather(flush, return_exceptions=True)
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(run())
+    finally:
+        loop.close()
+    return recorder
+
+
+def test_final_flush_waits_for_the_running_writer():
+    store = Store()
+    recorder = stop_during_write(store)
+    assert store.writes == [[1], [2]]
+    assert recorder.dirty_count == 0
+
+
+def test_final_flush_retries_a_failed_running_writer():
+    store = Store(fail_first=True)
+    recorder = stop_during_write(store)
+    assert store.writes == [[1, 2]]
+    assert recorder.metrics.failed_flushes == 1
+    assert recorder.dirty_count == 0